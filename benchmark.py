@@ -0,0 +1,284 @@
+# benchmark.py
+"""
+Offline benchmark suite. Runs the task engine and the GUI (offscreen) against fake_yt_dlp.py
+instead of the real yt-dlp, so results do not depend on any website.
+
+  python3 benchmark.py                                 # 1k/10k/100k, results -> benchmark_results.json
+  python3 benchmark.py --sizes 1000,10000 --baseline old.json   # compare, exit code 1 on regression
+"""
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_OUTPUT_FILE = "benchmark_results.json"
+DEFAULT_REGRESSION_THRESHOLD = 0.25 # 比基线差 25% 以上视为退化
+
+EXIT_OK = 0
+EXIT_REGRESSION = 1
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="benchmark.py", description="使用 yt-dlp 桩程序的离线性能测试")
+    parser.add_argument("--sizes", default=",".join(str(n) for n in DEFAULT_SIZES),
+                        help=f"任务数量，逗号分隔 (默认: {','.join(str(n) for n in DEFAULT_SIZES)})")
+    parser.add_argument("--no-gui", action="store_true", help="跳过需要界面的测试 (解析到表格、界面内存)")
+    parser.add_argument("--progress-tasks", type=int, default=4, help="进度吞吐测试的同时下载数 (默认: 4)")
+    parser.add_argument("--progress-lines", type=int, default=5000, help="进度吞吐测试中每个任务的进度行数 (默认: 5000)")
+    parser.add_argument("--timeout", type=float, default=1800, help="单项测试的超时秒数 (默认: 1800)")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT_FILE, help=f"结果文件 (默认: {DEFAULT_OUTPUT_FILE})")
+    parser.add_argument("--baseline", metavar="PATH", help="与之前的结果文件比较")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help=f"判定为退化的相对变化 (默认: {DEFAULT_REGRESSION_THRESHOLD})")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出应用日志")
+    return parser.parse_args(argv)
+
+
+def prepare_environment(work_dir):
+    """
+    Points the app at an isolated home directory and at the yt-dlp stub. Must run before
+    the app data directory is first resolved (constants.get_app_data_dir() caches it).
+    """
+    home_dir = os.path.join(work_dir, "home")
+    os.makedirs(home_dir, exist_ok=True)
+    os.environ["HOME"] = os.environ["USERPROFILE"] = home_dir
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    stub_path = os.path.join(REPO_DIR, "fake_yt_dlp.py")
+    if sys.platform == "win32":
+        launcher_path = os.path.join(work_dir, "yt-dlp.cmd")
+        with open(launcher_path, "w") as f:
+            f.write(f'@"{sys.executable}" "{stub_path}" %*\n')
+    else:
+        launcher_path = os.path.join(work_dir, "yt-dlp")
+        with open(launcher_path, "w") as f:
+            f.write(f"#!{sys.executable}\nimport runpy, sys\nsys.argv[0] = {stub_path!r}\nrunpy.run_path({stub_path!r}, run_name='__main__')\n")
+        os.chmod(launcher_path, 0o755)
+    os.environ["YTDOW_YT_DLP_PATH"] = launcher_path
+    return home_dir
+
+
+def _rss_bytes():
+    """Resident set size of this process, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _run_until(predicate, timeout_seconds, poll_ms=5):
+    """Runs the Qt event loop until predicate() is true. Raises TimeoutError on timeout."""
+    from PyQt5.QtCore import QEventLoop, QTimer
+    deadline = time.monotonic() + timeout_seconds
+    loop = QEventLoop()
+    timer = QTimer()
+    timer.setInterval(poll_ms)
+    timer.timeout.connect(lambda: (predicate() or time.monotonic() > deadline) and loop.quit())
+    if not predicate():
+        timer.start()
+        loop.exec_()
+        timer.stop()
+    if not predicate():
+        raise TimeoutError(f"not finished within {timeout_seconds}s")
+
+
+def _new_headless_engine(work_dir, name):
+    from task_engine import TaskEngine, build_download_params
+    engine = TaskEngine(history_file_path=os.path.join(work_dir, f"{name}_history.json"))
+    download_params = build_download_params(os.path.join(work_dir, "downloads"))
+    engine.default_params_provider = lambda: download_params
+    return engine
+
+
+def _new_window():
+    from constants import get_app_data_dir, TASKS_HISTORY_FILE_NAME
+    history_path = os.path.join(get_app_data_dir(), TASKS_HISTORY_FILE_NAME)
+    if os.path.exists(history_path): os.remove(history_path) # 每项测试从空列表开始
+    from gui_manager import DownloadManager
+    return DownloadManager()
+
+
+def _close_window(app, window):
+    from PyQt5.QtCore import QEvent
+    window.engine.shutdown()
+    window.deleteLater()
+    app.sendPostedEvents(None, QEvent.DeferredDelete) # 立即释放，避免影响后续测试
+    gc.collect()
+
+
+def bench_fetch_to_table(app, n, timeout_seconds):
+    """Time from submitting a playlist URL until all n entries are rows in the task table."""
+    window = _new_window()
+    try:
+        start = time.perf_counter()
+        window.engine.submit_urls([f"https://bench.invalid/playlist?n={n}"])
+        _run_until(lambda: window.table.rowCount() >= n, timeout_seconds)
+        seconds = time.perf_counter() - start
+    finally:
+        _close_window(app, window)
+    return {"seconds": seconds, "rows_per_second": n / seconds}
+
+
+def bench_memory_and_save(work_dir, n):
+    """Python heap per task in the engine, and the cost of one full history save."""
+    engine = _new_headless_engine(work_dir, f"save_{n}")
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(n):
+        engine.add_task(f"https://bench.invalid/video/{i}", f"Benchmark video {i}", save=False)
+    heap_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    save_times = []
+    for _ in range(3):
+        start = time.perf_counter()
+        engine.save_tasks_to_file()
+        save_times.append(time.perf_counter() - start)
+    result = {
+        "heap_bytes_per_task": heap_bytes / n,
+        "save_seconds": min(save_times),
+        "history_file_bytes": os.path.getsize(engine.history_file_path),
+    }
+    engine.shutdown()
+    return result
+
+
+def bench_gui_memory(app, n, timeout_seconds):
+    """Resident memory growth per task with the GUI table populated (includes Qt widgets)."""
+    window = _new_window()
+    try:
+        app.processEvents()
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        window.engine.add_tasks_without_resolving([f"https://bench.invalid/video/{i}" for i in range(n)])
+        _run_until(lambda: window.table.rowCount() >= n, timeout_seconds)
+        result = {"add_seconds": time.perf_counter() - start}
+        rss_after = _rss_bytes()
+        if rss_before is not None and rss_after is not None:
+            result["rss_bytes_per_task"] = (rss_after - rss_before) / n
+    finally:
+        _close_window(app, window)
+    return result
+
+
+def bench_progress_throughput(app, task_count, lines_per_task, timeout_seconds):
+    """Progress lines per second handled end to end (worker parsing -> engine -> table) with unthrottled output."""
+    from task_state import STATE_DONE
+    window = _new_window()
+    updates = [0]
+    window.engine.task_updated.connect(lambda task_id: updates.__setitem__(0, updates[0] + 1))
+    try:
+        window.engine.set_max_concurrent(task_count)
+        urls = [f"https://bench.invalid/video/p{i}?lines={lines_per_task}&rate=0" for i in range(task_count)]
+        task_ids = [tid for _, tid in window.engine.add_tasks_without_resolving(urls) if tid]
+        start = time.perf_counter()
+        window.engine.start_all_tasks()
+        _run_until(lambda: all(window.engine.state_of(tid) == STATE_DONE for tid in task_ids), timeout_seconds)
+        seconds = time.perf_counter() - start
+    finally:
+        _close_window(app, window)
+    progress_lines = task_count * (lines_per_task + 1)
+    return {"seconds": seconds, "progress_lines_per_second": progress_lines / seconds,
+            "ui_updates_per_second": updates[0] / seconds}
+
+
+def _flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare_with_baseline(results, baseline, threshold):
+    """Returns a list of (metric, baseline value, current value, relative change) that got worse than threshold."""
+    current, previous = _flatten(results), _flatten(baseline)
+    regressions = []
+    for name, value in sorted(current.items()):
+        old = previous.get(name)
+        if not old: continue
+        change = (value - old) / old
+        higher_is_better = name.endswith("per_second")
+        worse = -change if higher_is_better else change
+        marker = ""
+        if worse > threshold:
+            regressions.append((name, old, value, change))
+            marker = "  <-- 退化"
+        print(f"{name:55s} {old:14.4f} -> {value:14.4f} ({change:+.1%}){marker}")
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    sizes = [int(part) for part in args.sizes.split(",") if part.strip()]
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL, stream=sys.stderr,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    work_dir = tempfile.mkdtemp(prefix="ytdow_bench_")
+    prepare_environment(work_dir)
+
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication(sys.argv[:1])
+
+    results = {"memory_and_save": {}}
+    try:
+        for n in sizes:
+            print(f"memory/save: {n} tasks...", file=sys.stderr)
+            results["memory_and_save"][str(n)] = bench_memory_and_save(work_dir, n)
+        if not args.no_gui:
+            # 放在大批量测试之前，避免残留对象和 GC 压力影响吞吐
+            print(f"progress throughput: {args.progress_tasks} x {args.progress_lines} lines...", file=sys.stderr)
+            results["progress"] = bench_progress_throughput(app, args.progress_tasks, args.progress_lines, args.timeout)
+            results["fetch_to_table"] = {}
+            results["gui_memory"] = {}
+            for n in sizes:
+                print(f"fetch-to-table: {n} entries...", file=sys.stderr)
+                results["fetch_to_table"][str(n)] = bench_fetch_to_table(app, n, args.timeout)
+                print(f"GUI memory: {n} tasks...", file=sys.stderr)
+                results["gui_memory"][str(n)] = bench_gui_memory(app, n, args.timeout)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    document = {
+        "meta": {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "git_revision": _git_revision(),
+                 "python": platform.python_version(), "platform": platform.platform(), "sizes": sizes},
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2, ensure_ascii=False)
+    print(json.dumps(results, indent=2))
+    print(f"结果已写入 {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+        regressions = compare_with_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} 项指标比基线差 {args.threshold:.0%} 以上", file=sys.stderr)
+            return EXIT_REGRESSION
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,488 @@
+# cli_app.py
+import sys
+import os
+import re
+import time
+import signal
+import sqlite3
+import argparse
+import logging
+import itertools
+import multiprocessing
+import faulthandler
+from PyQt5.QtCore import QCoreApplication, QObject, QTimer # 无界面模式只使用 QtCore
+
+from constants import get_app_data_dir, HEADLESS_LOG_FILE_NAME, HEADLESS_TASKS_HISTORY_FILE_NAME
+from logging_setup import setup_logging, add_logging_arguments, logging_options_from_args
+from control_api import ControlApiServer, add_control_api_arguments
+from metrics import add_metrics_arguments, start_metrics_from_args
+from tracing import TaskTracer, add_tracing_arguments
+from scheduler import TaskScheduler, ScheduleError, add_scheduler_arguments, load_schedule_from_args
+from postprocess import add_postprocess_arguments
+from transcode import add_transcode_arguments, configure_transcode_from_args
+from stall_watchdog import add_stall_arguments, start_stall_watchdog_from_args
+from retry_policy import add_retry_arguments, start_retry_scheduler_from_args
+from host_pacing import add_host_pacing_arguments, start_host_pacer_from_args
+from file_index import LibraryDedupeJob, add_dedupe_arguments, open_file_index_from_args
+from subscriptions import SubscriptionStore, SubscriptionMonitor, add_subscription_arguments, DEFAULT_INTERVAL_SECONDS
+from url_import import UrlImporter, iter_url_sources, READ_CHUNK_LINES
+from shared_queue import SharedQueue, SharedQueueNode, default_node_id, DEFAULT_LEASE_SECONDS, DEFAULT_HEARTBEAT_SECONDS
+from task_engine import (
+    TaskEngine, build_download_params, CONV_MODE_ALIASES, QUALITY_ALIASES, VIDEO_QUALITY_PRESETS, DEFAULT_OUTPUT_DIR
+)
+from task_state import ALL_STATES, STARTABLE_STATES, STATE_DISPLAY_NAMES, STATE_FAILED
+
+FAILED_TASK_OUTPUT_LINES = 8 # 结束时为每个失败任务打印的最近输出行数
+
+EXIT_OK = 0
+EXIT_FAILURES = 1   # 至少一个任务或链接解析失败
+EXIT_BAD_ARGS = 2
+EXIT_INTERRUPTED = 130
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="cli_app.py",
+        description="yt-dlp 下载助手 - 无界面模式。解析链接、下载并在队列清空后退出 (--daemon 时持续运行)。"
+    )
+    parser.add_argument("urls", nargs="*", help="视频或播放列表链接")
+    parser.add_argument("-i", "--url-file", action="append", default=[],
+                        help="从文件读取链接，每行一个 ('-' 表示标准输入，支持 gzip 压缩文件)，可重复指定。边读取边处理，适合很大的列表")
+    parser.add_argument("--no-resolve", action="store_true",
+                        help="不运行 yt-dlp -J 解析，每个链接直接作为一个任务 (不展开播放列表，标题为链接)")
+    parser.add_argument("-o", "--output-dir", default=DEFAULT_OUTPUT_DIR, help=f"保存目录 (默认: {DEFAULT_OUTPUT_DIR})")
+    parser.add_argument("-j", "--concurrent", type=int, default=1, help="同时下载数 (默认: 1)")
+    parser.add_argument("--cookies-browser", default="无", help="从浏览器读取 cookies (chrome/firefox/...，默认不使用)")
+    parser.add_argument("--cookies-file", default="", help="cookies.txt 文件路径")
+    parser.add_argument("--conv-mode", default="none", choices=sorted(CONV_MODE_ALIASES), help="格式转换模式 (默认: none)")
+    parser.add_argument("--conv-fmt", default="", help="转换目标格式，如 mp3/m4a/mp4/mkv；逗号分隔多个格式时只下载一次并转换为每一种，如 mp3,mp4@720")
+    parser.add_argument("--keep-source", action="store_true", help="转换后保留下载的源文件")
+    parser.add_argument("-q", "--quality", default="best",
+                        help=f"视频质量: {', '.join(QUALITY_ALIASES)} 或界面中的预设名称 (默认: best)")
+    parser.add_argument("--audio-quality", default="0", help="音频质量 (0 最佳 - 9 最差，或如 192K)")
+    parser.add_argument("--limit-rate", default="", help="限速，如 1M 或 500K")
+    parser.add_argument("--post-script", default="", help="下载完成后执行的 Python 脚本")
+    parser.add_argument("--extra-args", default="", help="下载时追加的 yt-dlp 参数")
+    parser.add_argument("--off-peak-only", action="store_true", help="新任务只在时段规则中标记为空闲 (off_peak) 的时段下载")
+    parser.add_argument("--fetch-extra-args", default="", help="解析链接时追加的 yt-dlp 参数")
+    parser.add_argument("--history", default=None,
+                        help=f"任务历史文件 (默认: 数据目录下的 {HEADLESS_TASKS_HISTORY_FILE_NAME}，节点模式下每个节点单独一个文件)")
+    parser.add_argument("--suspend-timeout", type=float, default=0, metavar="SECONDS",
+                        help="暂停 (控制接口) 时挂起 yt-dlp 进程而不是结束它，继续时立即恢复；挂起超过此秒数后结束进程 (默认 0: 总是结束)")
+    parser.add_argument("--resume-pending", action="store_true", help="同时重新开始历史中等待/暂停/失败的任务")
+    parser.add_argument("--daemon", action="store_true", help="队列清空后不退出，直到收到 SIGINT/SIGTERM")
+    parser.add_argument("--status-interval", type=float, default=10.0, help="输出状态汇总的间隔秒数 (0 关闭)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="在控制台输出调试日志")
+    add_control_api_arguments(parser) # 通常与 --daemon 一起使用
+    add_metrics_arguments(parser)
+    add_tracing_arguments(parser)
+    add_scheduler_arguments(parser)
+    add_postprocess_arguments(parser)
+    add_transcode_arguments(parser)
+    add_stall_arguments(parser)
+    add_retry_arguments(parser)
+    add_host_pacing_arguments(parser)
+    add_dedupe_arguments(parser)
+    subscription_group = add_subscription_arguments(parser)
+    subscription_group.add_argument("--subscribe", action="append", default=[], metavar="URL",
+                                    help="添加频道/播放列表订阅 (可重复)；首次检查只记录已有条目，之后的新条目自动下载")
+    subscription_group.add_argument("--unsubscribe", action="append", default=[], metavar="URL", help="删除订阅 (可重复)")
+    subscription_group.add_argument("--list-subscriptions", action="store_true", help="列出订阅及其检查状态后退出")
+    subscription_group.add_argument("--subscription-interval", type=float, default=DEFAULT_INTERVAL_SECONDS / 60,
+                                    help=f"新订阅的检查间隔分钟数 (默认: {DEFAULT_INTERVAL_SECONDS // 60})")
+    subscription_group.add_argument("--monitor-subscriptions", action="store_true",
+                                    help="持续检查订阅并下载新条目，直到收到 SIGINT/SIGTERM")
+    add_logging_arguments(parser)
+
+    shared_group = parser.add_argument_group("多节点共享队列")
+    shared_group.add_argument("--shared-queue", metavar="DB",
+                              help="共享任务队列 (SQLite 文件，可位于网络共享目录)。链接提交到共享队列，本进程作为节点领取任务")
+    shared_group.add_argument("--submit-only", action="store_true", help="只把链接提交到共享队列后退出，不下载")
+    shared_group.add_argument("--node-id", default=None, help="节点名称 (默认: 主机名-进程号)")
+    shared_group.add_argument("--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS,
+                              help=f"任务租约时长，节点失联超过该时间后任务被重新分配 (默认: {DEFAULT_LEASE_SECONDS})")
+    shared_group.add_argument("--heartbeat-seconds", type=float, default=DEFAULT_HEARTBEAT_SECONDS,
+                              help=f"续约/领取新任务的间隔 (默认: {DEFAULT_HEARTBEAT_SECONDS})")
+    return parser.parse_args(argv)
+
+
+def iter_input_urls(args):
+    """Command line URLs, then the --url-file lists, read lazily."""
+    return itertools.chain((url.strip() for url in args.urls if url.strip()), iter_url_sources(args.url_file))
+
+
+def submit_in_chunks(shared_queue, urls, chunk_size=READ_CHUNK_LINES):
+    """Submits to the shared queue one transaction per chunk, so large lists are never held in memory."""
+    added_count = 0
+    for chunk in iter(lambda: list(itertools.islice(urls, chunk_size)), []):
+        added_count += shared_queue.submit(chunk)
+    return added_count
+
+
+class HeadlessRunner(QObject):
+    """Drives a TaskEngine from the command line and quits the event loop when the work is done."""
+
+    def __init__(self, app, engine, args, urls, has_urls):
+        super().__init__()
+        self.log_prefix = f"[{self.__class__.__name__}] "
+        self.app = app
+        self.engine = engine
+        self.args = args
+        self.urls = urls # 惰性读取的链接迭代器
+        self.has_urls = has_urls
+        self.run_task_ids = set() # 本次运行开始的任务
+        self.fetch_error_count = 0
+        self.importer = None
+        self._existing_ids_to_start = []
+        self.stop_requested_by_signal = None
+        self.control_api = None
+        self.metrics_collector = None
+        self.metrics_server = None
+        self.tracer = None
+        self.scheduler = None
+        self.stall_watchdog = None
+        self.retry_scheduler = None
+        self.host_pacer = None
+        self.library_job = None
+        self.subscription_monitor = None
+        self.shared_node = None
+
+        self.engine.notice.connect(lambda title, text: logging.warning(f"{self.log_prefix}{title}: {text}"))
+        self.engine.fetch_error.connect(self.on_fetch_error)
+        self.engine.fetch_empty.connect(lambda url: logging.warning(f"{self.log_prefix}链接 '{url}' 未返回任何视频条目。"))
+        self.engine.fetch_queue_drained.connect(self.on_fetch_queue_drained)
+
+        # Python 信号处理函数只在解释器执行字节码时运行，这个定时器同时负责让出执行机会和检查是否结束
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(500)
+        self.poll_timer.timeout.connect(self.poll)
+
+        self.status_timer = QTimer(self)
+        if args.status_interval > 0:
+            self.status_timer.setInterval(int(args.status_interval * 1000))
+            self.status_timer.timeout.connect(self.log_status_summary)
+
+    def start(self):
+        self.engine.load_tasks_from_file()
+        # 在加载历史之后再连接，只统计本次运行新增的任务
+        self.engine.task_added.connect(self.run_task_ids.add)
+
+        if self.shared_node:
+            # 节点模式下链接进入共享队列，由各节点按租约领取 (不经过 yt-dlp -J 解析)
+            if self.has_urls:
+                submit_in_chunks(self.shared_node.queue, self.urls)
+            self.engine.start()
+            self.shared_node.start()
+            self.poll_timer.start()
+            if self.args.status_interval > 0:
+                self.status_timer.start()
+            return
+
+        task_ids_to_start = self.engine.task_states.ids(*STARTABLE_STATES) if self.args.resume_pending else []
+        if task_ids_to_start:
+            self.run_task_ids.update(task_ids_to_start)
+            self.engine.resume_tasks(task_ids_to_start)
+
+        if self.has_urls:
+            # 边读取边提交，解析出的每个条目立即入队；解析队列过长时暂停读取
+            self.importer = UrlImporter(self.engine, self.urls, resolve=not self.args.no_resolve, fetch_options={
+                "cookies_browser": self.args.cookies_browser,
+                "cookies_file_path": self.args.cookies_file,
+                "extra_args_for_fetching": self.args.fetch_extra_args,
+            }, autostart=True, on_duplicate=self.on_existing_url, parent=self)
+            self.importer.progress.connect(self.start_existing_tasks)
+            self.importer.finished.connect(self.on_import_finished)
+            self.importer.error.connect(self.on_import_error)
+            self.importer.start()
+
+        self.engine.start()
+        self.poll_timer.start()
+        if self.args.status_interval > 0:
+            self.status_timer.start()
+
+    def on_existing_url(self, url):
+        existing_task_id = self.engine.task_id_for_url(url)
+        if existing_task_id is None: return # 与列表中前面的链接重复
+        if self.engine.state_of(existing_task_id) in STARTABLE_STATES:
+            logging.info(f"{self.log_prefix}链接 '{url}' 已在历史中 (任务 {existing_task_id})，重新开始。")
+            self._existing_ids_to_start.append(existing_task_id)
+        else:
+            logging.debug(f"{self.log_prefix}链接 '{url}' 已在历史中 (任务 {existing_task_id}, "
+                          f"{STATE_DISPLAY_NAMES.get(self.engine.state_of(existing_task_id))})，跳过。")
+
+    def start_existing_tasks(self, *_):
+        if not self._existing_ids_to_start: return
+        task_ids, self._existing_ids_to_start = self._existing_ids_to_start, []
+        self.run_task_ids.update(task_ids)
+        self.engine.resume_tasks(task_ids)
+
+    def on_import_finished(self, read_count, submitted_count, duplicate_count):
+        self.start_existing_tasks()
+        logging.info(f"{self.log_prefix}已读取 {read_count} 个链接: 提交 {submitted_count} 个，"
+                     f"{duplicate_count} 个已在历史或列表中重复。")
+
+    def on_import_error(self, msg):
+        self.fetch_error_count += 1
+        logging.error(f"{self.log_prefix}无法读取链接文件: {msg}")
+
+    def on_fetch_error(self, url, msg):
+        self.fetch_error_count += 1
+        logging.error(f"{self.log_prefix}无法解析链接 '{url}': {msg}")
+
+    def on_fetch_queue_drained(self, processed_count):
+        logging.info(f"{self.log_prefix}{processed_count} 个链接解析完成，共 {len(self.run_task_ids)} 个任务待下载。")
+
+    def request_stop(self, signum, frame):
+        if self.stop_requested_by_signal is None:
+            self.stop_requested_by_signal = signum
+        else:
+            logging.warning(f"{self.log_prefix}已在停止中，请稍候...")
+
+    def log_status_summary(self):
+        counts = self.engine.task_states.counts()
+        summary = " | ".join(f"{STATE_DISPLAY_NAMES[state]}: {counts[state]}" for state in ALL_STATES)
+        if self.shared_node:
+            summary += f" || 共享队列: {self.shared_node.queue.counts()}"
+        if self.scheduler and self.scheduler.current_window:
+            summary += f" || 时段: {self.scheduler.current_window.describe()}"
+        if self.host_pacer and self.host_pacer.hosts:
+            summary += f" || 主机限流: {self.host_pacer.describe()}"
+        logging.info(f"{self.log_prefix}{summary}")
+
+    def poll(self):
+        if self.stop_requested_by_signal is not None:
+            logging.info(f"{self.log_prefix}收到信号 {self.stop_requested_by_signal}，正在停止下载并保存任务...")
+            self.finish(EXIT_INTERRUPTED)
+            return
+        if self.args.daemon or self.subscription_monitor or (self.importer and self.importer.is_running()) or not self.engine.is_idle():
+            return
+        if self.shared_node and not self.shared_node.is_drained():
+            return # 其他节点仍有任务在运行 (可能失联后被重新分配)
+        if self.retry_scheduler and self.retry_scheduler.has_pending(self.run_task_ids):
+            return # 等待自动重试
+        if self.library_job and self.library_job.isRunning():
+            return
+
+        failed_ids = [tid for tid in self.run_task_ids if self.engine.state_of(tid) == STATE_FAILED]
+        for task_id in failed_ids:
+            task_data = self.engine.tasks.get(task_id, {})
+            logging.error(f"{self.log_prefix}任务 {task_id} 失败: {task_data.get('title', '')} ({task_data.get('status', '')})")
+            for output_line in self.engine.task_output(task_id, FAILED_TASK_OUTPUT_LINES):
+                logging.error(f"{self.log_prefix}    {output_line}")
+        self.log_status_summary()
+        self.finish(EXIT_FAILURES if failed_ids or self.fetch_error_count else EXIT_OK)
+
+    def finish(self, exit_code):
+        self.poll_timer.stop()
+        self.status_timer.stop()
+        if self.importer:
+            self.importer.cancel()
+        if self.scheduler:
+            self.scheduler.stop()
+        if self.stall_watchdog:
+            self.stall_watchdog.stop()
+        if self.retry_scheduler:
+            self.retry_scheduler.stop()
+        if self.host_pacer:
+            self.host_pacer.stop()
+        if self.library_job:
+            self.library_job.stop()
+            self.library_job.wait()
+        if self.subscription_monitor:
+            self.subscription_monitor.stop()
+        if self.control_api:
+            self.control_api.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        self.engine.shutdown()
+        if self.metrics_collector:
+            self.metrics_collector.stop() # 写入最终快照
+        if self.tracer:
+            try:
+                self.tracer.export_chrome_trace(self.args.trace_file)
+            except OSError as e:
+                logging.error(f"{self.log_prefix}无法写入跟踪文件 {self.args.trace_file}: {e}")
+        if self.shared_node:
+            self.shared_node.stop() # 释放仍持有的租约，其他节点可立即接手
+        self.app.exit(exit_code)
+
+
+def manage_subscriptions(args):
+    """--subscribe / --unsubscribe / --list-subscriptions: edits the subscription file."""
+    store = SubscriptionStore(args.subscriptions).load()
+    for url in args.subscribe:
+        store.add(url, interval_seconds=args.subscription_interval * 60)
+        logging.info(f"已订阅: {url}")
+    for url in args.unsubscribe:
+        logging.info(f"{'已删除订阅' if store.remove(url) else '未找到订阅'}: {url}")
+    if args.subscribe or args.unsubscribe:
+        store.save()
+    if args.list_subscriptions:
+        for subscription in store.subscriptions.values():
+            last_checked = time.strftime("%Y-%m-%d %H:%M", time.localtime(subscription.last_checked)) if subscription.last_checked else "从未"
+            print(f"{subscription.url}\t每 {subscription.interval_seconds // 60} 分钟\t上次检查: {last_checked}\t"
+                  f"已添加 {subscription.new_item_count} 个\t{subscription.last_error}")
+
+
+def main(argv=None):
+    faulthandler.enable()
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    setup_logging(HEADLESS_LOG_FILE_NAME, console_level=logging.DEBUG if args.verbose else logging.INFO,
+                  console_stream=sys.stderr, **logging_options_from_args(args))
+
+    quality_preset = QUALITY_ALIASES.get(args.quality, args.quality)
+    if quality_preset not in VIDEO_QUALITY_PRESETS:
+        logging.error(f"未知的视频质量: {args.quality}")
+        return EXIT_BAD_ARGS
+    if args.concurrent < 1:
+        logging.error(f"同时下载数必须大于 0: {args.concurrent}")
+        return EXIT_BAD_ARGS
+
+    output_dir = os.path.abspath(os.path.expanduser(args.output_dir))
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+    except Exception as e:
+        logging.error(f"指定的保存路径无效或无法创建: {output_dir}\n{e}")
+        return EXIT_BAD_ARGS
+
+    if args.subscribe or args.unsubscribe or args.list_subscriptions:
+        manage_subscriptions(args)
+        if not args.monitor_subscriptions:
+            return EXIT_OK
+
+    missing_files = [path for path in args.url_file if path != "-" and not os.path.isfile(path)]
+    if missing_files:
+        logging.error(f"无法读取链接文件: {', '.join(missing_files)}")
+        return EXIT_BAD_ARGS
+    urls = iter_input_urls(args)
+    has_urls = bool(args.urls or args.url_file)
+    if not has_urls and not args.resume_pending and not args.daemon and not args.monitor_subscriptions and args.api_port is None and not args.shared_queue \
+            and not args.dedupe_library:
+        logging.error("没有需要处理的链接 (请提供链接、--url-file、--resume-pending、--daemon、--api-port 或 --dedupe-library)。")
+        return EXIT_BAD_ARGS
+
+    download_params = build_download_params(
+        output_dir,
+        cookies_browser=args.cookies_browser,
+        cookies_file_path=args.cookies_file,
+        conv_mode=args.conv_mode,
+        conv_fmt=args.conv_fmt,
+        quality_preset=quality_preset,
+        audio_quality=args.audio_quality,
+        limit_rate=args.limit_rate,
+        post_script=args.post_script,
+        extra_args=args.extra_args,
+        off_peak_only=args.off_peak_only,
+        keep_source=args.keep_source
+    )
+
+    if args.resume_pending and args.shared_queue:
+        logging.error("--resume-pending 不能与 --shared-queue 同时使用 (节点只运行从共享队列领取的任务，过期的租约会被其他节点重新领取)。")
+        return EXIT_BAD_ARGS
+
+    if args.submit_only:
+        if not args.shared_queue:
+            logging.error("--submit-only 需要同时指定 --shared-queue。")
+            return EXIT_BAD_ARGS
+        shared_queue = SharedQueue(args.shared_queue)
+        try:
+            added_count = submit_in_chunks(shared_queue, urls)
+        except (OSError, EOFError) as e: # EOFError: 不完整的 gzip 文件
+            logging.error(f"无法读取链接文件: {e}")
+            return EXIT_BAD_ARGS
+        finally:
+            shared_queue.close()
+        logging.info(f"已提交 {added_count} 个新链接到共享队列 {args.shared_queue}")
+        return EXIT_OK
+
+    app = QCoreApplication(sys.argv[:1])
+    QCoreApplication.setApplicationName("ytdow")
+
+    node_id = args.node_id or default_node_id()
+    history_file_path = args.history
+    if not history_file_path:
+        history_file_name = HEADLESS_TASKS_HISTORY_FILE_NAME
+        if args.shared_queue: # 同一台机器上的多个节点不能共用一个历史文件
+            history_file_name = f"tasks_history_node_{re.sub(r'[^A-Za-z0-9_.-]', '_', node_id)}.json"
+        history_file_path = os.path.join(get_app_data_dir(), history_file_name)
+
+    engine = TaskEngine(history_file_path=history_file_path)
+    engine.default_params_provider = lambda: download_params
+    engine.max_concurrent = args.concurrent
+    engine.postprocess.set_max_concurrent(args.postprocess_workers)
+    engine.postprocess.timeout_seconds = args.postprocess_timeout
+    try:
+        configure_transcode_from_args(engine.transcode, args)
+    except ValueError as e:
+        logging.error(str(e))
+        return EXIT_BAD_ARGS
+    engine.suspend_timeout_seconds = max(0, args.suspend_timeout)
+    try:
+        engine.file_index = open_file_index_from_args(args)
+    except (sqlite3.Error, OSError) as e:
+        logging.error(f"无法打开已完成文件索引: {e}")
+        return EXIT_BAD_ARGS
+
+    runner = HeadlessRunner(app, engine, args, urls, has_urls)
+    if args.dedupe_library:
+        runner.library_job = LibraryDedupeJob(args.dedupe_library, engine.file_index)
+        runner.library_job.start()
+    if args.shared_queue:
+        runner.shared_node = SharedQueueNode(
+            engine, SharedQueue(args.shared_queue, lease_seconds=args.lease_seconds),
+            node_id=node_id, heartbeat_seconds=args.heartbeat_seconds
+        )
+    if args.api_port is not None:
+        runner.control_api = ControlApiServer(engine, host=args.api_host, port=args.api_port, token=args.api_token)
+        try:
+            runner.control_api.start()
+        except OSError as e:
+            logging.error(f"无法启动控制接口 {args.api_host}:{args.api_port}: {e}")
+            return EXIT_BAD_ARGS
+    try:
+        runner.metrics_collector, runner.metrics_server = start_metrics_from_args(engine, args)
+    except OSError as e:
+        logging.error(f"无法启动指标接口 {args.metrics_host}:{args.metrics_port}: {e}")
+        return EXIT_BAD_ARGS
+    if args.trace_file:
+        runner.tracer = TaskTracer(engine)
+    try:
+        schedule = load_schedule_from_args(args)
+    except (OSError, ScheduleError) as e:
+        logging.error(f"无法加载时段规则: {e}")
+        return EXIT_BAD_ARGS
+    if schedule:
+        runner.scheduler = TaskScheduler(engine, schedule)
+        runner.scheduler.start()
+    try:
+        runner.stall_watchdog = start_stall_watchdog_from_args(engine, args)
+        if args.shared_queue:
+            logging.info("共享队列模式: 失败的任务由共享队列按提交时的最大尝试次数重新分配，不在本节点自动重试。")
+        else:
+            runner.retry_scheduler = start_retry_scheduler_from_args(engine, args)
+        runner.host_pacer = start_host_pacer_from_args(engine, args)
+    except ValueError as e:
+        logging.error(str(e))
+        return EXIT_BAD_ARGS
+    if args.monitor_subscriptions:
+        runner.subscription_monitor = SubscriptionMonitor(
+            engine, SubscriptionStore(args.subscriptions).load(), max_concurrent_probes=args.max_probes, fetch_options={
+                "cookies_browser": args.cookies_browser,
+                "cookies_file_path": args.cookies_file,
+                "extra_args_for_fetching": args.fetch_extra_args,
+            })
+    signal.signal(signal.SIGINT, runner.request_stop)
+    signal.signal(signal.SIGTERM, runner.request_stop)
+
+    logging.info("================ Headless mode starting ================")
+    runner.start()
+    if runner.subscription_monitor:
+        runner.subscription_monitor.start() # 在加载任务历史之后，已有链接不会重复添加
+    exit_code = app.exec_()
+    logging.info(f"================ Headless mode ended (exit code: {exit_code}) ==================")
+    return exit_code
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support() # 插件工作进程 (plugins.py) 在打包后的程序中也能启动
+    sys.exit(main())
@@ -2,14 +2,18 @@
 import os
 import sys
 import stat
-import logging # 虽然这里主要用print，但保留以备将来使用
+import json
+import logging # 导入本模块时日志系统还未配置，所以这里不做任何输出；路径在首次使用时才解析
 import shutil # 用于 shutil.which
+import threading
+import subprocess
 
 # --- 先定义 get_yt_dlp_path 函数 ---
 def get_yt_dlp_path(executable_name='yt-dlp'): # 允许传入不同的可执行文件名
     """
     Determines the path to the specified executable (yt-dlp, ffmpeg, ffprobe).
     Tries to find it in bundled locations first, then falls back to system PATH.
+    Uncached; use get_executable_path() instead.
     """
     # Windows上通常有.exe后缀
     exe_with_suffix = executable_name
@@ -39,39 +43,40 @@ def get_yt_dlp_path(executable_name='yt-dlp'): # 允许传入不同的可执行
         for rel_path in possible_relative_paths:
             bundled_path = os.path.abspath(os.path.join(base_path, rel_path))
             if os.path.exists(bundled_path):
-                print(f"Info constants.py: Found bundled '{executable_name}' at: {bundled_path}")
+                logging.debug(f"constants.py: Found bundled '{executable_name}' at: {bundled_path}")
                 if sys.platform != "win32" and not os.access(bundled_path, os.X_OK):
                     try:
                         current_permissions = os.stat(bundled_path).st_mode
                         os.chmod(bundled_path, current_permissions | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
-                        print(f"Info constants.py: Set execute permission for: {bundled_path}")
+                        logging.debug(f"constants.py: Set execute permission for: {bundled_path}")
                     except Exception as e:
-                        print(f"Warning constants.py: Failed to set execute permission for {bundled_path}: {e}")
+                        logging.warning(f"constants.py: Failed to set execute permission for {bundled_path}: {e}")
                 return bundled_path
         
-        print(f"Warning constants.py: Bundled '{executable_name}' not found in common PyInstaller locations relative to {base_path}. Will check PATH.")
+        logging.warning(f"constants.py: Bundled '{executable_name}' not found in common PyInstaller locations relative to {base_path}. Will check PATH.")
 
     # 2. 如果不是打包环境，或者打包环境中未找到，则从系统 PATH 中查找
     # 使用 shutil.which 来可靠地查找 PATH 中的可执行文件
     path_from_env = shutil.which(exe_with_suffix)
     if path_from_env:
-        print(f"Info constants.py: Found '{executable_name}' in system PATH: {path_from_env}")
+        logging.debug(f"constants.py: Found '{executable_name}' in system PATH: {path_from_env}")
         return path_from_env
 
     # 3. 最后回退，直接返回名称，寄希望于它在调用时能被找到（例如，如果 PATH 在运行时被修改）
-    print(f"Warning constants.py: '{executable_name}' not found via shutil.which. Returning as-is: '{exe_with_suffix}'. Execution might fail if not in PATH at runtime.")
+    logging.warning(f"constants.py: '{executable_name}' not found via shutil.which. Returning as-is: '{exe_with_suffix}'. Execution might fail if not in PATH at runtime.")
     return exe_with_suffix
 
 
 # --- 常量定义 ---
-YT_DLP_EXECUTABLE_PATH = get_yt_dlp_path('yt-dlp')
-# 您也可以用同样的方式定义 ffmpeg 和 ffprobe 的路径，如果需要在代码中直接引用它们
-# 不过通常情况下，yt-dlp 会在其自己的查找路径（包括与yt-dlp同目录，或系统PATH）中找到ffmpeg/ffprobe
-# FFMPEG_PATH = get_yt_dlp_path('ffmpeg')
-# FFPROBE_PATH = get_yt_dlp_path('ffprobe')
-
+# YT_DLP_EXECUTABLE_PATH / FFMPEG_PATH / FFPROBE_PATH / APPLICATION_DATA_DIRECTORY 不再在导入时计算，
+# 而是在首次访问时解析 (见文件末尾的 __getattr__)。新代码请直接调用 get_yt_dlp_executable_path() 等函数。
+# YTDOW_YT_DLP_PATH 环境变量可以替换 yt-dlp (例如 benchmark.py 使用的 fake_yt_dlp.py 桩程序)
+YT_DLP_PATH_ENV_VAR = "YTDOW_YT_DLP_PATH"
+FFMPEG_PATH_ENV_VAR = "YTDOW_FFMPEG_PATH" # 同上，替换转码阶段 (transcode.py) 使用的 ffmpeg
+TOOL_CACHE_FILE_NAME = "tool_cache.json" # 已解析的工具路径和版本，按文件 mtime 失效
 
 LOG_FILE_NAME = "ytdow_debug.log"
+HEADLESS_LOG_FILE_NAME = "ytdow_headless.log" # 命令行/守护进程模式使用独立的日志文件
 # 使用更明确的目录名，并确保在不同平台下的一致性
 APP_NAME_FOR_DIRS = "ytdow" # 应用的统一名称，用于目录
 
@@ -88,10 +93,32 @@ if sys.platform == "darwin": # macOS
 
 
 TASKS_HISTORY_FILE_NAME = "tasks_history.json"
+# 命令行模式默认使用独立的任务历史，避免与同时运行的界面互相覆盖
+HEADLESS_TASKS_HISTORY_FILE_NAME = "tasks_history_headless.json"
+
+# --- 本地控制接口 (HTTP/JSON) ---
+CONTROL_API_DEFAULT_HOST = "127.0.0.1" # 只监听本机
+CONTROL_API_DEFAULT_PORT = 8765
+CONTROL_API_PROFILES_FILE_NAME = "api_profiles.json" # 下载参数预设
+CONTROL_API_TOKEN_FILE_NAME = "api_token" # 未指定 --api-token 时启动时生成的令牌
+
+# --- 运行指标 ---
+METRICS_DEFAULT_HOST = "127.0.0.1"
+METRICS_DEFAULT_PORT = 9464 # Prometheus exporter 常用端口
+METRICS_SNAPSHOT_FILE_NAME = "metrics_snapshot.json"
+
+# --- 已完成文件索引 (去重) ---
+FILE_INDEX_FILE_NAME = "file_index.db"
 
 # --- 应用数据目录创建逻辑 ---
+_app_data_dir = None
+
 def get_app_data_dir():
-    """Ensures the application data directory exists and returns its path."""
+    """Ensures the application data directory exists and returns its path. Resolved once per process."""
+    global _app_data_dir
+    if _app_data_dir is not None:
+        return _app_data_dir
+
     # 目录尝试顺序: macOS Application Support -> Documents/AppNameData -> ~/.AppNameData
     paths_to_try = []
     if APP_DATA_MACOS_APP_SUPPORT_DIR: # 只有 macOS 才会有这个路径
@@ -100,31 +127,149 @@ def get_app_data_dir():
     paths_to_try.append(APP_DATA_FALLBACK_DIR_HOME)
 
     for path_attempt in paths_to_try:
-        if not os.path.exists(path_attempt):
-            try:
-                os.makedirs(path_attempt, exist_ok=True)
-                print(f"Info constants.py: Application data directory created at: {path_attempt}")
-                return path_attempt
-            except Exception as e:
-                print(f"Warning constants.py: Could not create app data directory {path_attempt}: {e}. Trying next option.")
-        else:
-            print(f"Info constants.py: Using existing application data directory: {path_attempt}")
-            return path_attempt
-    
+        if os.path.isdir(path_attempt):
+            _app_data_dir = path_attempt
+            return _app_data_dir
+        try:
+            os.makedirs(path_attempt, exist_ok=True)
+            logging.debug(f"constants.py: Application data directory created at: {path_attempt}")
+            _app_data_dir = path_attempt
+            return _app_data_dir
+        except Exception as e:
+            logging.warning(f"constants.py: Could not create app data directory {path_attempt}: {e}. Trying next option.")
+
     # 如果所有尝试都失败，作为最后手段使用当前工作目录 (非常不推荐)
     critical_fallback_dir = os.path.join(os.getcwd(), APP_NAME_FOR_DIRS + "Data_fallback")
-    print(f"CRITICAL constants.py: All preferred app data directories failed. Attempting to use: {critical_fallback_dir}")
+    logging.critical(f"constants.py: All preferred app data directories failed. Attempting to use: {critical_fallback_dir}")
     try:
         os.makedirs(critical_fallback_dir, exist_ok=True)
-        return critical_fallback_dir
     except Exception as e_critical:
-        print(f"CRITICAL constants.py: Failed to create even the last resort directory {critical_fallback_dir}: {e_critical}. App data might not be saved.")
-        # 返回一个象征性的路径，但写入可能会失败
-        return critical_fallback_dir
+        logging.critical(f"constants.py: Failed to create even the last resort directory {critical_fallback_dir}: {e_critical}. App data might not be saved.")
+    # 即使创建失败也返回这个路径，写入时再报错
+    _app_data_dir = critical_fallback_dir
+    return _app_data_dir
+
+
+# --- 工具路径/版本缓存 ---
+# 进程内: 每个工具只解析一次。磁盘上: tool_cache.json 记录路径、mtime 和版本，
+# 只要 PATH 不变且文件 mtime 未变就直接使用，避免冷启动时遍历 PATH、chmod 或运行 "--version"。
+_tool_lock = threading.RLock()
+_resolved_tool_paths = {}
+_resolved_tool_versions = {}
+_TOOL_VERSION_ARGS = {"yt-dlp": ["--version"], "ffmpeg": ["-version"], "ffprobe": ["-version"]}
+
+
+def _file_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except (OSError, TypeError):
+        return None
+
+
+def _tool_search_context():
+    # 打包环境下的查找目录和 PATH 改变时，之前的解析结果不再可信
+    return [getattr(sys, '_MEIPASS', None) or (os.path.dirname(sys.executable) if getattr(sys, 'frozen', False) else None),
+            os.environ.get("PATH", "")]
+
+
+def _load_tool_cache():
+    try:
+        with open(os.path.join(get_app_data_dir(), TOOL_CACHE_FILE_NAME), encoding="utf-8") as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_tool_cache(cache):
+    cache_path = os.path.join(get_app_data_dir(), TOOL_CACHE_FILE_NAME)
+    try:
+        with open(cache_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=2, ensure_ascii=False)
+        os.replace(cache_path + ".tmp", cache_path)
+    except OSError as e:
+        logging.debug(f"constants.py: Could not write tool cache {cache_path}: {e}")
+
+
+def get_executable_path(executable_name):
+    """Cached get_yt_dlp_path(); the on-disk entry is reused while PATH and the file's mtime are unchanged."""
+    with _tool_lock:
+        path = _resolved_tool_paths.get(executable_name)
+        if path:
+            return path
+        cache = _load_tool_cache()
+        entry = cache.get(executable_name) or {}
+        search_context = _tool_search_context()
+        if entry.get("search_context") == search_context and entry.get("mtime") is not None \
+                and _file_mtime(entry.get("path")) == entry["mtime"]:
+            path = entry["path"]
+        else:
+            path = get_yt_dlp_path(executable_name)
+            # 未找到 (mtime 为 None) 的结果不会命中缓存，下次启动会重新查找
+            cache[executable_name] = {"path": path, "mtime": _file_mtime(path), "search_context": search_context}
+            _save_tool_cache(cache)
+        _resolved_tool_paths[executable_name] = path
+        return path
+
+
+def get_yt_dlp_executable_path():
+    return os.environ.get(YT_DLP_PATH_ENV_VAR) or get_executable_path('yt-dlp')
+
+
+def get_ffmpeg_executable_path():
+    return os.environ.get(FFMPEG_PATH_ENV_VAR) or get_executable_path('ffmpeg')
+
+
+def _tool_path(executable_name):
+    if executable_name == 'yt-dlp': return get_yt_dlp_executable_path()
+    if executable_name == 'ffmpeg': return get_ffmpeg_executable_path()
+    return get_executable_path(executable_name)
+
+
+def get_tool_version(executable_name):
+    """
+    First line of '<tool> --version' (yt-dlp) / '-version' (ffmpeg, ffprobe), or None if it cannot be run.
+    Cached in memory and on disk until the executable's mtime changes.
+    """
+    with _tool_lock:
+        path = _tool_path(executable_name)
+        mtime = _file_mtime(path)
+        cached = _resolved_tool_versions.get(executable_name)
+        if cached and cached[:2] == (path, mtime):
+            return cached[2]
+        cache = _load_tool_cache()
+        entry = cache.get(executable_name) or {}
+        version_entry = entry.get("version") or {}
+        if mtime is not None and version_entry.get("path") == path and version_entry.get("mtime") == mtime:
+            version = version_entry.get("value")
+        else:
+            try:
+                proc = subprocess.run([path] + _TOOL_VERSION_ARGS.get(executable_name, ["--version"]),
+                                      capture_output=True, text=True, encoding="utf-8", errors="replace", timeout=30)
+                lines = (proc.stdout or "").strip().splitlines()
+                version = lines[0].strip() if proc.returncode == 0 and lines else None
+            except (OSError, subprocess.SubprocessError) as e:
+                logging.debug(f"constants.py: Could not get version of {path}: {e}")
+                version = None
+            if version is not None and mtime is not None:
+                entry["version"] = {"path": path, "mtime": mtime, "value": version}
+                cache[executable_name] = entry
+                _save_tool_cache(cache)
+        _resolved_tool_versions[executable_name] = (path, mtime, version)
+        return version
+
 
+_LAZY_CONSTANTS = {
+    "YT_DLP_EXECUTABLE_PATH": get_yt_dlp_executable_path,
+    "FFMPEG_PATH": get_ffmpeg_executable_path,
+    "FFPROBE_PATH": lambda: get_executable_path('ffprobe'),
+    "APPLICATION_DATA_DIRECTORY": get_app_data_dir,
+}
 
-APPLICATION_DATA_DIRECTORY = get_app_data_dir()
 
-# 打印最终确定的路径 (在logging配置前用print)
-print(f"CONSTANTS FINAL: YT_DLP_EXECUTABLE_PATH resolved to: {YT_DLP_EXECUTABLE_PATH}")
-print(f"CONSTANTS FINAL: Application data directory set to: {APPLICATION_DATA_DIRECTORY}")
+def __getattr__(name):
+    # 兼容旧代码的 "from constants import YT_DLP_EXECUTABLE_PATH" 等写法 (访问时才解析)
+    resolver = _LAZY_CONSTANTS.get(name)
+    if resolver is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return resolver()
@@ -0,0 +1,578 @@
+# control_api.py
+import os
+import hmac
+import json
+import time
+import secrets
+import ipaddress
+import logging
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from constants import (
+    get_app_data_dir, CONTROL_API_DEFAULT_HOST, CONTROL_API_DEFAULT_PORT, CONTROL_API_PROFILES_FILE_NAME,
+    CONTROL_API_TOKEN_FILE_NAME
+)
+from task_engine import build_download_params, DEFAULT_OUTPUT_DIR, DEFAULT_OUTPUT_MAX_LINES
+from task_state import ALL_STATES, STATE_QUEUED
+
+# 预设/请求中允许的下载参数 (与 build_download_params 的参数同名)
+PROFILE_PARAM_KEYS = (
+    "output_dir", "cookies_browser", "cookies_file_path", "conv_mode", "conv_fmt",
+    "quality_preset", "audio_quality", "limit_rate", "post_script", "extra_args", "off_peak_only", "keep_source",
+)
+# 只用于解析链接 (yt-dlp -J) 的参数
+PROFILE_FETCH_KEYS = ("fetch_extra_args",)
+
+EVENT_LOG_SIZE = 10000          # 保留的最近事件数，客户端落后太多时需要重新拉取全量状态
+EVENT_FLUSH_INTERVAL_MS = 250   # 进度更新合并发送的间隔
+MAX_REQUEST_BODY_BYTES = 64 * 1024 * 1024
+MAX_LONG_POLL_SECONDS = 60
+SSE_KEEPALIVE_SECONDS = 15
+MAIN_THREAD_CALL_TIMEOUT = 30
+
+
+def add_control_api_arguments(parser):
+    """Adds the --api-* options shared by main_app.py and cli_app.py."""
+    parser.add_argument("--api-port", type=int, nargs="?", const=CONTROL_API_DEFAULT_PORT, default=None,
+                        help=f"启用本地控制接口 (HTTP/JSON)，可指定端口 (默认: {CONTROL_API_DEFAULT_PORT})")
+    parser.add_argument("--api-host", default=CONTROL_API_DEFAULT_HOST, help=f"控制接口监听地址 (默认: {CONTROL_API_DEFAULT_HOST})")
+    parser.add_argument("--api-token", default=os.environ.get("YTDOW_API_TOKEN", ""),
+                        help="控制接口访问令牌 (Authorization: Bearer <token>)，也可用环境变量 YTDOW_API_TOKEN "
+                             f"(默认: 启动时随机生成，写入数据目录下的 {CONTROL_API_TOKEN_FILE_NAME})")
+
+
+def _is_loopback_host(hostname):
+    if not hostname: return False
+    if hostname.lower() == "localhost": return True
+    try:
+        return ipaddress.ip_address(hostname).is_loopback
+    except ValueError:
+        return False
+
+
+def _hostname_of(url):
+    """Lower-case host name of a URL or "host:port" (as sent in Origin/Host headers), None if it cannot be parsed."""
+    try:
+        return urlsplit(url if "//" in url else f"//{url}").hostname
+    except ValueError:
+        return None
+
+
+def _is_ip_literal(hostname):
+    try:
+        ipaddress.ip_address(hostname or "")
+        return True
+    except ValueError:
+        return False
+
+
+def _write_token_file(path, token):
+    """Writes the generated token readable only by the current user, so local clients can pick it up."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token + "\n")
+
+
+class ApiError(Exception):
+    def __init__(self, http_status, message):
+        super().__init__(message)
+        self.http_status = http_status
+        self.message = message
+
+
+class _MainThreadInvoker(QObject):
+    """Runs callables on the Qt thread that owns the engine and hands the result back to the HTTP thread."""
+    _call_requested = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # 从其他线程 emit 时，AutoConnection 会变成排队连接，回调在本对象所在的 Qt 线程执行
+        self._call_requested.connect(self._run_call)
+
+    def call(self, fn, timeout=MAIN_THREAD_CALL_TIMEOUT):
+        job = {"fn": fn, "done": threading.Event(), "result": None, "error": None}
+        self._call_requested.emit(job)
+        if not job["done"].wait(timeout):
+            raise ApiError(503, "engine did not respond in time")
+        if job["error"] is not None:
+            raise job["error"]
+        return job["result"]
+
+    def _run_call(self, job):
+        try:
+            job["result"] = job["fn"]()
+        except Exception as e:
+            job["error"] = e
+        finally:
+            job["done"].set()
+
+
+class EventLog:
+    """Thread-safe ring buffer of engine events with increasing sequence numbers."""
+
+    def __init__(self, maxlen=EVENT_LOG_SIZE):
+        self._events = deque(maxlen=maxlen)
+        self._next_seq = 1
+        self._cond = threading.Condition()
+        self.closed = False
+
+    def append_many(self, events):
+        with self._cond:
+            for event in events:
+                event["seq"] = self._next_seq
+                self._next_seq += 1
+                self._events.append(event)
+            self._cond.notify_all()
+
+    def last_seq(self):
+        with self._cond:
+            return self._next_seq - 1
+
+    def wait_since(self, since_seq, timeout):
+        """Returns (events after since_seq, truncated flag); blocks up to timeout seconds for new events."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._next_seq - 1 <= since_seq and not self.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0: break
+                self._cond.wait(remaining)
+            events = [e for e in self._events if e["seq"] > since_seq]
+            truncated = bool(self._events) and self._events[0]["seq"] > since_seq + 1
+            return events, truncated
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class ControlApiServer(QObject):
+    """
+    Optional localhost HTTP/JSON API over a TaskEngine. Requests are served on background
+    threads; everything touching the engine is marshalled to the engine's Qt thread, so the
+    API drives exactly the same queue and scheduler as the GUI/CLI.
+    """
+
+    def __init__(self, engine, host=CONTROL_API_DEFAULT_HOST, port=CONTROL_API_DEFAULT_PORT, token=None,
+                 profiles_file_path=None, parent=None):
+        super().__init__(parent)
+        self.log_prefix = f"[{self.__class__.__name__}] "
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.token = token or None
+        self.token_file_path = None # 令牌为自动生成时写入的文件
+        self.profiles_file_path = profiles_file_path or os.path.join(get_app_data_dir(), CONTROL_API_PROFILES_FILE_NAME)
+        self.profiles = self._load_profiles()
+
+        self.invoker = _MainThreadInvoker(self)
+        self.events = EventLog()
+        self._pending_updated_ids = set()
+        self._pending_events = []
+
+        self.engine.task_added.connect(self._on_task_added)
+        self.engine.task_updated.connect(self._pending_updated_ids.add)
+        self.engine.tasks_removed.connect(self._on_tasks_removed)
+        self.engine.state_counts_changed.connect(lambda counts: self._pending_events.append({"type": "state_counts", "counts": counts}))
+        self.engine.fetch_error.connect(lambda url, msg: self._pending_events.append({"type": "fetch_error", "url": url, "error": msg}))
+        self.engine.fetch_queue_drained.connect(lambda count: self._pending_events.append({"type": "fetch_drained", "processed": count}))
+
+        # 进度信号非常频繁，合并后定时写入事件日志
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setInterval(EVENT_FLUSH_INTERVAL_MS)
+        self.flush_timer.timeout.connect(self._flush_events)
+
+        self.httpd = None
+        self.server_thread = None
+
+    # --- 生命周期 ---
+    def start(self):
+        if not self.token:
+            # 没有令牌时，任何网页都能向本机端口发请求 (extra_args/post_script 可以执行命令)
+            self.token = secrets.token_urlsafe(32)
+            self.token_file_path = os.path.join(get_app_data_dir(), CONTROL_API_TOKEN_FILE_NAME)
+            _write_token_file(self.token_file_path, self.token)
+            logging.info(f"{self.log_prefix}已生成控制接口令牌，保存在 {self.token_file_path}")
+        handler_class = type("BoundControlApiHandler", (_ControlApiHandler,), {"api": self})
+        self.httpd = ThreadingHTTPServer((self.host, self.port), handler_class)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1] # port=0 时使用系统分配的端口
+        self.server_thread = threading.Thread(target=self.httpd.serve_forever, name="ControlApiServer", daemon=True)
+        self.server_thread.start()
+        self.flush_timer.start()
+        logging.info(f"{self.log_prefix}控制接口已启动: http://{self.host}:{self.port}/api/")
+
+    def stop(self):
+        if not self.httpd: return
+        self.flush_timer.stop()
+        self.events.close() # 结束长轮询和事件流
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.httpd = None
+        if self.token_file_path:
+            try:
+                os.remove(self.token_file_path)
+            except OSError:
+                pass
+        logging.info(f"{self.log_prefix}控制接口已停止。")
+
+    # --- 事件 ---
+    def _on_task_added(self, task_id):
+        self._pending_events.append({"type": "task_added", "task": self.engine.task_snapshot(task_id)})
+
+    def _on_tasks_removed(self, task_ids):
+        self._pending_updated_ids.difference_update(task_ids)
+        self._pending_events.append({"type": "tasks_removed", "ids": list(task_ids)})
+
+    def _flush_events(self):
+        if not self._pending_events and not self._pending_updated_ids: return
+        events = self._pending_events
+        self._pending_events = []
+        for task_id in self._pending_updated_ids:
+            snapshot = self.engine.task_snapshot(task_id)
+            if snapshot is not None:
+                events.append({"type": "task_updated", "task": snapshot})
+        self._pending_updated_ids.clear()
+        now = time.time()
+        for event in events:
+            event["time"] = now
+        self.events.append_many(events)
+
+    # --- 参数预设 ---
+    def _load_profiles(self):
+        if not os.path.exists(self.profiles_file_path): return {}
+        try:
+            with open(self.profiles_file_path, "r", encoding="utf-8") as f:
+                profiles = json.load(f)
+            if isinstance(profiles, dict):
+                return profiles
+            logging.warning(f"{self.log_prefix}Profiles file {self.profiles_file_path} is not a JSON object, ignored.")
+        except Exception as e:
+            logging.error(f"{self.log_prefix}Error loading profiles from {self.profiles_file_path}: {e}", exc_info=True)
+        return {}
+
+    def _save_profiles(self):
+        try:
+            with open(self.profiles_file_path, "w", encoding="utf-8") as f:
+                json.dump(self.profiles, f, ensure_ascii=False, indent=4)
+        except Exception as e:
+            logging.error(f"{self.log_prefix}Error saving profiles to {self.profiles_file_path}: {e}", exc_info=True)
+            raise ApiError(500, f"could not save profiles: {e}")
+
+    @staticmethod
+    def _validate_profile(values):
+        if not isinstance(values, dict):
+            raise ApiError(400, "profile must be a JSON object")
+        unknown_keys = set(values) - set(PROFILE_PARAM_KEYS) - set(PROFILE_FETCH_KEYS)
+        if unknown_keys:
+            raise ApiError(400, f"unknown profile keys: {sorted(unknown_keys)}")
+        return {k: str(v) for k, v in values.items()}
+
+    def _resolve_submission(self, body):
+        """-> (download params, fetch_options) for a submission: profile values overridden by inline params."""
+        profile_name = body.get("profile")
+        values = {}
+        if profile_name is not None:
+            if profile_name not in self.profiles:
+                raise ApiError(404, f"unknown profile: {profile_name}")
+            values.update(self.profiles[profile_name])
+        values.update(self._validate_profile(body.get("params") or {}))
+
+        output_dir = os.path.abspath(os.path.expanduser(values.get("output_dir") or DEFAULT_OUTPUT_DIR))
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+        except OSError as e:
+            raise ApiError(400, f"invalid output_dir {output_dir}: {e}")
+        build_kwargs = {k: values[k] for k in PROFILE_PARAM_KEYS if k in values and k != "output_dir"}
+        params = build_download_params(output_dir, **build_kwargs)
+        fetch_options = {
+            "cookies_browser": params["cookies_browser"],
+            "cookies_file_path": params["cookies_file_path"],
+            "extra_args_for_fetching": values.get("fetch_extra_args", ""),
+        }
+        return params, fetch_options
+
+    # --- 接口实现 (均在引擎线程中执行) ---
+    def api_state(self):
+        engine = self.engine
+        return {
+            "counts": engine.task_states.counts(),
+            "total": len(engine.tasks),
+            "active_workers": engine.active_workers,
+            "max_concurrent": engine.max_concurrent,
+            "effective_max_concurrent": engine.effective_max_concurrent(), # 时段规则可能覆盖
+            "download_queue_length": engine.task_states.count(STATE_QUEUED),
+            "fetch_queue_length": engine.pending_fetch_count(),
+            "postprocess_queue_length": engine.postprocess.pending_count(),
+            "postprocess_running": engine.postprocess.running_count(),
+            "postprocess_max_concurrent": engine.postprocess.max_concurrent,
+            "transcode_queue_length": engine.transcode.pending_count(),
+            "transcode_running": engine.transcode.running_count(),
+            "transcode_max_concurrent": engine.transcode.max_concurrent,
+            "idle": engine.is_idle(),
+            "last_event_seq": self.events.last_seq(),
+        }
+
+    def api_list_tasks(self, query):
+        states = [state for value in query.get("state", []) for state in value.split(",") if state]
+        for state in states:
+            if state not in ALL_STATES:
+                raise ApiError(400, f"unknown state: {state}")
+        try:
+            offset = int(query.get("offset", ["0"])[0])
+            limit = int(query.get("limit", ["1000"])[0])
+        except ValueError:
+            raise ApiError(400, "offset/limit must be integers")
+        task_ids = self.engine.task_states.ids(*states) if states else list(self.engine.tasks)
+        task_ids.sort(key=lambda tid: int(tid) if tid.isdigit() else 0)
+        page = task_ids[max(0, offset):max(0, offset) + max(0, limit)]
+        return {"total": len(task_ids), "offset": offset, "tasks": [self.engine.task_snapshot(tid) for tid in page]}
+
+    def api_get_task(self, task_id):
+        snapshot = self.engine.task_snapshot(task_id)
+        if snapshot is None:
+            raise ApiError(404, f"unknown task: {task_id}")
+        return snapshot
+
+    def api_task_output(self, task_id, query):
+        """Runs on the HTTP thread: the output buffer is thread-safe and the file read should not block the engine."""
+        try:
+            max_lines = max(1, int(query.get("lines", [DEFAULT_OUTPUT_MAX_LINES])[0]))
+        except ValueError:
+            raise ApiError(400, "'lines' must be an integer")
+        self.invoker.call(lambda: self.api_get_task(task_id)) # 404 for unknown tasks
+        return {"id": task_id, "lines": self.engine.task_output(task_id, max_lines)}
+
+    def api_submit(self, body):
+        urls = body.get("urls")
+        if not isinstance(urls, list) or not all(isinstance(u, str) for u in urls):
+            raise ApiError(400, "'urls' must be a list of strings")
+        params, fetch_options = self._resolve_submission(body)
+        autostart = bool(body.get("start", True))
+
+        if body.get("resolve", True):
+            # 每个链接都要运行一次 yt-dlp -J (支持播放列表)，这里只入解析队列，立即返回
+            queued_count = self.engine.submit_urls(urls, fetch_options, params=params, autostart=autostart)
+            return {"resolving": queued_count, "fetch_queue_length": self.engine.pending_fetch_count()}
+
+        results = self.engine.add_tasks_without_resolving(urls, params=params, autostart=autostart)
+        return {
+            "added": [{"url": url, "id": tid} for url, tid in results if tid],
+            "duplicates": [{"url": url, "id": self.engine.task_id_for_url(url)} for url, tid in results if not tid],
+        }
+
+    def _ids_from_body(self, body):
+        if body.get("all"):
+            return list(self.engine.tasks)
+        task_ids = body.get("ids")
+        if not isinstance(task_ids, list):
+            raise ApiError(400, "expected 'ids' (list) or 'all': true")
+        return [str(tid) for tid in task_ids]
+
+    def api_action(self, action, body):
+        if action == "pause":
+            if body.get("all"):
+                self.engine.pause_all_active_tasks(clear_queue=True)
+                return {"paused": "all"}
+            return {"paused": self.engine.pause_tasks(self._ids_from_body(body))}
+        if action == "resume":
+            return {"resumed": self.engine.resume_tasks(self._ids_from_body(body))}
+        if action == "retry":
+            errors = {}
+            for task_id in self._ids_from_body(body):
+                reason = self.engine.retry_task(task_id)
+                if reason: errors[task_id] = reason
+            return {"errors": errors}
+        if action == "cancel":
+            task_ids = [tid for tid in self._ids_from_body(body) if tid in self.engine.tasks]
+            self.engine.delete_tasks(task_ids)
+            return {"cancelled": len(task_ids)}
+        raise ApiError(404, f"unknown action: {action}")
+
+    def api_settings(self, body):
+        if "max_concurrent" in body:
+            try:
+                value = int(body["max_concurrent"])
+            except (TypeError, ValueError):
+                raise ApiError(400, "max_concurrent must be an integer")
+            if value < 1:
+                raise ApiError(400, "max_concurrent must be >= 1")
+            self.engine.set_max_concurrent(value)
+        return {"max_concurrent": self.engine.max_concurrent}
+
+    def api_put_profile(self, name, body):
+        self.profiles[name] = self._validate_profile(body)
+        self._save_profiles()
+        return {name: self.profiles[name]}
+
+    def api_delete_profile(self, name):
+        if self.profiles.pop(name, None) is None:
+            raise ApiError(404, f"unknown profile: {name}")
+        self._save_profiles()
+        return {"deleted": name}
+
+
+class _ControlApiHandler(BaseHTTPRequestHandler):
+    """
+    GET    /api/state                       counts, queue lengths, concurrency
+    GET    /api/tasks[?state=a,b&offset&limit]
+    GET    /api/tasks/<id>
+    GET    /api/tasks/<id>/output[?lines=n]   recent yt-dlp output of the task
+    POST   /api/tasks                       {"urls": [...], "profile", "params", "resolve": true, "start": true}
+    POST   /api/tasks/{pause,resume,retry,cancel}   {"ids": [...]} or {"all": true}
+    GET    /api/events?since=<seq>&timeout=<s>      long-poll
+    GET    /api/events/stream               Server-Sent Events (Last-Event-ID supported)
+    GET    /api/profiles, PUT/DELETE /api/profiles/<name>
+    PUT    /api/settings                    {"max_concurrent": n}
+
+    Every request needs "Authorization: Bearer <token>"; request bodies must be application/json.
+    Requests with a non-loopback Origin or a Host header naming a foreign host are refused.
+    """
+    api = None # 由 ControlApiServer.start 绑定
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logging.debug(f"[ControlApi] {self.address_string()} {format % args}")
+
+    # --- 请求/响应辅助 ---
+    def _send_json(self, http_status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(http_status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json_body(self):
+        content_type = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+        if content_type != "application/json":
+            raise ApiError(415, "Content-Type must be application/json")
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_REQUEST_BODY_BYTES:
+            raise ApiError(413, "request body too large")
+        if length == 0: return {}
+        try:
+            body = json.loads(self.rfile.read(length).decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise ApiError(400, f"invalid JSON body: {e}")
+        if not isinstance(body, dict):
+            raise ApiError(400, "JSON body must be an object")
+        return body
+
+    def _check_origin(self):
+        """Rejects cross-site browser requests (non-loopback Origin) and DNS rebinding (Host is a foreign name)."""
+        origin = self.headers.get("Origin")
+        if origin is not None and not _is_loopback_host(_hostname_of(origin)):
+            raise ApiError(403, "cross-origin requests are not allowed")
+        host = self.headers.get("Host")
+        if host is not None:
+            hostname = _hostname_of(host)
+            # IP 地址不会被 DNS 重绑定利用；绑定到具体主机名时也接受该名称
+            if not (_is_loopback_host(hostname) or _is_ip_literal(hostname) or hostname == (self.api.host or "").lower()):
+                raise ApiError(403, f"unexpected Host header: {host}")
+
+    def _check_token(self):
+        if not self.api.token: return
+        expected = f"Bearer {self.api.token}".encode("utf-8")
+        if not hmac.compare_digest(self.headers.get("Authorization", "").encode("utf-8"), expected):
+            raise ApiError(401, "missing or invalid bearer token")
+
+    def _dispatch(self, method):
+        split_url = urlsplit(self.path)
+        parts = [p for p in split_url.path.split("/") if p]
+        query = parse_qs(split_url.query)
+        try:
+            self._check_origin()
+            self._check_token()
+            if not parts or parts[0] != "api":
+                raise ApiError(404, "not found")
+            self._route(method, parts[1:], query)
+        except ApiError as e:
+            self._send_json(e.http_status, {"error": e.message})
+        except (BrokenPipeError, ConnectionResetError):
+            pass # 客户端已断开
+        except Exception as e:
+            logging.error(f"[ControlApi] Unhandled error for {method} {self.path}: {e}", exc_info=True)
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def _route(self, method, parts, query):
+        api = self.api
+        call = api.invoker.call
+        if method == "GET" and parts == ["state"]:
+            return self._send_json(200, call(api.api_state))
+        if parts[:1] == ["tasks"]:
+            if method == "GET" and len(parts) == 1:
+                return self._send_json(200, call(lambda: api.api_list_tasks(query)))
+            if method == "GET" and len(parts) == 2:
+                return self._send_json(200, call(lambda: api.api_get_task(parts[1])))
+            if method == "GET" and len(parts) == 3 and parts[2] == "output":
+                return self._send_json(200, api.api_task_output(parts[1], query))
+            if method == "POST" and len(parts) == 1:
+                body = self._read_json_body()
+                return self._send_json(202, call(lambda: api.api_submit(body)))
+            if method == "POST" and len(parts) == 2:
+                body = self._read_json_body()
+                return self._send_json(200, call(lambda: api.api_action(parts[1], body)))
+        if method == "GET" and parts == ["events"]:
+            return self._long_poll(query)
+        if method == "GET" and parts == ["events", "stream"]:
+            return self._stream_events(query)
+        if parts[:1] == ["profiles"]:
+            if method == "GET" and len(parts) == 1:
+                return self._send_json(200, call(lambda: dict(api.profiles)))
+            if method == "PUT" and len(parts) == 2:
+                body = self._read_json_body()
+                return self._send_json(200, call(lambda: api.api_put_profile(parts[1], body)))
+            if method == "DELETE" and len(parts) == 2:
+                return self._send_json(200, call(lambda: api.api_delete_profile(parts[1])))
+        if method == "PUT" and parts == ["settings"]:
+            body = self._read_json_body()
+            return self._send_json(200, call(lambda: api.api_settings(body)))
+        raise ApiError(404, "not found")
+
+    @staticmethod
+    def _since_from(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ApiError(400, "'since' must be an integer event sequence number")
+
+    def _long_poll(self, query):
+        since = self._since_from(query.get("since", ["0"])[0])
+        try:
+            timeout = min(float(query.get("timeout", ["30"])[0]), MAX_LONG_POLL_SECONDS)
+        except ValueError:
+            raise ApiError(400, "'timeout' must be a number")
+        events, truncated = self.api.events.wait_since(since, timeout)
+        next_since = events[-1]["seq"] if events else max(since, 0)
+        self._send_json(200, {"events": events, "next": next_since, "truncated": truncated})
+
+    def _stream_events(self, query):
+        since = self._since_from(self.headers.get("Last-Event-ID") or query.get("since", [None])[0] or self.api.events.last_seq())
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        while not self.api.events.closed:
+            events, truncated = self.api.events.wait_since(since, SSE_KEEPALIVE_SECONDS)
+            if truncated:
+                # 客户端落后超过事件缓冲区，通知其重新拉取 /api/tasks
+                self.wfile.write(b"event: truncated\ndata: {}\n\n")
+            if not events:
+                self.wfile.write(b": keepalive\n\n")
+            for event in events:
+                payload = json.dumps(event, ensure_ascii=False)
+                self.wfile.write(f"id: {event['seq']}\nevent: {event['type']}\ndata: {payload}\n\n".encode("utf-8"))
+                since = event["seq"]
+            self.wfile.flush()
+
+    def do_GET(self): self._dispatch("GET")
+    def do_POST(self): self._dispatch("POST")
+    def do_PUT(self): self._dispatch("PUT")
+    def do_DELETE(self): self._dispatch("DELETE")
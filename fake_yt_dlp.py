@@ -0,0 +1,168 @@
+# fake_yt_dlp.py
+"""
+Stand-in for the yt-dlp executable used by benchmark.py (see YTDOW_YT_DLP_PATH in constants.py).
+No network access: it prints yt-dlp-like output and writes an empty output file.
+
+Behaviour is configured per URL query string, falling back to FAKE_YT_DLP_* environment variables:
+  lines=N       progress lines per downloaded file (FAKE_YT_DLP_LINES, default 20)
+  rate=R        progress lines per second, 0 = as fast as possible (FAKE_YT_DLP_RATE, default 0)
+  post=MODE     plain | merge | audio (FAKE_YT_DLP_POST, default plain)
+  fail=CODE     print "ERROR: ... HTTP Error CODE" and exit 1
+  n=N           with -J on a URL containing "playlist": number of entries (FAKE_YT_DLP_PLAYLIST_SIZE, default 100)
+  newest=N      playlist entry ids count down from N (newest first, like a channel), so raising
+                FAKE_YT_DLP_NEWEST between runs simulates new uploads; --playlist-end is honoured
+  expire=S      single-video -J output has a format URL signed for S seconds (FAKE_YT_DLP_EXPIRE, default 21600);
+                --load-info-json fails with HTTP Error 403 once it has expired, or always with FAKE_YT_DLP_STALE_INFO=1
+  stall=S       hang for S seconds halfway through the download, leaving a .part file (FAKE_YT_DLP_STALL);
+                a later run finds the .part file, prints "Resuming download" and does not hang again
+--write-info-json writes the info to the "infojson:" output template.
+FAKE_YT_DLP_REPLAY=PATH replays a recorded yt-dlp log instead ("{filepath}" in it is replaced
+by the output path, lines are paced by rate).
+"""
+import os
+import sys
+import json
+import time
+from urllib.parse import urlsplit, parse_qs
+
+
+def _option(query, name, default):
+    values = query.get(name)
+    if values: return values[0]
+    return os.environ.get(f"FAKE_YT_DLP_{name.upper()}", default)
+
+
+def _video_id(url):
+    return urlsplit(url).path.rstrip("/").rsplit("/", 1)[-1] or "video"
+
+
+def video_info(url, query):
+    video_id = _video_id(url)
+    expire = int(time.time()) + int(_option(query, "expire", "21600"))
+    return {"id": video_id, "title": f"Benchmark video {video_id}", "webpage_url": url, "extractor": "generic",
+            "formats": [{"format_id": "18", "ext": "mp4", "url": f"https://media.bench.invalid/{video_id}.mp4?expire={expire}"}]}
+
+
+def dump_json(url, query, playlist_end=None):
+    if "playlist" in url:
+        size = int(query["n"][0] if "n" in query else os.environ.get("FAKE_YT_DLP_PLAYLIST_SIZE", 100))
+        base = url.split("?", 1)[0].replace("playlist", "video")
+        newest = _option(query, "newest", None)
+        ids = range(int(newest), max(int(newest) - size, 0), -1) if newest else range(size)
+        if playlist_end: ids = list(ids)[:playlist_end]
+        entries = [{"_type": "url", "ie_key": "Generic", "id": f"{i}", "title": f"Benchmark video {i}",
+                    "url": f"{base}/{i}"} for i in ids]
+        print(json.dumps({"_type": "playlist", "id": "bench", "title": "Benchmark playlist", "entries": entries}))
+    else:
+        print(json.dumps(video_info(url, query)))
+    return 0
+
+
+class _Pacer:
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.next_at = time.monotonic()
+
+    def wait(self):
+        if not self.interval: return
+        self.next_at += self.interval
+        delay = self.next_at - time.monotonic()
+        if delay > 0: time.sleep(delay)
+
+
+def _progress(destination, lines, pacer, stall_seconds=0):
+    print(f"[download] Destination: {destination}", flush=True)
+    for i in range(lines):
+        if stall_seconds and i == lines // 2:
+            open(destination + ".part", "a").close()
+            time.sleep(stall_seconds)
+        percent = 100.0 * i / max(lines, 1)
+        print(f"[download] {percent:5.1f}% of   10.00MiB at    2.50MiB/s ETA 00:{max(0, 4 - i * 4 // max(lines, 1)):02d}", flush=True)
+        pacer.wait()
+    print("[download] 100% of   10.00MiB in 00:00:04 at 2.50MiB/s", flush=True)
+
+
+def download(url, query, output_template, from_info=False):
+    video_id = _video_id(url)
+    post = _option(query, "post", "plain")
+    ext = {"audio": "mp3"}.get(post, "mp4")
+    base_path = output_template.replace("%(title)s", f"Benchmark video {video_id}").replace("%(id)s", video_id)
+    filepath = base_path.replace("%(ext)s", ext)
+    pacer = _Pacer(float(_option(query, "rate", "0")))
+
+    replay_path = os.environ.get("FAKE_YT_DLP_REPLAY")
+    if replay_path:
+        with open(replay_path, encoding="utf-8") as f:
+            for line in f:
+                print(line.rstrip("\n").replace("{filepath}", filepath), flush=True)
+                pacer.wait()
+    else:
+        lines = int(_option(query, "lines", "20"))
+        if not from_info:
+            print(f"[generic] Extracting URL: {url}", flush=True)
+            print(f"[generic] {video_id}: Downloading webpage", flush=True)
+        fail_code = _option(query, "fail", None)
+        if fail_code:
+            print(f"ERROR: [generic] {video_id}: Unable to download webpage: HTTP Error {fail_code}", flush=True)
+            return 1
+        if post == "merge":
+            print(f"[info] {video_id}: Downloading 1 format(s): 137+140", flush=True)
+            _progress(base_path.replace("%(ext)s", "f137.mp4"), lines, pacer)
+            _progress(base_path.replace("%(ext)s", "f140.m4a"), lines, pacer)
+            print(f'[Merger] Merging formats into "{filepath}"', flush=True)
+        elif post == "audio":
+            _progress(base_path.replace("%(ext)s", "webm"), lines, pacer)
+            print(f"[ExtractAudio] Destination: {filepath}", flush=True)
+        else:
+            stall_seconds = float(_option(query, "stall", "0"))
+            if os.path.exists(filepath + ".part"):
+                print("[download] Resuming download at byte 5242880", flush=True)
+                os.remove(filepath + ".part")
+                stall_seconds = 0
+            _progress(filepath, lines, pacer, stall_seconds)
+
+    directory = os.path.dirname(filepath)
+    if directory: os.makedirs(directory, exist_ok=True)
+    open(filepath, "a").close()
+    return 0
+
+
+def _load_info(path):
+    with open(path, encoding="utf-8") as f:
+        info = json.load(f)
+    expires = [int(fmt["url"].rsplit("expire=", 1)[1]) for fmt in info.get("formats", []) if "expire=" in fmt.get("url", "")]
+    if os.environ.get("FAKE_YT_DLP_STALE_INFO") or (expires and min(expires) < time.time()):
+        print("ERROR: unable to download video data: HTTP Error 403: Forbidden", flush=True)
+        return None
+    return info
+
+
+def main(argv):
+    templates = [argv[i + 1] for i, arg in enumerate(argv[:-1]) if arg == "-o"]
+    output_template = next((t for t in templates if not t.startswith("infojson:")), "%(title)s.%(ext)s")
+    info_template = next((t[len("infojson:"):] for t in templates if t.startswith("infojson:")), None)
+    if "--load-info-json" in argv:
+        info = _load_info(argv[argv.index("--load-info-json") + 1])
+        if info is None: return 1
+        url = info["webpage_url"]
+    else:
+        urls = [arg for arg in argv if "://" in arg]
+        if not urls:
+            print("ERROR: no URL given", file=sys.stderr)
+            return 2
+        url, info = urls[0], None
+    query = parse_qs(urlsplit(url).query)
+    if "-J" in argv or "--dump-single-json" in argv:
+        playlist_end = int(argv[argv.index("--playlist-end") + 1]) if "--playlist-end" in argv else None
+        return dump_json(url, query, playlist_end)
+    if "--write-info-json" in argv and info_template and info is None:
+        print(f"[info] Writing video metadata as JSON to: {info_template}.info.json", flush=True)
+        info_path = info_template.replace("%%", "%") + ".info.json"
+        os.makedirs(os.path.dirname(info_path) or ".", exist_ok=True)
+        with open(info_path, "w", encoding="utf-8") as f:
+            json.dump(video_info(url, query), f)
+    return download(url, query, output_template, from_info=info is not None)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
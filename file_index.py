@@ -0,0 +1,337 @@
+# file_index.py
+"""
+Index of completed files for deduplication (SQLite, default: file_index.db in the app data directory).
+
+Every completed task is recorded under its video keys ("extractor:id" from the info JSON, and
+"url:<canonical URL>") together with a format key built from the parameters that change the
+output file. A task whose keys and format are already in the index is not downloaded again:
+TaskEngine places the existing file in the task's output directory as a hardlink, a reflink
+(copy-on-write clone, where the filesystem supports it) or a plain copy.
+
+With --dedupe-hash the SHA-256 of each completed file is stored as well, and a new file with
+the same content as an indexed one is replaced by a hardlink. --dedupe-library DIR runs the
+same content deduplication over existing directories in the background.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from constants import get_app_data_dir, FILE_INDEX_FILE_NAME
+from url_import import canonical_url
+
+DEDUPE_FALLBACK = "需要下载" # DedupeLinkWorker 的结果: 无法使用已有文件，改为正常下载
+HASH_CHUNK_BYTES = 1024 * 1024
+MIN_LIBRARY_FILE_BYTES = 1024 * 1024 # 小文件不值得去重
+_FICLONE = 0x40049409 # Linux ioctl: 克隆文件数据 (btrfs/XFS/bcachefs 等)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    sha256 TEXT,
+    added REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_hash_idx ON files (sha256, size);
+CREATE TABLE IF NOT EXISTS file_keys (
+    video_key TEXT NOT NULL,
+    format_key TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (video_key, format_key, path)
+);
+"""
+
+
+def format_key_for(params):
+    """The download parameters that determine the output file, as one string."""
+    return "|".join(str(params.get(name) or "") for name in ("video_format", "conv_mode", "conv_fmt", "audio_quality"))
+
+
+def video_keys(url, info_json_path=None):
+    """Keys a video is indexed under: the canonical URL, plus extractor:id when its info JSON is available."""
+    keys = [f"url:{canonical_url(url)}"]
+    if info_json_path:
+        try:
+            with open(info_json_path, encoding="utf-8") as f:
+                info = json.load(f)
+            if info.get("id") and (info.get("extractor_key") or info.get("extractor")):
+                keys.insert(0, f"{(info.get('extractor_key') or info['extractor']).lower()}:{info['id']}")
+        except (OSError, ValueError, AttributeError):
+            pass
+    return keys
+
+
+def file_sha256(path, stop_check=None):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            if stop_check and stop_check(): return None
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _reflink(source, target):
+    import fcntl # 仅 Unix
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+
+
+def materialize(source, target, stop_check=None):
+    """
+    Makes target a file with the content of source: hardlink, else reflink, else copy (via a temp file).
+    Returns the method used ("existing" if target already is that file or has the same content). Raises OSError.
+    """
+    if os.path.exists(target):
+        if os.path.samefile(source, target):
+            return "existing"
+        # 同名同大小的文件不一定是同一个视频，比较内容
+        if os.path.getsize(source) == os.path.getsize(target):
+            source_hash = file_sha256(source, stop_check)
+            target_hash = file_sha256(target, stop_check) if source_hash else None
+            if source_hash is None or target_hash is None:
+                raise InterruptedError("已取消")
+            if source_hash == target_hash:
+                return "existing"
+        raise FileExistsError(f"目标文件已存在且内容不同: {target}")
+    try:
+        os.link(source, target)
+        return "hardlink"
+    except OSError:
+        pass # 跨文件系统或不支持硬链接
+    tmp_path = target + ".dedupe.tmp"
+    try:
+        if sys.platform.startswith("linux"):
+            try:
+                _reflink(source, tmp_path)
+                os.replace(tmp_path, target)
+                return "reflink"
+            except (OSError, ImportError):
+                pass
+        with open(source, "rb") as src, open(tmp_path, "wb") as dst:
+            for chunk in iter(lambda: src.read(HASH_CHUNK_BYTES), b""):
+                if stop_check and stop_check():
+                    raise InterruptedError("已取消")
+                dst.write(chunk)
+        shutil.copystat(source, tmp_path)
+        os.replace(tmp_path, target)
+        return "copy"
+    finally:
+        if os.path.exists(tmp_path):
+            try: os.remove(tmp_path)
+            except OSError: pass
+
+
+def replace_with_hardlink(keep_path, duplicate_path):
+    """Replaces duplicate_path by a hardlink to keep_path (same filesystem only). Returns True if replaced."""
+    if os.path.samefile(keep_path, duplicate_path) or os.stat(keep_path).st_dev != os.stat(duplicate_path).st_dev:
+        return False
+    tmp_path = duplicate_path + ".dedupe.tmp"
+    os.link(keep_path, tmp_path)
+    os.replace(tmp_path, duplicate_path) # 原子替换，任何时刻 duplicate_path 都是完整的文件
+    return True
+
+
+class FileIndex:
+    """The completed-file index. Thread-safe: downloads record from the engine thread, hashing runs in background threads."""
+
+    def __init__(self, db_path, hash_files=False):
+        self.log_prefix = f"[{self.__class__.__name__}] "
+        self.db_path = db_path
+        self.hash_files = hash_files
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def add(self, keys, format_key, path, sha256=None):
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO files (path, size, mtime, sha256, added) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime = excluded.mtime, "
+                "sha256 = COALESCE(excluded.sha256, CASE WHEN files.size = excluded.size AND files.mtime = excluded.mtime THEN files.sha256 END)",
+                (path, st.st_size, st.st_mtime, sha256, time.time())
+            )
+            self._conn.executemany("INSERT OR IGNORE INTO file_keys (video_key, format_key, path) VALUES (?, ?, ?)",
+                                   [(key, format_key, path) for key in keys])
+
+    def _file_unchanged(self, path, size, mtime):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        return st.st_size == size and abs(st.st_mtime - mtime) < 1
+
+    def _forget(self, paths):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in paths])
+            self._conn.executemany("DELETE FROM file_keys WHERE path = ?", [(path,) for path in paths])
+
+    def lookup(self, keys, format_key):
+        """An indexed file for any of the keys in this format that still exists unchanged, or None. Stale entries are dropped."""
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT f.path, f.size, f.mtime FROM file_keys k JOIN files f ON f.path = k.path "
+                f"WHERE k.video_key IN ({placeholders}) AND k.format_key = ? ORDER BY f.added",
+                (*keys, format_key)
+            ).fetchall()
+        stale = [path for path, size, mtime in rows if not self._file_unchanged(path, size, mtime)]
+        if stale:
+            self._forget(stale)
+        return next((path for path, _, _ in rows if path not in stale), None)
+
+    def set_hash(self, path, sha256):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE files SET sha256 = ? WHERE path = ?", (sha256, os.path.abspath(path)))
+
+    def find_by_hash(self, sha256, size, exclude_path=None):
+        """Another indexed file with this content that still exists unchanged, or None."""
+        with self._lock:
+            rows = self._conn.execute("SELECT path, size, mtime FROM files WHERE sha256 = ? AND size = ? AND path != ? ORDER BY added",
+                                      (sha256, size, os.path.abspath(exclude_path or ""))).fetchall()
+        return next((path for path, size, mtime in rows if self._file_unchanged(path, size, mtime)), None)
+
+    def hash_and_link(self, path):
+        """Stores the SHA-256 of a completed file and hardlinks it to an indexed file with the same content (background thread)."""
+        try:
+            sha256 = file_sha256(path)
+            self.set_hash(path, sha256)
+            same_content = self.find_by_hash(sha256, os.path.getsize(path), exclude_path=path)
+            if same_content and replace_with_hardlink(same_content, path):
+                logging.info(f"{self.log_prefix}{path} has the same content as {same_content}, replaced by a hardlink.")
+                self.add([], "", path, sha256) # 更新 mtime，避免被当作已修改的文件
+        except OSError as e:
+            logging.warning(f"{self.log_prefix}Could not hash {path}: {e}")
+
+
+class DedupeLinkWorker(QThread):
+    """Satisfies a task from an indexed file instead of downloading. Used as the task's worker (same finished_signal)."""
+    finished_signal = pyqtSignal(str, str) # task_id, target path / "暂停" / DEDUPE_FALLBACK
+
+    def __init__(self, task_id, source_path, target_path):
+        super().__init__()
+        self.task_id = task_id
+        self.source_path = source_path
+        self.target_path = target_path
+        self.limit_rate = None
+        self.method = None
+        self._stopped = False
+        self.setObjectName(f"DedupeLink_{task_id}")
+
+    def stop(self):
+        self._stopped = True
+
+    def suspend(self):
+        return False # 没有可挂起的进程: 暂停时直接停止
+
+    def resume(self):
+        return False
+
+    def run(self):
+        try:
+            self.method = materialize(self.source_path, self.target_path, stop_check=lambda: self._stopped)
+        except InterruptedError:
+            self.finished_signal.emit(self.task_id, "暂停")
+            return
+        except OSError as e:
+            logging.warning(f"Task {self.task_id}: could not reuse {self.source_path}: {e}; downloading instead.")
+            self.finished_signal.emit(self.task_id, DEDUPE_FALLBACK)
+            return
+        logging.info(f"Task {self.task_id}: reused {self.source_path} -> {self.target_path} ({self.method}).")
+        self.finished_signal.emit(self.task_id, self.target_path)
+
+
+def dedupe_library(directories, file_index=None, stop_check=None, min_size=MIN_LIBRARY_FILE_BYTES):
+    """
+    Replaces files with identical content under the given directories by hardlinks to one copy.
+    Only files of equal size are hashed. Returns (files replaced, bytes saved).
+    """
+    by_size = {}
+    for directory in directories:
+        for root, _, names in os.walk(directory):
+            for name in names:
+                if name.endswith((".part", ".ytdl", ".tmp")): continue # 未完成的下载
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path, follow_symlinks=False)
+                except OSError:
+                    continue
+                if st.st_size >= min_size and os.path.isfile(path) and not os.path.islink(path):
+                    by_size.setdefault(st.st_size, {}).setdefault((st.st_dev, st.st_ino), path) # 已是硬链接的只算一次
+    replaced = saved = 0
+    for size, files in by_size.items():
+        if len(files) < 2: continue
+        by_hash = {}
+        for path in files.values():
+            if stop_check and stop_check(): return replaced, saved
+            try:
+                sha256 = file_sha256(path, stop_check)
+            except OSError as e:
+                logging.warning(f"Could not hash {path}: {e}")
+                continue
+            if sha256 is None: return replaced, saved
+            if file_index:
+                file_index.set_hash(path, sha256)
+            keep_path = by_hash.setdefault(sha256, path)
+            if keep_path == path: continue
+            try:
+                if replace_with_hardlink(keep_path, path):
+                    replaced += 1
+                    saved += size
+                    logging.info(f"Deduplicated {path} -> {keep_path}")
+            except OSError as e:
+                logging.warning(f"Could not replace {path} by a hardlink: {e}")
+    return replaced, saved
+
+
+class LibraryDedupeJob(QThread):
+    """Runs dedupe_library() in the background."""
+    finished_signal = pyqtSignal(int, int) # files replaced, bytes saved
+
+    def __init__(self, directories, file_index=None, parent=None):
+        super().__init__(parent)
+        self.directories = directories
+        self.file_index = file_index
+        self._stopped = False
+        self.setObjectName("LibraryDedupe")
+
+    def stop(self):
+        self._stopped = True
+
+    def run(self):
+        logging.info(f"Deduplicating {', '.join(self.directories)}...")
+        replaced, saved = dedupe_library(self.directories, self.file_index, stop_check=lambda: self._stopped)
+        logging.info(f"Library deduplication {'cancelled' if self._stopped else 'finished'}: "
+                     f"{replaced} files replaced by hardlinks, {saved / 1024 ** 2:.1f} MiB saved.")
+        self.finished_signal.emit(replaced, saved)
+
+
+def add_dedupe_arguments(parser):
+    """Adds the deduplication options shared by main_app.py and cli_app.py."""
+    parser.add_argument("--no-dedupe", action="store_true",
+                        help="不使用已完成文件的索引 (默认: 同一视频同一格式已下载过时，直接硬链接/复制已有文件)")
+    parser.add_argument("--dedupe-hash", action="store_true",
+                        help="计算完成文件的 SHA-256，内容相同的文件替换为硬链接")
+    parser.add_argument("--dedupe-library", nargs="+", default=[], metavar="DIR",
+                        help="在后台把这些目录中内容相同的文件替换为硬链接")
+    parser.add_argument("--file-index", default=None, metavar="PATH",
+                        help=f"已完成文件的索引数据库 (默认: 数据目录下的 {FILE_INDEX_FILE_NAME})")
+
+
+def open_file_index_from_args(args):
+    """The FileIndex for the --dedupe-*/--file-index options, or None with --no-dedupe. Raises sqlite3.Error/OSError."""
+    if args.no_dedupe:
+        return None
+    return FileIndex(args.file_index or os.path.join(get_app_data_dir(), FILE_INDEX_FILE_NAME), hash_files=args.dedupe_hash)
@@ -0,0 +1,156 @@
+# host_pacing.py
+"""
+Per-host adaptive pacing. When a host throttles (HTTP 429, or a download stopped by the stall
+watchdog), HostPacer halves the number of tasks it lets run against that host and spaces out
+their starts with a growing delay (AIMD). While the host stays quiet the limit grows back by
+one and the delay halves every --host-recover-seconds, until the host is unrestricted again.
+Queued tasks for other hosts keep starting in the meantime.
+"""
+import time
+import logging
+from urllib.parse import urlsplit
+from PyQt5.QtCore import QObject, QTimer
+
+from task_state import STATE_RUNNING
+from retry_policy import classify_task_failure
+
+DEFAULT_PACING_DELAY_SECONDS = 5
+DEFAULT_MAX_PACING_DELAY_SECONDS = 120
+DEFAULT_RECOVER_SECONDS = 60
+CHECK_INTERVAL_MS = 1000
+THROTTLE_CATEGORIES = ("rate_limited",)
+
+
+def host_of(url):
+    """'https://www.Example.com:8080/x' -> 'example.com' (the key hosts are paced by)."""
+    try:
+        host = (urlsplit(url or "").hostname or "").lower()
+    except ValueError:
+        return ""
+    return host[4:] if host.startswith("www.") else host
+
+
+class HostHealth:
+    def __init__(self, limit, now):
+        self.limit = limit        # 同时运行的任务数上限
+        self.delay = 0.0          # 两次启动之间的间隔秒数
+        self.next_start = 0.0     # time.monotonic()
+        self.recovered_at = now   # 上次限流或恢复一步的时间
+
+    def describe(self):
+        return f"{self.limit} 个, 间隔 {self.delay:.0f}s" if self.delay else f"{self.limit} 个"
+
+
+class HostPacer(QObject):
+    """Start filter for TaskEngine that limits and spaces out tasks per host after throttling signals."""
+
+    def __init__(self, engine, base_delay=DEFAULT_PACING_DELAY_SECONDS, max_delay=DEFAULT_MAX_PACING_DELAY_SECONDS,
+                 recover_seconds=DEFAULT_RECOVER_SECONDS, clock=time.monotonic, parent=None):
+        super().__init__(parent)
+        self.log_prefix = f"[{self.__class__.__name__}] "
+        self.engine = engine
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.recover_seconds = recover_seconds
+        self.clock = clock
+        self.hosts = {} # host: HostHealth (只包含受限制的主机)
+
+        self.engine.task_error.connect(self.on_task_error)
+        self.engine.task_stalled.connect(self.on_task_stalled)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(CHECK_INTERVAL_MS)
+        self.timer.timeout.connect(self.recover)
+
+    def start(self):
+        self.engine.start_filters.append(self._may_start)
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+        if self._may_start in self.engine.start_filters:
+            self.engine.start_filters.remove(self._may_start)
+        self.hosts.clear()
+
+    def describe(self):
+        return ", ".join(f"{host} ({health.describe()})" for host, health in sorted(self.hosts.items()))
+
+    def _running_count(self, host):
+        return sum(1 for task_id in self.engine.task_states.ids(STATE_RUNNING)
+                   if host_of(self.engine.tasks.get(task_id, {}).get("url")) == host)
+
+    def _may_start(self, task_id, task_data):
+        health = self.hosts.get(host_of(task_data.get("url")))
+        if health is None: return True
+        now = self.clock()
+        if now < health.next_start or self._running_count(host_of(task_data.get("url"))) >= health.limit:
+            return False
+        health.next_start = now + health.delay
+        return True
+
+    def on_task_error(self, task_id, error_msg):
+        if classify_task_failure(error_msg, self.engine.task_output(task_id, max_lines=50)) in THROTTLE_CATEGORIES:
+            self.throttle(host_of(self.engine.tasks.get(task_id, {}).get("url")), "HTTP 429", stopped_tasks=1)
+
+    def on_task_stalled(self, task_id, reason):
+        self.throttle(host_of(self.engine.tasks.get(task_id, {}).get("url")), f"下载停滞 ({reason})")
+
+    def throttle(self, host, reason, stopped_tasks=0):
+        """
+        Multiplicative decrease: halves the host's concurrency and doubles its start delay.
+        stopped_tasks: tasks of the host that were running when throttled but have already ended.
+        """
+        if not host: return
+        now = self.clock()
+        health = self.hosts.get(host)
+        if health is None:
+            health = self.hosts[host] = HostHealth(self._running_count(host) + stopped_tasks, now) # 从实际运行数开始减半
+        health.limit = max(1, health.limit // 2)
+        health.delay = min(self.max_delay, max(self.base_delay, health.delay * 2))
+        health.next_start = max(health.next_start, now + health.delay)
+        health.recovered_at = now
+        logging.warning(f"{self.log_prefix}{host} throttled ({reason}): at most {health.limit} task(s), "
+                        f"{health.delay:.0f}s between starts.")
+
+    def recover(self):
+        """
+        Additive increase: one more task and half the delay per quiet recover_seconds. A host without a delay is
+        dropped once its limit is above the tasks it runs (or reaches the engine's cap): the limit no longer binds.
+        """
+        now = self.clock()
+        cap = self.engine.effective_max_concurrent()
+        for host, health in list(self.hosts.items()):
+            if now - health.recovered_at < self.recover_seconds: continue
+            health.recovered_at = now
+            health.limit += 1
+            health.delay = health.delay / 2 if health.delay / 2 >= 1 else 0.0
+            # "不限" 并发时上限很大 (999999)，不能等限制数增长到上限
+            if health.delay == 0 and (not cap or health.limit >= cap or health.limit > self._running_count(host)):
+                del self.hosts[host]
+                logging.info(f"{self.log_prefix}{host} recovered, no longer paced.")
+            else:
+                logging.info(f"{self.log_prefix}{host} recovering: at most {health.limit} task(s), {health.delay:.0f}s between starts.")
+
+
+def add_host_pacing_arguments(parser):
+    """Adds the --host-* pacing options shared by main_app.py and cli_app.py."""
+    parser.add_argument("--no-host-pacing", action="store_true",
+                        help="主机限流 (429、下载停滞) 时不降低该主机的并发数和启动频率")
+    parser.add_argument("--host-pacing-delay", type=float, default=DEFAULT_PACING_DELAY_SECONDS, metavar="SECONDS",
+                        help=f"主机首次限流后同一主机两次启动之间的间隔，再次限流时加倍 (默认: {DEFAULT_PACING_DELAY_SECONDS})")
+    parser.add_argument("--host-pacing-max-delay", type=float, default=DEFAULT_MAX_PACING_DELAY_SECONDS, metavar="SECONDS",
+                        help=f"启动间隔的上限 (默认: {DEFAULT_MAX_PACING_DELAY_SECONDS})")
+    parser.add_argument("--host-recover-seconds", type=float, default=DEFAULT_RECOVER_SECONDS, metavar="SECONDS",
+                        help=f"主机多久没有限流后并发数加一、间隔减半 (默认: {DEFAULT_RECOVER_SECONDS})")
+
+
+def start_host_pacer_from_args(engine, args, parent=None):
+    """Creates and starts the HostPacer unless --no-host-pacing is given. Raises ValueError."""
+    if args.no_host_pacing:
+        return None
+    if args.host_pacing_delay < 0 or args.host_pacing_max_delay < 0 or args.host_recover_seconds <= 0:
+        raise ValueError("--host-pacing-delay/--host-pacing-max-delay 不能为负数，--host-recover-seconds 必须大于 0")
+    pacer = HostPacer(engine, base_delay=args.host_pacing_delay, max_delay=args.host_pacing_max_delay,
+                      recover_seconds=args.host_recover_seconds, parent=parent)
+    pacer.start()
+    return pacer
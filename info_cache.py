@@ -0,0 +1,77 @@
+# info_cache.py
+import os
+import re
+import time
+import hashlib
+import logging
+
+from url_import import canonical_url
+
+INFO_JSON_SUFFIX = ".info.json"
+MAX_INFO_AGE_SECONDS = 3 * 3600  # 超过此时间的信息不再使用 (大多数网站的签名链接几小时内过期)
+EXPIRY_MARGIN_SECONDS = 10 * 60  # 签名链接剩余有效期少于此值时重新解析
+_EXPIRE_PATTERN = re.compile(rb'[?&/]expire[=/](\d{10})\b') # YouTube 等网站格式链接中的过期时间戳
+
+
+def info_json_path(directory, url):
+    """Where the info JSON of url is kept (one file per canonical URL)."""
+    digest = hashlib.sha1(canonical_url(url).encode("utf-8")).hexdigest()[:20]
+    return os.path.join(directory, digest + INFO_JSON_SUFFIX)
+
+
+def write_info_json(path, text):
+    """Writes yt-dlp -J output atomically; errors are logged, the cache is only an optimization."""
+    tmp_path = path + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.warning(f"Could not write info JSON {path}: {e}")
+
+
+def usable_info_json(path, now=None):
+    """True if path exists, is recent, and none of its signed format URLs expires soon."""
+    now = now or time.time()
+    try:
+        if now - os.path.getmtime(path) > MAX_INFO_AGE_SECONDS:
+            return False
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return False
+    expiries = [int(match) for match in _EXPIRE_PATTERN.findall(data)]
+    return not expiries or min(expiries) - EXPIRY_MARGIN_SECONDS > now
+
+
+def remove_info_jsons(directory, urls):
+    for url in urls:
+        try:
+            os.remove(info_json_path(directory, url))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Could not remove info JSON for {url}: {e}")
+
+
+def prune_info_cache(directory, max_age_seconds=MAX_INFO_AGE_SECONDS):
+    """Deletes info JSON files too old to be used (run in a background thread at startup)."""
+    cutoff = time.time() - max_age_seconds
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return
+    except OSError as e:
+        logging.warning(f"Could not list info JSON directory {directory}: {e}")
+        return
+    removed = 0
+    for entry in entries:
+        try:
+            if entry.name.endswith((INFO_JSON_SUFFIX, ".tmp")) and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            pass
+    if removed:
+        logging.info(f"Removed {removed} expired info JSON files from {directory}")
@@ -0,0 +1,202 @@
+# logging_setup.py
+import sys
+import os
+import time
+import queue
+import atexit
+import argparse
+import logging
+import logging.handlers
+import threading
+
+from constants import LOG_FILE_NAME, get_app_data_dir, get_yt_dlp_executable_path, get_executable_path, get_tool_version
+
+LOG_QUEUE_SIZE = 10000 # 写入线程跟不上时丢弃日志，而不是阻塞界面/读取线程
+DEFAULT_RATE_LIMIT = 50 # 同一调用位置在一个时间窗口内最多输出的 DEBUG/INFO 日志条数 (0 = 不限制)
+RATE_LIMIT_WINDOW_SECONDS = 10
+
+log_file_path_global = ""
+_queue_listener = None
+
+
+class SubsystemLevelFilter(logging.Filter):
+    """Per-subsystem minimum levels; a subsystem is the module that logged (workers, task_engine, gui_manager, ...)."""
+
+    def __init__(self, levels):
+        super().__init__()
+        self.levels = dict(levels)
+
+    def filter(self, record):
+        level = self.levels.get(record.module)
+        return level is None or record.levelno >= level
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most `limit` DEBUG/INFO records per call site through in each time window; warnings
+    and errors always pass. The number of suppressed records is appended to the first record
+    of the next window.
+    """
+
+    def __init__(self, limit=DEFAULT_RATE_LIMIT, window_seconds=RATE_LIMIT_WINDOW_SECONDS):
+        super().__init__()
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self._sites = {} # (pathname, lineno): [窗口开始时间, 本窗口内的条数]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is not None and now - site[0] < self.window_seconds:
+                site[1] += 1
+                return site[1] <= self.limit
+            suppressed = site[1] - self.limit if site is not None and site[1] > self.limit else 0
+            self._sites[key] = [now, 1]
+        if suppressed:
+            record.msg = f"{record.getMessage()} (此前 {self.window_seconds}s 内另有 {suppressed} 条同类日志被省略)"
+            record.args = None
+        return True
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the caller: records are dropped (and counted) while the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped_count = 0 # 只在 handler 锁内修改 (Handler.handle 持有 self.lock 调用 emit)
+
+    def enqueue(self, record):
+        if self.dropped_count:
+            notice = logging.LogRecord("root", logging.WARNING, __file__, 0,
+                                       f"日志写入跟不上，已丢弃 {self.dropped_count} 条日志", None, None)
+            try:
+                self.queue.put_nowait(notice)
+                self.dropped_count = 0
+            except queue.Full:
+                pass
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_count += 1
+
+
+def parse_subsystem_level(text):
+    """'workers=INFO' -> ('workers', logging.INFO). Used as an argparse type."""
+    name, sep, level_name = text.partition("=")
+    level = logging.getLevelName(level_name.strip().upper()) if sep else None
+    if not name.strip() or not isinstance(level, int):
+        raise argparse.ArgumentTypeError(f"格式应为 模块=级别，例如 workers=INFO (收到: {text})")
+    return name.strip(), level
+
+
+def add_logging_arguments(parser):
+    """Adds the --log-* options shared by main_app.py and cli_app.py."""
+    parser.add_argument("--log-level", dest="log_levels", action="append", default=[], type=parse_subsystem_level,
+                        metavar="MODULE=LEVEL", help="按模块设置日志级别，可重复，例如 --log-level workers=INFO --log-level task_engine=WARNING")
+    parser.add_argument("--log-rate-limit", type=int, default=DEFAULT_RATE_LIMIT,
+                        help=f"同一位置每 {RATE_LIMIT_WINDOW_SECONDS} 秒最多记录的 DEBUG/INFO 日志条数，0 为不限制 (默认: {DEFAULT_RATE_LIMIT})")
+    parser.add_argument("--log-sync", action="store_true", help="在调用线程中同步写日志 (默认由后台线程写入)")
+
+
+def logging_options_from_args(args):
+    """setup_logging() keyword arguments for the add_logging_arguments options."""
+    return {"queued": not args.log_sync, "subsystem_levels": dict(args.log_levels), "rate_limit": args.log_rate_limit}
+
+
+def setup_logging(log_file_name=LOG_FILE_NAME, console_level=logging.INFO, console_stream=None,
+                  queued=True, subsystem_levels=None, rate_limit=DEFAULT_RATE_LIMIT):
+    """
+    配置日志系统 (界面和命令行共用，本模块不依赖任何 Qt 组件)
+    queued=True 时调用方只把日志放入队列，文件和控制台由后台线程写入。
+    """
+    global log_file_path_global, _queue_listener
+
+    app_data_dir = get_app_data_dir()
+    log_file_path_global = os.path.join(app_data_dir, log_file_name)
+    if not os.path.exists(app_data_dir):
+        try:
+            os.makedirs(app_data_dir, exist_ok=True)
+        except Exception as e:
+            print(f"CRITICAL: Failed to create log directory {app_data_dir} from logging_setup.py: {e}")
+
+    shutdown_logging() # 重复调用时先停止之前的写入线程
+    logger = logging.getLogger()
+    logger.setLevel(logging.DEBUG)
+
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+        handler.close()
+
+    output_handlers = []
+    try:
+        fh = logging.handlers.RotatingFileHandler(
+            log_file_path_global, maxBytes=5*1024*1024, backupCount=5, encoding='utf-8'
+        )
+        fh.setLevel(logging.DEBUG)
+        formatter_file = logging.Formatter(
+            '%(asctime)s - %(levelname)s - [%(threadName)s:%(thread)d] - %(name)s.%(funcName)s:%(lineno)d - %(message)s'
+        )
+        fh.setFormatter(formatter_file)
+        output_handlers.append(fh)
+    except Exception as e:
+        print(f"CRITICAL: Error setting up file logger to {log_file_path_global}: {e}")
+
+    ch = logging.StreamHandler(console_stream or sys.stdout)
+    ch.setLevel(console_level)
+    formatter_console = logging.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+    ch.setFormatter(formatter_console)
+    output_handlers.append(ch)
+
+    # 过滤在调用线程中进行，被过滤掉的日志不会进入队列
+    filters = []
+    if subsystem_levels:
+        filters.append(SubsystemLevelFilter(subsystem_levels))
+    if rate_limit:
+        filters.append(RateLimitFilter(rate_limit))
+
+    if queued:
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+        _queue_listener = logging.handlers.QueueListener(log_queue, *output_handlers, respect_handler_level=True)
+        _queue_listener.start()
+        front_handlers = [_DroppingQueueHandler(log_queue)]
+    else:
+        front_handlers = output_handlers
+    for handler in front_handlers:
+        for log_filter in filters:
+            handler.addFilter(log_filter)
+        logger.addHandler(handler)
+
+    logging.info(f"日志系统已启动。日志文件路径: {log_file_path_global} ({'后台线程写入' if queued else '同步写入'})")
+    if subsystem_levels:
+        logging.info(f"按模块设置的日志级别: { {name: logging.getLevelName(level) for name, level in subsystem_levels.items()} }")
+    logging.info(f"APPLICATION_DATA_DIRECTORY from constants: {app_data_dir}")
+    # 工具路径和版本在后台解析 (通常命中 tool_cache.json)，不拖慢启动
+    threading.Thread(target=_log_tool_versions, name="ToolVersions", daemon=True).start()
+
+
+def shutdown_logging():
+    """Stops the background writer after flushing queued records. Safe to call more than once."""
+    global _queue_listener
+    if _queue_listener is not None:
+        listener, _queue_listener = _queue_listener, None
+        try:
+            listener.stop() # 处理完队列中剩余的日志后返回
+        except queue.Full:
+            pass # 队列已满放不下结束标记；写入线程是守护线程，随进程退出
+
+
+atexit.register(shutdown_logging)
+
+
+def _log_tool_versions():
+    try:
+        logging.info(f"yt-dlp: {get_yt_dlp_executable_path()} (version: {get_tool_version('yt-dlp') or 'unknown'})")
+        for tool_name in ('ffmpeg', 'ffprobe'):
+            logging.info(f"{tool_name}: {get_executable_path(tool_name)} (version: {get_tool_version(tool_name) or 'unknown'})")
+    except Exception as e:
+        logging.debug(f"Could not resolve tool versions: {e}")
@@ -1,64 +1,45 @@
 # main_app.py
 import sys
-import os
+import argparse
+import sqlite3
 import logging
-import logging.handlers
 import faulthandler
+import multiprocessing
 from PyQt5.QtWidgets import QApplication, QMessageBox
-from PyQt5.QtCore import Qt, QDateTime
+from PyQt5.QtCore import Qt
 
 from gui_manager import DownloadManager
-# MODIFIED LINE: Added YT_DLP_EXECUTABLE_PATH to the import
-from constants import LOG_FILE_NAME, APPLICATION_DATA_DIRECTORY, YT_DLP_EXECUTABLE_PATH
-
-log_file_path_global = ""
-
-def setup_logging():
-    """配置日志系统"""
-    global log_file_path_global
-
-    log_file_path_global = os.path.join(APPLICATION_DATA_DIRECTORY, LOG_FILE_NAME)
-    if not os.path.exists(APPLICATION_DATA_DIRECTORY):
-        try:
-            os.makedirs(APPLICATION_DATA_DIRECTORY, exist_ok=True)
-        except Exception as e:
-            print(f"CRITICAL: Failed to create log directory {APPLICATION_DATA_DIRECTORY} from main_app.py: {e}")
-
-    logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
-
-    for handler in logger.handlers[:]:
-        logger.removeHandler(handler)
-        handler.close()
-
-    try:
-        fh = logging.handlers.RotatingFileHandler(
-            log_file_path_global, maxBytes=5*1024*1024, backupCount=5, encoding='utf-8'
-        )
-        fh.setLevel(logging.DEBUG)
-        formatter_file = logging.Formatter(
-            '%(asctime)s - %(levelname)s - [%(threadName)s:%(thread)d] - %(name)s.%(funcName)s:%(lineno)d - %(message)s'
-        )
-        fh.setFormatter(formatter_file)
-        logger.addHandler(fh)
-    except Exception as e:
-        print(f"CRITICAL: Error setting up file logger to {log_file_path_global}: {e}")
-
-    ch = logging.StreamHandler(sys.stdout)
-    ch.setLevel(logging.INFO)
-    formatter_console = logging.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s')
-    ch.setFormatter(formatter_console)
-    logger.addHandler(ch)
-
-    logging.info(f"日志系统已启动。日志文件路径: {log_file_path_global}")
-    # This line should now work as YT_DLP_EXECUTABLE_PATH is imported globally in this file
-    logging.info(f"YT_DLP_EXECUTABLE_PATH from constants: {YT_DLP_EXECUTABLE_PATH}")
-    logging.info(f"APPLICATION_DATA_DIRECTORY from constants: {APPLICATION_DATA_DIRECTORY}")
+from logging_setup import setup_logging, add_logging_arguments, logging_options_from_args
+from control_api import ControlApiServer, add_control_api_arguments
+from metrics import add_metrics_arguments, start_metrics_from_args
+from tracing import TaskTracer, add_tracing_arguments
+from subscriptions import add_subscription_arguments
+from scheduler import TaskScheduler, ScheduleError, add_scheduler_arguments, load_schedule_from_args
+from postprocess import add_postprocess_arguments
+from transcode import add_transcode_arguments, configure_transcode_from_args
+from stall_watchdog import add_stall_arguments, start_stall_watchdog_from_args
+from retry_policy import add_retry_arguments, start_retry_scheduler_from_args
+from host_pacing import add_host_pacing_arguments, start_host_pacer_from_args
+from file_index import LibraryDedupeJob, add_dedupe_arguments, open_file_index_from_args
 
 
 def main():
     faulthandler.enable()
-    setup_logging()
+    arg_parser = argparse.ArgumentParser(prog="main_app.py", description="yt-dlp 下载助手")
+    add_logging_arguments(arg_parser)
+    add_control_api_arguments(arg_parser)
+    add_metrics_arguments(arg_parser)
+    add_tracing_arguments(arg_parser)
+    add_scheduler_arguments(arg_parser)
+    add_subscription_arguments(arg_parser)
+    add_postprocess_arguments(arg_parser)
+    add_transcode_arguments(arg_parser)
+    add_stall_arguments(arg_parser)
+    add_retry_arguments(arg_parser)
+    add_host_pacing_arguments(arg_parser)
+    add_dedupe_arguments(arg_parser)
+    args, qt_argv = arg_parser.parse_known_args(sys.argv[1:]) # 其余参数交给 Qt
+    setup_logging(**logging_options_from_args(args))
 
     QApplication.setApplicationName("ytdow")
     if hasattr(Qt, 'AA_EnableHighDpiScaling'):
@@ -66,7 +47,7 @@ def main():
     if hasattr(Qt, 'AA_UseHighDpiPixmaps'):
         QApplication.setAttribute(Qt.AA_UseHighDpiPixmaps, True)
 
-    app = QApplication(sys.argv)
+    app = QApplication(sys.argv[:1] + qt_argv)
 
     # Optional: Check if yt-dlp is actually found, though constants.py handles the path.
     # import shutil
@@ -79,8 +60,70 @@ def main():
     logging.info("================ Application starting ================")
     exit_code = 0
     try:
-        window = DownloadManager()
+        window = DownloadManager(subscriptions_file=args.subscriptions, max_probes=args.max_probes)
+        window.engine.postprocess.set_max_concurrent(args.postprocess_workers)
+        window.engine.postprocess.timeout_seconds = args.postprocess_timeout
+        try:
+            window.engine.file_index = open_file_index_from_args(args)
+        except (sqlite3.Error, OSError) as e:
+            logging.error(f"无法打开已完成文件索引: {e}")
+            QMessageBox.warning(window, "文件索引", f"无法打开已完成文件索引，不进行去重:\n{e}")
+        if args.dedupe_library:
+            library_job = LibraryDedupeJob(args.dedupe_library, window.engine.file_index, parent=window)
+            app.aboutToQuit.connect(lambda: (library_job.stop(), library_job.wait()))
+            library_job.start()
+        try:
+            configure_transcode_from_args(window.engine.transcode, args)
+        except ValueError as e:
+            logging.error(str(e))
+            QMessageBox.warning(window, "转码设置", str(e))
         window.show()
+        if args.api_port is not None:
+            control_api = ControlApiServer(window.engine, host=args.api_host, port=args.api_port, token=args.api_token, parent=window)
+            try:
+                control_api.start()
+                app.aboutToQuit.connect(control_api.stop)
+            except OSError as e:
+                logging.error(f"无法启动控制接口 {args.api_host}:{args.api_port}: {e}")
+                QMessageBox.warning(window, "控制接口", f"无法启动控制接口 {args.api_host}:{args.api_port}:\n{e}")
+        try:
+            metrics_collector, metrics_server = start_metrics_from_args(window.engine, args, parent=window)
+            if metrics_server:
+                app.aboutToQuit.connect(metrics_server.stop)
+            if metrics_collector:
+                app.aboutToQuit.connect(metrics_collector.stop)
+        except OSError as e:
+            logging.error(f"无法启动指标接口 {args.metrics_host}:{args.metrics_port}: {e}")
+            QMessageBox.warning(window, "运行指标", f"无法启动指标接口 {args.metrics_host}:{args.metrics_port}:\n{e}")
+        try:
+            schedule = load_schedule_from_args(args)
+        except (OSError, ScheduleError) as e:
+            logging.error(f"无法加载时段规则: {e}")
+            QMessageBox.warning(window, "时段规则", f"无法加载时段规则，按当前设置运行:\n{e}")
+            schedule = None
+        if schedule:
+            task_scheduler = TaskScheduler(window.engine, schedule, parent=window)
+            task_scheduler.window_changed.connect(window.on_schedule_window_changed)
+            task_scheduler.start()
+        try:
+            start_stall_watchdog_from_args(window.engine, args, parent=window)
+        except ValueError as e:
+            logging.error(str(e))
+            QMessageBox.warning(window, "停滞检测", f"停滞检测设置无效，已关闭:\n{e}")
+        try:
+            start_retry_scheduler_from_args(window.engine, args, parent=window)
+        except ValueError as e:
+            logging.error(str(e))
+            QMessageBox.warning(window, "自动重试", f"自动重试设置无效，已关闭:\n{e}")
+        try:
+            start_host_pacer_from_args(window.engine, args, parent=window)
+        except ValueError as e:
+            logging.error(str(e))
+            QMessageBox.warning(window, "主机限流", f"主机限流设置无效，已关闭:\n{e}")
+        if args.trace_file:
+            tracer = TaskTracer(window.engine, parent=window)
+            # closeEvent 已暂停运行中的任务，这里导出的是完整的轨迹
+            app.aboutToQuit.connect(lambda: tracer.export_chrome_trace(args.trace_file))
         exit_code = app.exec_()
         logging.info(f"Application exited with Qt event loop code {exit_code}.")
     except Exception as e:
@@ -104,5 +147,6 @@ def main():
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # 插件工作进程 (plugins.py) 在打包后的程序中也能启动
     # import shutil # Import if using shutil.which in main()
     main()
@@ -0,0 +1,373 @@
+# metrics.py
+import os
+import re
+import json
+import time
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PyQt5.QtCore import QObject, QTimer
+
+from constants import get_app_data_dir, METRICS_DEFAULT_HOST, METRICS_DEFAULT_PORT, METRICS_SNAPSHOT_FILE_NAME
+from task_state import ALL_STATES, STATE_QUEUED, STATE_RUNNING, STATE_DONE
+from workers import TIMING_SPAWN_TO_FIRST_BYTE, TIMING_POSTPROCESS, TIMING_POST_SCRIPT, TIMING_TRANSCODE, TIMING_TRANSCODE_CPU
+from retry_policy import classify_failure
+
+GAUGE_REFRESH_INTERVAL_MS = 1000
+DEFAULT_SNAPSHOT_INTERVAL_SECONDS = 15
+
+# 直方图分桶 (秒)
+FETCH_LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+FIRST_BYTE_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 60)
+POSTPROCESS_BUCKETS = (0.5, 1, 5, 10, 30, 60, 120, 300, 900)
+
+_UNIT_MULTIPLIERS = {
+    "": 1, "B": 1,
+    "K": 1000, "M": 1000 ** 2, "G": 1000 ** 3, "T": 1000 ** 4,
+    "KI": 1024, "MI": 1024 ** 2, "GI": 1024 ** 3, "TI": 1024 ** 4,
+}
+_SIZE_RE = re.compile(r'([0-9]+(?:\.[0-9]+)?)\s*([KMGT]i?)?B', re.IGNORECASE)
+
+
+def parse_byte_size(text):
+    """'1.23MiB/s' -> 1289748.48, '500.00KiB' -> 512000.0, unparseable -> None."""
+    m = _SIZE_RE.search(text or "")
+    if not m: return None
+    return float(m.group(1)) * _UNIT_MULTIPLIERS[(m.group(2) or "").upper()]
+
+
+def parse_total_size(progress_text):
+    """Total size from a yt-dlp progress line ('100% of ~ 12.3MiB at ...'), or None."""
+    m = re.search(r'of\s+~?\s*([0-9.]+\s*[KMGT]?i?B)', progress_text or "", re.IGNORECASE)
+    return parse_byte_size(m.group(1)) if m else None
+
+
+def parse_downloaded_bytes(progress_text):
+    """Bytes downloaded so far from a yt-dlp progress line ('45.0% of 10.00MiB ...'), or None."""
+    m = re.search(r'([0-9.]+)%', progress_text or "")
+    total_size = parse_total_size(progress_text) if m else None
+    if total_size is None: return None
+    try:
+        return float(m.group(1)) / 100.0 * total_size
+    except ValueError:
+        return None
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                self.bucket_counts[i] += 1
+
+    def to_dict(self):
+        return {
+            "count": self.count, "sum": round(self.sum, 6),
+            "avg": round(self.sum / self.count, 6) if self.count else None,
+            "buckets": {str(b): c for b, c in zip(self.buckets, self.bucket_counts)},
+        }
+
+    def render(self, name, lines):
+        for upper_bound, bucket_count in zip(self.buckets, self.bucket_counts):
+            lines.append(f'{name}_bucket{{le="{upper_bound}"}} {bucket_count}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum {self.sum}")
+        lines.append(f"{name}_count {self.count}")
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsCollector(QObject):
+    """
+    Collects queue, throughput and latency metrics from a TaskEngine. Updates happen on
+    the engine's thread; rendering (HTTP scrape threads) reads a copy under a lock.
+    """
+
+    def __init__(self, engine, snapshot_file_path=None, snapshot_interval_seconds=DEFAULT_SNAPSHOT_INTERVAL_SECONDS, parent=None):
+        super().__init__(parent)
+        self.log_prefix = f"[{self.__class__.__name__}] "
+        self.engine = engine
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+        self.fetch_latency = Histogram(FETCH_LATENCY_BUCKETS)
+        self.timings = {
+            TIMING_SPAWN_TO_FIRST_BYTE: Histogram(FIRST_BYTE_BUCKETS),
+            TIMING_POSTPROCESS: Histogram(POSTPROCESS_BUCKETS),
+            TIMING_POST_SCRIPT: Histogram(POSTPROCESS_BUCKETS),
+            TIMING_TRANSCODE: Histogram(POSTPROCESS_BUCKETS),
+            TIMING_TRANSCODE_CPU: Histogram(POSTPROCESS_BUCKETS),
+        }
+        self.fetch_results = {"ok": 0, "error": 0}
+        self.failures_by_category = {}
+        self.stalls_by_reason = {}
+        self.tasks_completed = 0
+        self.bytes_completed = 0.0
+        self._last_state = {} # task_id: 上次看到的状态，用于统计完成次数
+        self._task_sizes = {} # task_id: 下载中从进度行解析出的总大小 (完成后进度文本会被改写为 "100%")
+
+        # 由引擎线程定时刷新的瞬时值
+        self._gauges = {}
+        self._task_rates = {} # task_id: bytes/s (仅下载中的任务)
+
+        self.engine.fetch_finished.connect(self.on_fetch_finished)
+        self.engine.task_timing.connect(self.on_task_timing)
+        self.engine.task_error.connect(self.on_task_error)
+        self.engine.task_stalled.connect(self.on_task_stalled)
+        self.engine.task_updated.connect(self.on_task_updated)
+        self.engine.tasks_removed.connect(self.on_tasks_removed)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(GAUGE_REFRESH_INTERVAL_MS)
+        self.refresh_timer.timeout.connect(self.refresh_gauges)
+
+        self.snapshot_file_path = snapshot_file_path
+        self.snapshot_timer = QTimer(self)
+        self.snapshot_timer.setInterval(int(snapshot_interval_seconds * 1000))
+        self.snapshot_timer.timeout.connect(self.write_snapshot)
+
+    def start(self):
+        for task_id in self.engine.tasks:
+            self._last_state[task_id] = self.engine.state_of(task_id)
+        self.refresh_gauges()
+        self.refresh_timer.start()
+        if self.snapshot_file_path:
+            self.snapshot_timer.start()
+            logging.info(f"{self.log_prefix}Writing metrics snapshot to {self.snapshot_file_path} every {self.snapshot_timer.interval() // 1000}s")
+
+    def stop(self):
+        self.refresh_timer.stop()
+        self.snapshot_timer.stop()
+        if self.snapshot_file_path:
+            self.refresh_gauges()
+            self.write_snapshot() # 退出前写一次最终值
+
+    # --- 引擎信号 ---
+    def on_fetch_finished(self, url, seconds, ok):
+        with self._lock:
+            self.fetch_latency.observe(seconds)
+            self.fetch_results["ok" if ok else "error"] += 1
+
+    def on_task_timing(self, task_id, phase, seconds):
+        histogram = self.timings.get(phase)
+        if histogram is None: return
+        with self._lock:
+            histogram.observe(seconds)
+
+    def on_task_error(self, task_id, error_msg):
+        category = classify_failure(error_msg)
+        with self._lock:
+            self.failures_by_category[category] = self.failures_by_category.get(category, 0) + 1
+
+    def on_task_stalled(self, task_id, reason):
+        with self._lock:
+            self.stalls_by_reason[reason] = self.stalls_by_reason.get(reason, 0) + 1
+
+    def on_task_updated(self, task_id):
+        new_state = self.engine.state_of(task_id)
+        if new_state == STATE_RUNNING:
+            total_size = parse_total_size(self.engine.tasks.get(task_id, {}).get("progress", ""))
+            if total_size: self._task_sizes[task_id] = total_size
+        old_state = self._last_state.get(task_id)
+        if new_state == old_state: return
+        self._last_state[task_id] = new_state
+        total_size = self._task_sizes.pop(task_id, None) if new_state != STATE_RUNNING else None
+        if new_state == STATE_DONE:
+            with self._lock:
+                self.tasks_completed += 1
+                if total_size: self.bytes_completed += total_size
+
+    def on_tasks_removed(self, task_ids):
+        for task_id in task_ids:
+            self._last_state.pop(task_id, None)
+            self._task_sizes.pop(task_id, None)
+
+    def refresh_gauges(self):
+        engine = self.engine
+        task_rates = {}
+        for task_id in engine.task_states.ids(STATE_RUNNING):
+            rate = parse_byte_size(engine.tasks.get(task_id, {}).get("speed", ""))
+            task_rates[task_id] = rate or 0.0
+        gauges = {
+            "active_workers": engine.active_workers,
+            "max_concurrent": engine.max_concurrent,
+            "queue_length": engine.task_states.count(STATE_QUEUED),
+            "fetch_queue_length": engine.pending_fetch_count(),
+            "tasks_total": len(engine.tasks),
+            "tasks_by_state": engine.task_states.counts(),
+            "download_rate_bytes": sum(task_rates.values()),
+        }
+        with self._lock:
+            self._gauges = gauges
+            self._task_rates = task_rates
+
+    # --- 输出 ---
+    def snapshot(self):
+        with self._lock:
+            return {
+                "time": time.time(),
+                "uptime_seconds": round(time.time() - self.started_at, 3),
+                **self._gauges,
+                "task_download_rate_bytes": dict(self._task_rates),
+                "tasks_completed_total": self.tasks_completed,
+                "bytes_completed_total": self.bytes_completed,
+                "fetch_total": dict(self.fetch_results),
+                "failures_by_category": dict(self.failures_by_category),
+                "stalls_by_reason": dict(self.stalls_by_reason),
+                "fetch_latency_seconds": self.fetch_latency.to_dict(),
+                "timings_seconds": {phase: histogram.to_dict() for phase, histogram in self.timings.items()},
+            }
+
+    def write_snapshot(self):
+        if not self.snapshot_file_path: return
+        temp_path = self.snapshot_file_path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.snapshot_file_path) # 原子替换，读取方不会看到写了一半的文件
+        except OSError as e:
+            logging.error(f"{self.log_prefix}Error writing metrics snapshot to {self.snapshot_file_path}: {e}")
+
+    def render_prometheus(self):
+        with self._lock:
+            gauges = dict(self._gauges)
+            task_rates = dict(self._task_rates)
+            lines = []
+
+            def metric(name, metric_type, help_text):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+
+            metric("ytdow_active_workers", "gauge", "Download workers currently running.")
+            lines.append(f"ytdow_active_workers {gauges.get('active_workers', 0)}")
+            metric("ytdow_max_concurrent", "gauge", "Configured maximum concurrent downloads.")
+            lines.append(f"ytdow_max_concurrent {gauges.get('max_concurrent', 0)}")
+            metric("ytdow_queue_length", "gauge", "Tasks waiting in the download queue.")
+            lines.append(f"ytdow_queue_length {gauges.get('queue_length', 0)}")
+            metric("ytdow_fetch_queue_length", "gauge", "URLs waiting to be resolved.")
+            lines.append(f"ytdow_fetch_queue_length {gauges.get('fetch_queue_length', 0)}")
+            metric("ytdow_tasks", "gauge", "Tasks by state.")
+            for state in ALL_STATES:
+                lines.append(f'ytdow_tasks{{state="{state}"}} {gauges.get("tasks_by_state", {}).get(state, 0)}')
+            metric("ytdow_download_rate_bytes", "gauge", "Aggregate download rate in bytes per second.")
+            lines.append(f"ytdow_download_rate_bytes {gauges.get('download_rate_bytes', 0.0)}")
+            metric("ytdow_task_download_rate_bytes", "gauge", "Per-task download rate in bytes per second.")
+            for task_id, rate in sorted(task_rates.items()):
+                lines.append(f'ytdow_task_download_rate_bytes{{task_id="{_escape_label(task_id)}"}} {rate}')
+            metric("ytdow_tasks_completed_total", "counter", "Tasks completed since start.")
+            lines.append(f"ytdow_tasks_completed_total {self.tasks_completed}")
+            metric("ytdow_completed_bytes_total", "counter", "Size of completed downloads (from yt-dlp progress) since start.")
+            lines.append(f"ytdow_completed_bytes_total {self.bytes_completed}")
+            metric("ytdow_fetch_total", "counter", "URL resolve attempts by result.")
+            for result, count in self.fetch_results.items():
+                lines.append(f'ytdow_fetch_total{{result="{result}"}} {count}')
+            metric("ytdow_task_failures_total", "counter", "Task failures by category.")
+            for category, count in sorted(self.failures_by_category.items()):
+                lines.append(f'ytdow_task_failures_total{{category="{category}"}} {count}')
+            metric("ytdow_task_stalls_total", "counter", "Downloads stopped by the stall watchdog, by reason (no_progress/slow).")
+            for reason, count in sorted(self.stalls_by_reason.items()):
+                lines.append(f'ytdow_task_stalls_total{{reason="{reason}"}} {count}')
+            metric("ytdow_fetch_latency_seconds", "histogram", "Time to resolve one input URL with yt-dlp -J.")
+            self.fetch_latency.render("ytdow_fetch_latency_seconds", lines)
+            metric("ytdow_spawn_to_first_byte_seconds", "histogram", "Time from starting yt-dlp to its first download progress.")
+            self.timings[TIMING_SPAWN_TO_FIRST_BYTE].render("ytdow_spawn_to_first_byte_seconds", lines)
+            metric("ytdow_postprocess_seconds", "histogram", "yt-dlp post-processing (merge/extract/convert) duration.")
+            self.timings[TIMING_POSTPROCESS].render("ytdow_postprocess_seconds", lines)
+            metric("ytdow_post_script_seconds", "histogram", "User post-processing script duration.")
+            self.timings[TIMING_POST_SCRIPT].render("ytdow_post_script_seconds", lines)
+            metric("ytdow_transcode_seconds", "histogram", "Duration of one ffmpeg job in the transcode stage.")
+            self.timings[TIMING_TRANSCODE].render("ytdow_transcode_seconds", lines)
+            metric("ytdow_transcode_cpu_seconds", "histogram", "CPU time (user + system) used by one ffmpeg job in the transcode stage.")
+            self.timings[TIMING_TRANSCODE_CPU].render("ytdow_transcode_cpu_seconds", lines)
+        return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    collector = None # 由 MetricsServer.start 绑定
+
+    def log_message(self, format, *args):
+        logging.debug(f"[MetricsServer] {self.address_string()} {format % args}")
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            body = self.collector.render_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif path == "/metrics.json":
+            body = json.dumps(self.collector.snapshot(), ensure_ascii=False).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer:
+    """Serves /metrics (Prometheus text format) and /metrics.json on a local port."""
+
+    def __init__(self, collector, host=METRICS_DEFAULT_HOST, port=METRICS_DEFAULT_PORT):
+        self.log_prefix = f"[{self.__class__.__name__}] "
+        self.collector = collector
+        self.host = host
+        self.port = port
+        self.httpd = None
+
+    def start(self):
+        handler_class = type("BoundMetricsHandler", (_MetricsHandler,), {"collector": self.collector})
+        self.httpd = ThreadingHTTPServer((self.host, self.port), handler_class)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        threading.Thread(target=self.httpd.serve_forever, name="MetricsServer", daemon=True).start()
+        logging.info(f"{self.log_prefix}Prometheus metrics at http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if not self.httpd: return
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.httpd = None
+
+
+def add_metrics_arguments(parser):
+    """Adds the --metrics-* options shared by main_app.py and cli_app.py."""
+    parser.add_argument("--metrics-port", type=int, nargs="?", const=METRICS_DEFAULT_PORT, default=None,
+                        help=f"在本地端口提供 Prometheus 指标 (/metrics)，可指定端口 (默认: {METRICS_DEFAULT_PORT})")
+    parser.add_argument("--metrics-host", default=METRICS_DEFAULT_HOST, help=f"指标接口监听地址 (默认: {METRICS_DEFAULT_HOST})")
+    # const="": 默认路径在启动时才解析，构建参数解析器 (包括 --help) 时不创建数据目录
+    parser.add_argument("--metrics-json", nargs="?", const="",
+                        default=None, metavar="PATH", help=f"定期把指标快照写入 JSON 文件 (默认: 数据目录下的 {METRICS_SNAPSHOT_FILE_NAME})")
+    parser.add_argument("--metrics-json-interval", type=float, default=DEFAULT_SNAPSHOT_INTERVAL_SECONDS,
+                        help=f"JSON 快照间隔秒数 (默认: {DEFAULT_SNAPSHOT_INTERVAL_SECONDS})")
+
+
+def start_metrics_from_args(engine, args, parent=None):
+    """Creates the collector/server requested by add_metrics_arguments options. Returns (collector, server), either may be None."""
+    if args.metrics_port is None and args.metrics_json is None:
+        return None, None
+    snapshot_file_path = args.metrics_json
+    if snapshot_file_path == "":
+        snapshot_file_path = os.path.join(get_app_data_dir(), METRICS_SNAPSHOT_FILE_NAME)
+    collector = MetricsCollector(engine, snapshot_file_path=snapshot_file_path,
+                                 snapshot_interval_seconds=args.metrics_json_interval, parent=parent)
+    collector.start()
+    server = None
+    if args.metrics_port is not None:
+        server = MetricsServer(collector, host=args.metrics_host, port=args.metrics_port)
+        try:
+            server.start()
+        except OSError:
+            collector.stop()
+            raise # 端口被占用等错误由调用方处理
+    return collector, server
@@ -0,0 +1,86 @@
+# partials.py
+"""
+Partial download files of a task, tracked across restarts.
+
+yt-dlp writes each "[download] Destination: X" to X.part (fragmented downloads: X.part-FragN plus
+an X.ytdl state file) and continues from it when started again with the same output path.
+TaskEngine records the destinations, the output directory and format they were started with, and
+at every stop the byte offset and a fingerprint of the first bytes of each .part file. Before the
+task starts again the records are verified; files that shrank or whose beginning changed are
+discarded so yt-dlp starts that file from scratch instead of appending to foreign data.
+"""
+import os
+import glob
+import hashlib
+import logging
+
+FINGERPRINT_BYTES = 64 * 1024
+
+
+def partial_files(destination):
+    """Existing partial files of one destination: X.part, X.part-FragN(.part), X.ytdl."""
+    found = [path for path in (destination + ".part", destination + ".ytdl") if os.path.exists(path)]
+    found.extend(glob.glob(glob.escape(destination) + ".part-Frag*"))
+    return found
+
+
+def partial_size(destination):
+    """Bytes downloaded so far for a destination (the .part file, or its fragments), 0 if there are none."""
+    part_path = destination + ".part"
+    try:
+        if os.path.exists(part_path):
+            return os.path.getsize(part_path)
+        return sum(os.path.getsize(path) for path in glob.glob(glob.escape(destination) + ".part-Frag*"))
+    except OSError:
+        return 0
+
+
+def _fingerprint(path, length):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read(length)).hexdigest()[:32]
+
+
+def snapshot_partial(destination):
+    """Record for one destination: {"bytes", "head", "head_len"} (head is empty when there is no .part file)."""
+    record = {"bytes": partial_size(destination), "head": "", "head_len": 0}
+    part_path = destination + ".part"
+    try:
+        head_len = min(record["bytes"], FINGERPRINT_BYTES)
+        if head_len and os.path.exists(part_path):
+            record.update(head=_fingerprint(part_path, head_len), head_len=head_len)
+    except OSError:
+        pass
+    return record
+
+
+def verify_partial(destination, record):
+    """
+    True if the partial files of destination still continue the recorded download. A file that is
+    smaller than the recorded offset or starts with different bytes fails the check.
+    """
+    if not partial_files(destination):
+        return False
+    if partial_size(destination) < record.get("bytes", 0):
+        return False
+    head_len = record.get("head_len", 0)
+    if head_len:
+        try:
+            return _fingerprint(destination + ".part", head_len) == record.get("head")
+        except OSError:
+            return False
+    return True
+
+
+def remove_partials(destinations):
+    """Deletes the partial files of the given destinations (run in a background thread)."""
+    removed = 0
+    for destination in destinations:
+        for path in partial_files(destination):
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError as e:
+                logging.warning(f"Could not remove partial file {path}: {e}")
+    if removed:
+        logging.info(f"Removed {removed} partial download file(s).")
+    return removed
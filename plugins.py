@@ -0,0 +1,302 @@
+# plugins.py
+"""
+In-process post-processing plugins.
+
+A post_script that defines a top-level function
+
+    def process(filepath, task_metadata): ...
+
+is run as a plugin: the module is imported once per worker process, and the worker processes stay
+alive between files, so no new interpreter is started per file. task_metadata is a dict with
+task_id, url, title, filepath and params. print() output and a non-None return value go to the
+task's output log; an exception marks post-processing as failed.
+
+Optional module-level constants (plain literals) configure the plugin:
+    CONCURRENCY = 4    # worker processes for this plugin (default: --postprocess-workers)
+    TIMEOUT = 60       # seconds per file; a process that exceeds it is killed and replaced
+
+Scripts without a process() function keep running as "python post_script filepath".
+"""
+import io
+import os
+import ast
+import sys
+import time
+import logging
+import threading
+import traceback
+import contextlib
+import multiprocessing
+import importlib.util
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from workers import TIMING_POST_SCRIPT, PHASE_POST_SCRIPT
+
+PLUGIN_ENTRY_POINT = "process"
+MAX_PLUGIN_OUTPUT_CHARS = 20000
+PLUGIN_STARTUP_TIMEOUT_SECONDS = 60 # 启动工作进程并导入插件，不计入每个文件的 TIMEOUT
+
+
+class PluginError(Exception):
+    pass
+
+
+class PluginInfo:
+    def __init__(self, path, mtime, concurrency=None, timeout_seconds=None):
+        self.path = path
+        self.mtime = mtime
+        self.concurrency = concurrency         # None: 使用后处理阶段的并发数
+        self.timeout_seconds = timeout_seconds # None: 使用后处理阶段的超时
+
+
+_plugin_info_cache = {} # path: (mtime, PluginInfo or None)
+
+
+def read_plugin_info(post_script):
+    """
+    Returns a PluginInfo if post_script defines process() (checked without importing it),
+    otherwise None (script-per-file mode). Cached per file modification time.
+    """
+    path = os.path.abspath(post_script)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _plugin_info_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    info = None
+    try:
+        with open(path, "rb") as f:
+            tree = ast.parse(f.read(), path)
+    except (OSError, SyntaxError, ValueError):
+        tree = None # 按脚本方式运行，错误会出现在脚本输出中
+    if tree is not None and any(isinstance(node, ast.FunctionDef) and node.name == PLUGIN_ENTRY_POINT for node in tree.body):
+        info = PluginInfo(path, mtime)
+        for node in tree.body:
+            if not (isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name)):
+                continue
+            try:
+                value = ast.literal_eval(node.value)
+            except ValueError:
+                continue
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0:
+                continue
+            if node.targets[0].id == "CONCURRENCY":
+                info.concurrency = int(value)
+            elif node.targets[0].id == "TIMEOUT":
+                info.timeout_seconds = float(value)
+    _plugin_info_cache[path] = (mtime, info)
+    return info
+
+
+def _plugin_host_main(path, conn):
+    """Entry point of a plugin worker process: imports the plugin once, then serves jobs until told to stop."""
+    try:
+        sys.path.insert(0, os.path.dirname(path))
+        spec = importlib.util.spec_from_file_location(f"ytdow_plugin_{os.path.splitext(os.path.basename(path))[0]}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        process = getattr(module, PLUGIN_ENTRY_POINT)
+    except BaseException as e:
+        conn.send((False, f"加载插件失败: {type(e).__name__}: {e}", traceback.format_exc()))
+        return
+    conn.send((True, "", ""))
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is None: return
+        filepath, task_metadata = job
+        output = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                result = process(filepath, task_metadata)
+            reply = (True, "" if result is None else str(result).strip()[:100], output.getvalue()[-MAX_PLUGIN_OUTPUT_CHARS:])
+        except Exception as e:
+            reply = (False, f"{type(e).__name__}: {e}"[:100], (output.getvalue() + traceback.format_exc())[-MAX_PLUGIN_OUTPUT_CHARS:])
+        conn.send(reply)
+
+
+class PluginProcess:
+    """One persistent worker process with the plugin module loaded."""
+    def __init__(self, path):
+        # spawn: fork 一个带 Qt 和多线程的进程不安全
+        context = multiprocessing.get_context("spawn")
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_plugin_host_main, args=(path, child_conn),
+                                       name=f"Plugin_{os.path.basename(path)}", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self._ready = False
+
+    def run(self, filepath, task_metadata, timeout_seconds):
+        """Returns (ok, message, output). Raises TimeoutError, PluginError, or EOFError if the process died."""
+        if not self._ready:
+            if not self.conn.poll(PLUGIN_STARTUP_TIMEOUT_SECONDS):
+                raise PluginError(f"插件启动超时 ({PLUGIN_STARTUP_TIMEOUT_SECONDS}s)")
+            ok, message, output = self.conn.recv()
+            if not ok:
+                raise PluginError(message)
+            self._ready = True
+        self.conn.send((filepath, task_metadata))
+        if not self.conn.poll(timeout_seconds):
+            raise TimeoutError()
+        return self.conn.recv()
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.join(1)
+        except (OSError, ValueError, AssertionError):
+            pass
+        self.conn.close()
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(2)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+class PluginPool:
+    """Worker processes of one plugin, up to its concurrency; idle processes are reused."""
+    def __init__(self, info, default_concurrency, default_timeout_seconds):
+        self.info = info
+        self.concurrency = info.concurrency or default_concurrency
+        self.timeout_seconds = info.timeout_seconds or default_timeout_seconds
+        self.reserved = 0 # 已分配给作业的名额 (含正在启动的进程)
+        self.idle = []
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def has_capacity(self):
+        with self._lock:
+            return not self.closed and self.reserved < self.concurrency
+
+    def reserve(self):
+        with self._lock:
+            self.reserved += 1
+
+    def acquire(self):
+        """Called from the job thread after reserve(): an idle process, or a newly started one."""
+        with self._lock:
+            if self.idle:
+                return self.idle.pop()
+        return PluginProcess(self.info.path)
+
+    def release(self, plugin_process, reusable):
+        with self._lock:
+            self.reserved -= 1
+            if reusable and not self.closed:
+                self.idle.append(plugin_process)
+                return
+        if plugin_process is not None:
+            plugin_process.kill()
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            idle, self.idle = self.idle, []
+        for plugin_process in idle:
+            plugin_process.close()
+
+
+class PluginRegistry:
+    """One PluginPool per plugin file; a modified plugin file gets a fresh pool."""
+    def __init__(self):
+        self.log_prefix = f"[{self.__class__.__name__}] "
+        self.pools = {} # path: PluginPool
+
+    def pool_for(self, info, default_concurrency, default_timeout_seconds):
+        pool = self.pools.get(info.path)
+        if pool and pool.info.mtime != info.mtime:
+            logging.info(f"{self.log_prefix}Plugin {info.path} changed, restarting its worker processes.")
+            pool.close()
+            pool = None
+        if pool is None:
+            pool = self.pools[info.path] = PluginPool(info, default_concurrency, default_timeout_seconds)
+            logging.info(f"{self.log_prefix}Loaded plugin {info.path} (concurrency {pool.concurrency}, timeout {pool.timeout_seconds}s).")
+        return pool
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.close()
+        self.pools.clear()
+
+
+class PluginJobWorker(QThread):
+    """Runs one file through a plugin worker process. Same signals as PostScriptWorker."""
+    finished_signal = pyqtSignal(str, bool, str)
+    timing_signal = pyqtSignal(str, str, float)
+    phase_signal = pyqtSignal(str, str, float)
+
+    def __init__(self, task_id, filepath, task_metadata, pool, output_log=None):
+        super().__init__()
+        self.task_id = task_id
+        self.filepath = filepath
+        self.task_metadata = task_metadata
+        self.pool = pool
+        self.output_log = output_log
+        self._plugin_process = None
+        self._stopped = False
+        self.setObjectName(f"Plugin_{task_id}")
+
+    def stop(self):
+        self._stopped = True
+        plugin_process = self._plugin_process
+        if plugin_process:
+            try: plugin_process.process.kill()
+            except (OSError, ValueError, AttributeError): pass
+
+    def _log_lines(self, text):
+        if self.output_log:
+            for plugin_line in text.strip().splitlines():
+                self.output_log.append(f"[plugin] {plugin_line}")
+
+    def run(self):
+        try:
+            self._run_job()
+        finally:
+            if self.output_log:
+                self.output_log.spill()
+
+    def _run_job(self):
+        start_time = time.monotonic()
+        self.phase_signal.emit(self.task_id, PHASE_POST_SCRIPT, time.time())
+        filepath = os.path.abspath(self.filepath)
+        if self.output_log:
+            self.output_log.append(f"$ plugin {self.pool.info.path}: {PLUGIN_ENTRY_POINT}({filepath})")
+        ok, message, reusable = False, "", False
+        try:
+            self._plugin_process = self.pool.acquire()
+            if self._stopped: self.stop()
+            ok, message, output = self._plugin_process.run(filepath, self.task_metadata, self.pool.timeout_seconds)
+            reusable = True
+            self._log_lines(output)
+            if ok and message:
+                self._log_lines(f"-> {message}")
+            if not ok:
+                message = f"插件失败: {message}"
+                logging.error(f"Task {self.task_id}: Plugin {self.pool.info.path} failed: {output.strip()}")
+        except TimeoutError:
+            message = "插件超时"
+            logging.error(f"Task {self.task_id}: Plugin {self.pool.info.path} timed out after {self.pool.timeout_seconds}s.")
+        except PluginError as e:
+            message = str(e)[:100]
+            logging.error(f"Task {self.task_id}: {e}")
+        except Exception as e_plugin_generic:
+            message = f"插件进程异常: {type(e_plugin_generic).__name__}"
+            logging.error(f"Task {self.task_id}: Plugin process exception: {type(e_plugin_generic).__name__} - {e_plugin_generic}")
+        finally:
+            self.pool.release(self._plugin_process, reusable and not self._stopped)
+        if self._stopped and not ok:
+            message = "后处理已取消"
+        self.timing_signal.emit(self.task_id, TIMING_POST_SCRIPT, time.monotonic() - start_time)
+        self.finished_signal.emit(self.task_id, ok, message)
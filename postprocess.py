@@ -0,0 +1,116 @@
+# postprocess.py
+import os
+import logging
+from collections import deque
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from workers import PostScriptWorker
+from plugins import PluginRegistry, PluginJobWorker, read_plugin_info
+
+DEFAULT_POSTPROCESS_WORKERS = os.cpu_count() or 2
+DEFAULT_POST_SCRIPT_TIMEOUT_SECONDS = 300
+MAX_PLUGIN_QUEUE_SCAN = 1000 # 插件已满时，_start_next 最多向后查看这么多个作业
+
+
+class PostProcessStage(QObject):
+    """
+    Second pipeline stage: post-processing of downloaded files (the user's post_script) with its
+    own FIFO queue and concurrency limit (default: number of CPU cores). TaskEngine submits a task
+    here after its download finished, so the network slot is free while the CPU-bound work runs.
+    Plugin scripts (see plugins.py) run in persistent worker processes, additionally limited by
+    the plugin's own CONCURRENCY.
+    """
+    job_started = pyqtSignal(str)               # task_id
+    job_finished = pyqtSignal(str, bool, str)   # task_id, ok, message
+    timing = pyqtSignal(str, str, float)        # 转发 PostScriptWorker 的信号 (与 TaskEngine.task_timing 相同)
+    phase = pyqtSignal(str, str, float)
+
+    def __init__(self, max_concurrent=DEFAULT_POSTPROCESS_WORKERS, timeout_seconds=DEFAULT_POST_SCRIPT_TIMEOUT_SECONDS, parent=None):
+        super().__init__(parent)
+        self.log_prefix = f"[{self.__class__.__name__}] "
+        self.max_concurrent = max(1, max_concurrent)
+        self.timeout_seconds = timeout_seconds
+        self.queue = deque() # (task_id, filepath, post_script, output_log, task_metadata)
+        self.running = {}    # task_id: PostScriptWorker or PluginJobWorker
+        self.finishing = set() # 已报告结果但线程尚未退出的 worker (保持引用，避免线程运行中被回收)
+        self.plugins = PluginRegistry()
+        self._shutting_down = False
+
+    def pending_count(self):
+        return len(self.queue)
+
+    def running_count(self):
+        return len(self.running)
+
+    def is_idle(self):
+        return not self.queue and not self.running
+
+    def submit(self, task_id, filepath, post_script, output_log=None, task_metadata=None):
+        self.queue.append((task_id, filepath, post_script, output_log, task_metadata or {}))
+        self._start_next()
+
+    def set_max_concurrent(self, value):
+        self.max_concurrent = max(1, value)
+        self._start_next()
+
+    def cancel(self, task_ids):
+        """Drops queued jobs and kills running ones for the given tasks (deleted tasks)."""
+        task_ids = set(task_ids)
+        if self.queue:
+            self.queue = deque(job for job in self.queue if job[0] not in task_ids)
+        for task_id in task_ids & self.running.keys():
+            self.running[task_id].stop()
+
+    def _start_next(self):
+        skipped = [] # 所属插件已达到其并发数的作业，保持原顺序放回队首
+        while self.queue and len(self.running) < self.max_concurrent and len(skipped) < MAX_PLUGIN_QUEUE_SCAN:
+            job = self.queue.popleft()
+            task_id, filepath, post_script, output_log, task_metadata = job
+            plugin_info = read_plugin_info(post_script)
+            if plugin_info:
+                pool = self.plugins.pool_for(plugin_info, self.max_concurrent, self.timeout_seconds)
+                if not pool.has_capacity():
+                    skipped.append(job)
+                    continue
+                pool.reserve()
+                worker = PluginJobWorker(task_id, filepath, task_metadata, pool, output_log)
+            else:
+                worker = PostScriptWorker(task_id, filepath, post_script, output_log, self.timeout_seconds)
+            worker.finished_signal.connect(self._on_worker_finished)
+            worker.timing_signal.connect(self.timing)
+            worker.phase_signal.connect(self.phase)
+            worker.finished.connect(lambda worker=worker: self.finishing.discard(worker))
+            worker.finished.connect(worker.deleteLater)
+            self.running[task_id] = worker
+            self.job_started.emit(task_id)
+            worker.start()
+        self.queue.extendleft(reversed(skipped))
+
+    def _on_worker_finished(self, task_id, ok, message):
+        if self._shutting_down: return # 被关闭中断的任务保持后处理状态
+        worker = self.running.pop(task_id, None)
+        if worker is not None and worker.isRunning():
+            self.finishing.add(worker)
+        self.job_finished.emit(task_id, ok, message)
+        self._start_next()
+
+    def shutdown(self, wait_ms_per_thread=5000):
+        """Kills running scripts and plugin processes; their tasks stay in the post-processing state and run again on the next start."""
+        self._shutting_down = True
+        self.queue.clear()
+        workers = list(self.running.values())
+        for worker in workers:
+            worker.stop()
+        for worker in workers:
+            if not worker.wait(wait_ms_per_thread):
+                logging.warning(f"{self.log_prefix}Post-processing thread for task {worker.task_id} did not finish in time.")
+        self.running.clear()
+        self.plugins.close()
+
+
+def add_postprocess_arguments(parser):
+    """Adds the post-processing options shared by main_app.py and cli_app.py."""
+    parser.add_argument("--postprocess-workers", type=int, default=DEFAULT_POSTPROCESS_WORKERS,
+                        help=f"同时运行的后处理 (post_script) 数，与下载并发数分开 (默认: CPU 核数 {DEFAULT_POSTPROCESS_WORKERS})")
+    parser.add_argument("--postprocess-timeout", type=float, default=DEFAULT_POST_SCRIPT_TIMEOUT_SECONDS,
+                        help=f"单个文件后处理的超时秒数，插件可用 TIMEOUT 常量覆盖 (默认: {DEFAULT_POST_SCRIPT_TIMEOUT_SECONDS})")
@@ -0,0 +1,184 @@
+# retry_policy.py
+"""
+Failure classification and automatic retries.
+
+classify_failure() maps a worker error message (and the task's yt-dlp "ERROR:" lines) to a
+category. RetryScheduler re-enqueues failed tasks whose category is transient, with exponential
+backoff and jitter per category; permanent failures (geo-block, private/removed video, disk full,
+bad parameters) stay failed until retried by hand.
+"""
+import time
+import random
+import logging
+from PyQt5.QtCore import QObject, QTimer
+
+from task_state import STATE_FAILED, STATE_DONE
+
+# --- 失败分类 ---
+FAILURE_CATEGORIES = (
+    ("rate_limited", ("http error 429", "too many requests")),
+    ("forbidden", ("http error 403", "forbidden")),
+    ("geo_blocked", ("not available in your country", "geo restrict", "geo-restrict")),
+    ("unavailable", ("private video", "video unavailable", "has been removed", "http error 404", "does not exist")),
+    ("disk_full", ("no space left on device", "disk full", "errno 28")),
+    ("postprocess", ("ffmpeg", "ffprobe", "postprocess", "conversion failed")),
+    ("network", ("timed out", "connection reset", "connection refused", "connection aborted", "remote end closed connection",
+                 "incompleteread", "temporary failure in name resolution", "network is unreachable",
+                 "unable to download webpage", "ssl")),
+    ("timeout", ("执行超时",)),
+    ("stalled", ("下载停滞",)),
+    ("missing_output", ("找不到文件", "未能从输出中解析文件路径")),
+    ("params", ("参数", "路径无效")),
+)
+
+
+def classify_failure(error_text):
+    """Maps a worker error message to a coarse category label for metrics and retries."""
+    text = (error_text or "").lower()
+    for category, needles in FAILURE_CATEGORIES:
+        if any(needle in text for needle in needles):
+            return category
+    return "other"
+
+
+def classify_task_failure(error_text, output_lines=()):
+    """classify_failure() of the error message, falling back to the last yt-dlp ERROR: line of the task output."""
+    category = classify_failure(error_text)
+    if category == "other":
+        for line in reversed(output_lines):
+            if "ERROR:" in line:
+                category = classify_failure(line)
+                break
+    return category
+
+
+class RetryRule:
+    def __init__(self, max_attempts, base_delay, max_delay):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay # 第一次重试前的秒数，之后每次翻倍
+        self.max_delay = max_delay
+
+    def delay_for(self, attempt, rng=random):
+        """Backoff before retry number attempt (1-based): base * 2^(attempt-1), capped, with equal jitter."""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return delay / 2 + rng.uniform(0, delay / 2)
+
+
+# None: 永久性错误，不自动重试
+DEFAULT_RETRY_RULES = {
+    "rate_limited": RetryRule(6, 60, 3600),
+    "forbidden": RetryRule(2, 30, 300),     # 多为签名过期的格式链接，重新解析即可
+    "network": RetryRule(5, 10, 600),
+    "timeout": RetryRule(3, 30, 600),
+    "postprocess": RetryRule(1, 10, 10),    # ffmpeg 失败多与输入有关，只重试一次 (重新下载)
+    "other": RetryRule(1, 60, 60),
+    "geo_blocked": None,
+    "unavailable": None,
+    "disk_full": None,
+    "stalled": None,                        # 停滞检测已有自己的重试次数
+    "missing_output": None,
+    "params": None,
+}
+CHECK_INTERVAL_MS = 1000
+
+
+class RetryScheduler(QObject):
+    """
+    Listens to TaskEngine.task_error and retries transient failures after a backoff.
+    The pending retry time is stored in the task ("retry_at", wall clock) so it survives a restart.
+    """
+
+    def __init__(self, engine, rules=None, max_delay=None, parent=None):
+        super().__init__(parent)
+        self.log_prefix = f"[{self.__class__.__name__}] "
+        self.engine = engine
+        self.rules = dict(DEFAULT_RETRY_RULES if rules is None else rules)
+        self.max_delay = max_delay # 覆盖所有类别的最长等待秒数
+        self.pending = {} # task_id: retry_at
+
+        self.engine.task_error.connect(self.on_task_error)
+        self.engine.task_updated.connect(self.on_task_updated)
+        self.engine.tasks_removed.connect(self.on_tasks_removed)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(CHECK_INTERVAL_MS)
+        self.timer.timeout.connect(self.retry_due_tasks)
+
+    def start(self):
+        for task_id, task_data in self.engine.tasks.items(): # 上次退出前安排的重试
+            if task_data.get("retry_at") and self.engine.state_of(task_id) == STATE_FAILED:
+                self.pending[task_id] = task_data["retry_at"]
+        if self.pending:
+            logging.info(f"{self.log_prefix}{len(self.pending)} task(s) waiting for an automatic retry.")
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+        self.pending.clear()
+
+    def has_pending(self, task_ids=None):
+        return any(task_id in self.pending for task_id in task_ids) if task_ids is not None else bool(self.pending)
+
+    def on_task_error(self, task_id, error_msg):
+        task_data = self.engine.tasks.get(task_id)
+        if not task_data or task_data.get("_marked_for_deletion_while_active"): return
+        category = classify_task_failure(error_msg, self.engine.task_output(task_id, max_lines=50))
+        task_data["error_category"] = category
+        rule = self.rules.get(category, self.rules.get("other"))
+        attempt = task_data.get("auto_retries", 0) + 1
+        if rule is None or attempt > rule.max_attempts:
+            task_data.pop("retry_at", None)
+            reason = "永久性错误" if rule is None else f"已自动重试 {rule.max_attempts} 次"
+            logging.info(f"{self.log_prefix}Task {task_id} failed ({category}), not retrying: {reason}.")
+            return
+        delay = rule.delay_for(attempt)
+        if self.max_delay is not None:
+            delay = min(delay, self.max_delay)
+        task_data["auto_retries"] = attempt
+        task_data["retry_at"] = self.pending[task_id] = time.time() + delay
+        task_data["status"] = f"等待重试 ({category}, {attempt}/{rule.max_attempts}, {delay:.0f}s)"
+        logging.info(f"{self.log_prefix}Task {task_id} failed ({category}), retry {attempt}/{rule.max_attempts} in {delay:.0f}s.")
+        self.engine.task_updated.emit(task_id)
+        self.engine.request_save()
+
+    def on_task_updated(self, task_id):
+        state = self.engine.state_of(task_id)
+        if state == STATE_FAILED: return
+        self.pending.pop(task_id, None) # 手动重试/删除等
+        if state == STATE_DONE:
+            task_data = self.engine.tasks.get(task_id, {})
+            task_data.pop("auto_retries", None)
+            task_data.pop("error_category", None)
+
+    def on_tasks_removed(self, task_ids):
+        for task_id in task_ids:
+            self.pending.pop(task_id, None)
+
+    def retry_due_tasks(self):
+        now = time.time()
+        for task_id, retry_at in list(self.pending.items()):
+            if retry_at > now: continue
+            del self.pending[task_id]
+            if self.engine.state_of(task_id) != STATE_FAILED: continue
+            reason = self.engine.retry_task(task_id, automatic=True)
+            if reason:
+                logging.warning(f"{self.log_prefix}Automatic retry of task {task_id} skipped: {reason}")
+
+
+def add_retry_arguments(parser):
+    """Adds the automatic retry options shared by main_app.py and cli_app.py."""
+    parser.add_argument("--no-auto-retry", action="store_true",
+                        help="不自动重试失败的任务 (默认: 限流、403、网络错误、超时等临时错误按类别退避后自动重试，永久性错误不重试)")
+    parser.add_argument("--retry-max-delay", type=float, default=None, metavar="SECONDS",
+                        help="自动重试前最长等待的秒数 (默认: 按类别，限流最长 3600)")
+
+
+def start_retry_scheduler_from_args(engine, args, parent=None):
+    """Creates and starts the RetryScheduler unless --no-auto-retry is given. Raises ValueError."""
+    if args.no_auto_retry:
+        return None
+    if args.retry_max_delay is not None and args.retry_max_delay < 0:
+        raise ValueError("--retry-max-delay 不能为负数")
+    scheduler = RetryScheduler(engine, max_delay=args.retry_max_delay, parent=parent)
+    scheduler.start()
+    return scheduler
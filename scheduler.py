@@ -0,0 +1,255 @@
+# scheduler.py
+"""
+Time-window rules on top of TaskEngine.check_and_start_tasks. Rules live in a JSON file
+(default: schedule.json in the app data directory):
+
+  {
+    "default": {"max_concurrent": null, "limit_rate": null},
+    "windows": [
+      {"name": "office", "days": "mon-fri", "start": "09:00", "end": "18:00", "max_concurrent": 1, "limit_rate": "500K"},
+      {"name": "night", "start": "23:00", "end": "07:00", "max_concurrent": 6, "limit_rate": "", "off_peak": true}
+    ]
+  }
+
+The first matching window wins; outside all windows "default" applies. In a window:
+  max_concurrent  overrides the concurrency setting (null = keep it, 0 = start nothing and pause running tasks)
+  limit_rate      overrides each task's rate limit ("" = unlimited, null = keep the task's own)
+  off_peak        tasks with the off_peak_only param may start only in such windows
+  preempt         when the window begins, running tasks over max_concurrent, or with a different rate
+                  limit, are stopped and requeued at the front (yt-dlp continues the .part file);
+                  otherwise they finish as they are and only new starts follow the window
+An end time earlier than the start time wraps past midnight ("days" refers to the start day).
+Off-peak-only tasks are always stopped and requeued when an off-peak window ends.
+"""
+import os
+import json
+import logging
+from datetime import datetime, timedelta
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from constants import get_app_data_dir
+from task_state import STATE_RUNNING
+
+SCHEDULE_FILE_NAME = "schedule.json"
+CHECK_INTERVAL_MS = 15000 # 检查时段切换的间隔
+WEEKDAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+DEFAULT_WINDOW_NAME = "default"
+
+
+class ScheduleError(ValueError):
+    pass
+
+
+def _parse_time(text, field):
+    try:
+        hours, minutes = (int(part) for part in str(text).split(":"))
+    except ValueError:
+        raise ScheduleError(f"{field}: 时间格式应为 HH:MM (收到: {text})")
+    if not (0 <= hours <= 24 and 0 <= minutes < 60) or (hours == 24 and minutes):
+        raise ScheduleError(f"{field}: 时间超出范围 (收到: {text})")
+    return hours * 60 + minutes
+
+
+def _parse_days(value, field):
+    """'mon-fri', 'sat,sun', ['mon', 'wed'] or None (every day) -> set of weekday numbers (0 = Monday)."""
+    if value is None:
+        return set(range(7))
+    parts = value if isinstance(value, list) else str(value).split(",")
+    days = set()
+    for part in parts:
+        first, _, last = str(part).strip().lower().partition("-")
+        if first not in WEEKDAY_NAMES or (last and last not in WEEKDAY_NAMES):
+            raise ScheduleError(f"{field}: 未知的星期 '{part}' (可用: {', '.join(WEEKDAY_NAMES)})")
+        start, end = WEEKDAY_NAMES.index(first), WEEKDAY_NAMES.index(last or first)
+        day = start
+        while True:
+            days.add(day)
+            if day == end: break
+            day = (day + 1) % 7
+    return days
+
+
+class ScheduleWindow:
+    """One time window with the settings that apply while it is active."""
+
+    def __init__(self, name, days=None, start=None, end=None, max_concurrent=None, limit_rate=None,
+                 off_peak=False, preempt=False):
+        self.name = name
+        self.days = days if days is not None else set(range(7))
+        self.start = start # 从 0 点起的分钟数，None 表示全天 (default)
+        self.end = end
+        self.max_concurrent = max_concurrent
+        self.limit_rate = limit_rate
+        self.off_peak = off_peak
+        self.preempt = preempt
+
+    @classmethod
+    def from_dict(cls, data, field):
+        if not isinstance(data, dict):
+            raise ScheduleError(f"{field}: 应为 JSON 对象")
+        max_concurrent = data.get("max_concurrent")
+        if max_concurrent is not None and (not isinstance(max_concurrent, int) or max_concurrent < 0):
+            raise ScheduleError(f"{field}.max_concurrent: 应为不小于 0 的整数或 null")
+        limit_rate = data.get("limit_rate")
+        if limit_rate is not None:
+            limit_rate = str(limit_rate).strip()
+        window = cls(str(data.get("name") or field), max_concurrent=max_concurrent, limit_rate=limit_rate,
+                     off_peak=bool(data.get("off_peak", False)), preempt=bool(data.get("preempt", False)))
+        if "start" in data or "end" in data:
+            window.start = _parse_time(data.get("start", "00:00"), f"{field}.start")
+            window.end = _parse_time(data.get("end", "24:00"), f"{field}.end")
+            window.days = _parse_days(data.get("days"), f"{field}.days")
+        return window
+
+    def contains(self, moment):
+        if self.start is None: return True
+        minute = moment.hour * 60 + moment.minute
+        if self.start < self.end:
+            return moment.weekday() in self.days and self.start <= minute < self.end
+        # 跨越午夜: 开始当天的晚上部分，或前一天开始的窗口的凌晨部分
+        if minute >= self.start:
+            return moment.weekday() in self.days
+        return minute < self.end and (moment - timedelta(days=1)).weekday() in self.days
+
+    def describe(self):
+        parts = [f"并发 {self.max_concurrent}" if self.max_concurrent is not None else "并发不变"]
+        if self.limit_rate is not None:
+            parts.append(f"限速 {self.limit_rate}" if self.limit_rate else "不限速")
+        if self.off_peak:
+            parts.append("空闲时段")
+        return f"{self.name} ({', '.join(parts)})"
+
+
+class Schedule:
+    def __init__(self, windows, default=None):
+        self.windows = windows
+        self.default = default or ScheduleWindow(DEFAULT_WINDOW_NAME)
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict):
+            raise ScheduleError("时段配置应为 JSON 对象")
+        windows = [ScheduleWindow.from_dict(item, f"windows[{i}]") for i, item in enumerate(data.get("windows", []))]
+        default_data = dict(data.get("default") or {}, name=DEFAULT_WINDOW_NAME)
+        default_data.pop("start", None); default_data.pop("end", None)
+        return cls(windows, ScheduleWindow.from_dict(default_data, "default"))
+
+    @classmethod
+    def load(cls, file_path):
+        with open(file_path, "r", encoding="utf-8") as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ScheduleError(f"{file_path}: {e}")
+        return cls.from_dict(data)
+
+    def window_at(self, moment):
+        for window in self.windows:
+            if window.contains(moment):
+                return window
+        return self.default
+
+
+def default_schedule_path():
+    return os.path.join(get_app_data_dir(), SCHEDULE_FILE_NAME)
+
+
+def add_scheduler_arguments(parser):
+    """Adds the --schedule option shared by main_app.py and cli_app.py."""
+    parser.add_argument("--schedule", default=None, metavar="PATH",
+                        help=f"按时段设置并发数和限速的规则文件 (默认: 数据目录下的 {SCHEDULE_FILE_NAME}，存在时自动加载)")
+
+
+def load_schedule_from_args(args):
+    """Schedule from --schedule, or from the default file if it exists; None when there is none. Raises OSError/ScheduleError."""
+    file_path = args.schedule
+    if not file_path:
+        file_path = default_schedule_path()
+        if not os.path.exists(file_path):
+            return None
+    schedule = Schedule.load(file_path)
+    logging.info(f"已加载时段规则 {file_path}: {len(schedule.windows)} 个时段")
+    return schedule
+
+
+class TaskScheduler(QObject):
+    """
+    Applies the active ScheduleWindow to a TaskEngine: concurrency and rate limit overrides,
+    the off-peak-only start filter, and requeueing running tasks at window boundaries.
+    """
+    window_changed = pyqtSignal(str) # 当前时段的说明文字
+
+    def __init__(self, engine, schedule, clock=datetime.now, parent=None):
+        super().__init__(parent)
+        self.log_prefix = f"[{self.__class__.__name__}] "
+        self.engine = engine
+        self.schedule = schedule
+        self.clock = clock
+        self.current_window = None
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(CHECK_INTERVAL_MS)
+        self.timer.timeout.connect(self.apply_current_window)
+
+    def start(self):
+        self.engine.start_filters.append(self._may_start)
+        self.apply_current_window()
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+        if self._may_start in self.engine.start_filters:
+            self.engine.start_filters.remove(self._may_start)
+        self.engine.concurrency_override = None
+        self.engine.limit_rate_override = None
+        self.current_window = None
+
+    def _may_start(self, task_id, task_data):
+        if self.current_window is None or self.current_window.off_peak:
+            return True
+        return not task_data.get("params", {}).get("off_peak_only")
+
+    def apply_current_window(self):
+        window = self.schedule.window_at(self.clock())
+        if window is self.current_window: return
+        previous, self.current_window = self.current_window, window
+        logging.info(f"{self.log_prefix}进入时段 {window.describe()}")
+        self.engine.concurrency_override = window.max_concurrent
+        self.engine.limit_rate_override = window.limit_rate
+
+        if previous is not None:
+            self._requeue_running_tasks(window)
+        self.window_changed.emit(window.describe())
+        self.engine.check_and_start_tasks()
+
+    def _rate_differs(self, task_id, window):
+        task_data = self.engine.tasks.get(task_id, {})
+        worker = task_data.get("worker")
+        wanted = window.limit_rate if window.limit_rate is not None else task_data.get("params", {}).get("limit_rate")
+        return worker is not None and (worker.limit_rate or "") != (wanted or "")
+
+    def _requeue_running_tasks(self, window):
+        running_ids = sorted(self.engine.task_states.ids(STATE_RUNNING), key=_task_number)
+        to_requeue = []
+        if not window.off_peak: # 空闲时段结束，仅限空闲时段的任务必须停止
+            to_requeue.extend(tid for tid in running_ids
+                              if self.engine.tasks.get(tid, {}).get("params", {}).get("off_peak_only"))
+        remaining = [tid for tid in running_ids if tid not in to_requeue]
+        if window.max_concurrent == 0:
+            to_requeue.extend(remaining)
+        elif window.preempt:
+            if window.max_concurrent is not None and len(remaining) > window.max_concurrent:
+                to_requeue.extend(remaining[window.max_concurrent:]) # 保留较早开始的任务
+                remaining = remaining[:window.max_concurrent]
+            # 限速不同的任务重新启动以使用新的限速
+            to_requeue.extend(tid for tid in remaining if self._rate_differs(tid, window))
+        if to_requeue:
+            logging.info(f"{self.log_prefix}时段切换，{len(to_requeue)} 个运行中的任务停止后重新排队")
+            self.engine.requeue_running_tasks(to_requeue)
+
+
+def _task_number(task_id):
+    try:
+        return int(str(task_id).rsplit("_", 1)[-1])
+    except ValueError:
+        return 0
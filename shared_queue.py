@@ -0,0 +1,331 @@
+# shared_queue.py
+import os
+import json
+import time
+import socket
+import sqlite3
+import logging
+from PyQt5.QtCore import QObject, QTimer
+
+from task_state import STARTABLE_STATES, STATE_QUEUED, STATE_RUNNING, STATE_POSTPROCESSING, STATE_FAILED, STATE_DONE
+
+# --- 共享任务队列 (多节点) ---
+# 多个 ytdow 节点 (进程/机器) 通过同一个 SQLite 数据库领取下载任务。
+# 节点以租约 (lease) 的方式领取任务并定期续约 (heartbeat)；节点失联后租约过期，任务会被其他节点重新领取。
+JOB_PENDING = "pending"   # 等待领取
+JOB_LEASED = "leased"     # 已被某节点领取 (租约有效期内)
+JOB_DONE = "done"
+JOB_FAILED = "failed"     # 超过最大尝试次数
+
+DEFAULT_LEASE_SECONDS = 60
+DEFAULT_HEARTBEAT_SECONDS = 10
+DEFAULT_MAX_ATTEMPTS = 3
+SQLITE_BUSY_TIMEOUT_SECONDS = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL DEFAULT '',
+    params_json TEXT NOT NULL DEFAULT '{}',
+    state TEXT NOT NULL DEFAULT 'pending',
+    lease_node TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    result TEXT NOT NULL DEFAULT '',
+    error TEXT NOT NULL DEFAULT '',
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state_idx ON jobs (state, id);
+CREATE INDEX IF NOT EXISTS jobs_lease_idx ON jobs (lease_node);
+CREATE TABLE IF NOT EXISTS nodes (
+    node_id TEXT PRIMARY KEY,
+    hostname TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    max_concurrent INTEGER NOT NULL,
+    started REAL NOT NULL,
+    last_heartbeat REAL NOT NULL
+);
+"""
+
+
+def default_node_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class SharedQueue:
+    """
+    Job table in a SQLite file shared by several nodes. Every method opens a short
+    transaction; claiming uses BEGIN IMMEDIATE so two nodes can never lease the same job.
+    Plain rollback journal is used (no WAL) because WAL does not work on network mounts.
+    """
+
+    def __init__(self, db_path, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.log_prefix = f"[{self.__class__.__name__}] "
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self._conn = sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT_SECONDS, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def _transaction(self):
+        return _ImmediateTransaction(self._conn)
+
+    # --- 提交 ---
+    def submit(self, urls, params=None, max_attempts=DEFAULT_MAX_ATTEMPTS, titles=None):
+        """Adds jobs for the given URLs in one transaction; URLs already in the queue are ignored. Returns the number added."""
+        now = time.time()
+        params_json = json.dumps(params or {}, ensure_ascii=False)
+        titles = titles or {}
+        rows = [(url, titles.get(url, url), params_json, max_attempts, now, now) for url in (u.strip() for u in urls) if url]
+        with self._transaction() as cur:
+            before = cur.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+            cur.executemany(
+                "INSERT OR IGNORE INTO jobs (url, title, params_json, max_attempts, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            added = cur.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] - before
+        logging.info(f"{self.log_prefix}Submitted {added} of {len(rows)} URLs to {self.db_path}")
+        return added
+
+    # --- 节点 ---
+    def register_node(self, node_id, max_concurrent):
+        now = time.time()
+        with self._transaction() as cur:
+            cur.execute(
+                "INSERT OR REPLACE INTO nodes (node_id, hostname, pid, max_concurrent, started, last_heartbeat) VALUES (?, ?, ?, ?, ?, ?)",
+                (node_id, socket.gethostname(), os.getpid(), max_concurrent, now, now)
+            )
+
+    def heartbeat(self, node_id, max_concurrent=None):
+        """Renews the node's heartbeat and all of its leases. Returns the ids of jobs this node still holds."""
+        now = time.time()
+        with self._transaction() as cur:
+            if max_concurrent is None:
+                cur.execute("UPDATE nodes SET last_heartbeat = ? WHERE node_id = ?", (now, node_id))
+            else:
+                cur.execute("UPDATE nodes SET last_heartbeat = ?, max_concurrent = ? WHERE node_id = ?", (now, max_concurrent, node_id))
+            cur.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE state = ? AND lease_node = ?",
+                (now + self.lease_seconds, JOB_LEASED, node_id)
+            )
+            return {row[0] for row in cur.execute("SELECT id FROM jobs WHERE state = ? AND lease_node = ?", (JOB_LEASED, node_id))}
+
+    def unregister_node(self, node_id):
+        """Releases every lease held by the node (clean shutdown) and removes it from the node table."""
+        with self._transaction() as cur:
+            cur.execute(
+                "UPDATE jobs SET state = ?, lease_node = NULL, lease_expires = NULL, updated = ? WHERE state = ? AND lease_node = ?",
+                (JOB_PENDING, time.time(), JOB_LEASED, node_id)
+            )
+            cur.execute("DELETE FROM nodes WHERE node_id = ?", (node_id,))
+
+    # --- 领取与完成 ---
+    def claim(self, node_id, max_concurrent):
+        """
+        Leases jobs for node_id until it holds max_concurrent of them. Jobs whose lease expired
+        (their node stopped heartbeating) are reassigned here. Returns a list of job dicts.
+        """
+        now = time.time()
+        with self._transaction() as cur:
+            self._requeue_expired(cur, now)
+            held = cur.execute("SELECT COUNT(*) FROM jobs WHERE state = ? AND lease_node = ?", (JOB_LEASED, node_id)).fetchone()[0]
+            free_slots = max_concurrent - held
+            if free_slots <= 0:
+                return []
+            rows = cur.execute("SELECT * FROM jobs WHERE state = ? ORDER BY id LIMIT ?", (JOB_PENDING, free_slots)).fetchall()
+            cur.executemany(
+                "UPDATE jobs SET state = ?, lease_node = ?, lease_expires = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                [(JOB_LEASED, node_id, now + self.lease_seconds, now, row["id"]) for row in rows]
+            )
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job["params"] = json.loads(job.pop("params_json") or "{}")
+            job["attempts"] += 1
+            jobs.append(job)
+        return jobs
+
+    def _requeue_expired(self, cur, now):
+        expired = cur.execute(
+            "SELECT id, lease_node, attempts, max_attempts FROM jobs WHERE state = ? AND lease_expires < ?", (JOB_LEASED, now)
+        ).fetchall()
+        for row in expired:
+            new_state = JOB_PENDING if row["attempts"] < row["max_attempts"] else JOB_FAILED
+            logging.warning(f"{self.log_prefix}Lease of job {row['id']} held by dead node {row['lease_node']} expired -> {new_state}")
+            cur.execute(
+                "UPDATE jobs SET state = ?, lease_node = NULL, lease_expires = NULL, error = ?, updated = ? WHERE id = ?",
+                (new_state, f"lease expired on node {row['lease_node']}", now, row["id"])
+            )
+
+    def complete(self, job_id, node_id, result=""):
+        return self._finish(job_id, node_id, JOB_DONE, result=result)
+
+    def fail(self, job_id, node_id, error=""):
+        """Marks a failed attempt; the job goes back to pending until it runs out of attempts."""
+        with self._transaction() as cur:
+            row = cur.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ? AND state = ? AND lease_node = ?",
+                              (job_id, JOB_LEASED, node_id)).fetchone()
+            if row is None:
+                return False
+            new_state = JOB_PENDING if row["attempts"] < row["max_attempts"] else JOB_FAILED
+            cur.execute(
+                "UPDATE jobs SET state = ?, lease_node = NULL, lease_expires = NULL, error = ?, updated = ? WHERE id = ?",
+                (new_state, error, time.time(), job_id)
+            )
+            return True
+
+    def release(self, job_id, node_id):
+        """Gives a job back without counting the attempt (paused or removed on this node)."""
+        with self._transaction() as cur:
+            cur.execute(
+                "UPDATE jobs SET state = ?, lease_node = NULL, lease_expires = NULL, attempts = MAX(attempts - 1, 0), updated = ? "
+                "WHERE id = ? AND state = ? AND lease_node = ?",
+                (JOB_PENDING, time.time(), job_id, JOB_LEASED, node_id)
+            )
+            return cur.rowcount > 0
+
+    def _finish(self, job_id, node_id, new_state, result="", error=""):
+        with self._transaction() as cur:
+            # 只有仍持有租约的节点可以完成任务；租约过期后被重新分配的任务以新节点为准
+            cur.execute(
+                "UPDATE jobs SET state = ?, lease_node = NULL, lease_expires = NULL, result = ?, error = ?, updated = ? "
+                "WHERE id = ? AND state = ? AND lease_node = ?",
+                (new_state, result, error, time.time(), job_id, JOB_LEASED, node_id)
+            )
+            return cur.rowcount > 0
+
+    # --- 查询 ---
+    def counts(self):
+        counts = {state: 0 for state in (JOB_PENDING, JOB_LEASED, JOB_DONE, JOB_FAILED)}
+        for row in self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"):
+            counts[row[0]] = row[1]
+        return counts
+
+    def nodes(self):
+        return [dict(row) for row in self._conn.execute("SELECT * FROM nodes ORDER BY node_id")]
+
+
+class _ImmediateTransaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK around a cursor (takes the write lock up front)."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.cur = None
+
+    def __enter__(self):
+        self.cur = self.conn.cursor()
+        self.cur.execute("BEGIN IMMEDIATE")
+        return self.cur
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cur.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        self.cur.close()
+        return False
+
+
+class SharedQueueNode(QObject):
+    """
+    Connects a TaskEngine to a SharedQueue: leases jobs up to the engine's max_concurrent,
+    turns them into local tasks, renews leases while they run and reports the outcome.
+    """
+
+    def __init__(self, engine, shared_queue, node_id=None, heartbeat_seconds=DEFAULT_HEARTBEAT_SECONDS, parent=None):
+        super().__init__(parent)
+        self.log_prefix = f"[{self.__class__.__name__}] "
+        self.engine = engine
+        self.queue = shared_queue
+        self.node_id = node_id or default_node_id()
+        self.job_of_task = {} # task_id: job_id，本节点持有租约的任务
+
+        self.engine.task_updated.connect(self.on_task_updated)
+        self.engine.tasks_removed.connect(self.on_tasks_removed)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(int(heartbeat_seconds * 1000))
+        self.timer.timeout.connect(self.tick)
+
+    def start(self):
+        self.queue.register_node(self.node_id, self.engine.max_concurrent)
+        logging.info(f"{self.log_prefix}Node {self.node_id} joined shared queue {self.queue.db_path} (max {self.engine.max_concurrent}).")
+        self.timer.start()
+        self.tick()
+
+    def stop(self):
+        self.timer.stop()
+        self.queue.unregister_node(self.node_id)
+        self.job_of_task.clear()
+        logging.info(f"{self.log_prefix}Node {self.node_id} left the shared queue.")
+
+    def is_drained(self):
+        """True when this node holds no jobs and nothing is left to claim."""
+        counts = self.queue.counts()
+        return not self.job_of_task and counts[JOB_PENDING] == 0 and counts[JOB_LEASED] == 0
+
+    def tick(self):
+        try:
+            held_job_ids = self.queue.heartbeat(self.node_id, self.engine.effective_max_concurrent())
+            # 租约已丢失 (例如本节点长时间无响应) 的任务由其他节点接手，本地停止跟踪
+            for task_id, job_id in list(self.job_of_task.items()):
+                if job_id not in held_job_ids:
+                    logging.warning(f"{self.log_prefix}Lease for job {job_id} (task {task_id}) was lost, pausing local task.")
+                    del self.job_of_task[task_id]
+                    self.engine.pause_tasks([task_id], suspend=False)
+            self.claim_jobs()
+        except sqlite3.Error as e:
+            logging.error(f"{self.log_prefix}Shared queue error: {e}", exc_info=True)
+
+    def claim_jobs(self):
+        jobs = self.queue.claim(self.node_id, self.engine.effective_max_concurrent())
+        if not jobs: return
+        task_ids = []
+        for job in jobs:
+            task_id = self.engine.task_id_for_url(job["url"])
+            if task_id is None:
+                task_id = self.engine.add_task(job["url"], job["title"], params=self._params_for_job(job), save=False)
+            elif self.engine.state_of(task_id) not in STARTABLE_STATES:
+                # 本地已有同一链接的任务 (已完成或正在运行)，直接用其结果
+                if self.engine.state_of(task_id) == STATE_DONE:
+                    self.queue.complete(job["id"], self.node_id, self.engine.tasks[task_id].get("filepath", ""))
+                else:
+                    self.queue.release(job["id"], self.node_id)
+                continue
+            self.engine.tasks[task_id]["shared_job_id"] = job["id"]
+            self.job_of_task[task_id] = job["id"]
+            task_ids.append(task_id)
+        logging.info(f"{self.log_prefix}Claimed {len(jobs)} jobs: {[job['id'] for job in jobs]}")
+        self.engine.resume_tasks(task_ids)
+
+    def _params_for_job(self, job):
+        provider = self.engine.default_params_provider
+        params = dict((provider() if provider else None) or {})
+        params.update(job.get("params") or {}) # 提交时指定的参数优先，其余使用本节点的设置
+        return params
+
+    def on_task_updated(self, task_id):
+        job_id = self.job_of_task.get(task_id)
+        if job_id is None: return
+        task_state = self.engine.state_of(task_id)
+        if task_state in (STATE_QUEUED, STATE_RUNNING, STATE_POSTPROCESSING): return
+        if self.engine.is_suspended(task_id):
+            return # 挂起 (SIGSTOP) 的进程仍在，继续时直接运行；进程结束后才释放租约，否则其他节点会重复下载
+        del self.job_of_task[task_id]
+        task_data = self.engine.tasks.get(task_id, {})
+        if task_state == STATE_DONE:
+            self.queue.complete(job_id, self.node_id, task_data.get("filepath", ""))
+        elif task_state == STATE_FAILED:
+            self.queue.fail(job_id, self.node_id, task_data.get("status", ""))
+        else: # Paused or reset locally: let another node (or this one later) take it
+            self.queue.release(job_id, self.node_id)
+        self.claim_jobs() # 空出的并发名额立即领取新任务
+
+    def on_tasks_removed(self, task_ids):
+        for task_id in task_ids:
+            job_id = self.job_of_task.pop(task_id, None)
+            if job_id is not None:
+                self.queue.release(job_id, self.node_id)
@@ -0,0 +1,160 @@
+# stall_watchdog.py
+"""
+Detects downloads that hang: no bytes downloaded for --stall-timeout seconds, or an average speed
+below --stall-min-speed for --stall-slow-seconds. A stalled task is stopped and put back at the
+front of the queue (yt-dlp continues from the .part file); after --stall-retries stalls it fails.
+"""
+import re
+import time
+import logging
+from PyQt5.QtCore import QObject, QTimer
+
+from task_state import STATE_RUNNING
+from workers import PHASE_SPAWN, PHASE_EXTRACT, PHASE_DOWNLOAD
+from metrics import parse_byte_size, parse_downloaded_bytes
+
+DEFAULT_STALL_SECONDS = 120
+DEFAULT_SLOW_SECONDS = 300
+DEFAULT_STALL_RETRIES = 3
+CHECK_INTERVAL_MS = 5000
+
+STALL_NO_PROGRESS = "no_progress"
+STALL_SLOW = "slow"
+
+# 合并/转换等本地处理阶段没有下载进度，不检测
+_WATCHED_PHASES = (PHASE_SPAWN, PHASE_EXTRACT, PHASE_DOWNLOAD)
+
+
+def parse_rate(text):
+    """'50K' / '1.5M' / '2MiB' / '4096' -> bytes per second (K/M/G are binary, as in --limit-rate). Raises ValueError."""
+    text = (text or "").strip()
+    if re.fullmatch(r'[0-9]+(?:\.[0-9]+)?', text):
+        return float(text)
+    m = re.fullmatch(r'([0-9]+(?:\.[0-9]+)?)\s*([KMGT])(?:i?B)?(?:/s)?', text, re.IGNORECASE)
+    if not m:
+        raise ValueError(f"无效的速度: {text}")
+    return parse_byte_size(f"{m.group(1)}{m.group(2)}iB")
+
+
+class _TaskProgress:
+    def __init__(self, now):
+        self.phase = PHASE_SPAWN
+        self.bytes = None
+        self.last_progress = now  # 最后一次有进展的时间
+        self.window_start = now   # 低速检测窗口
+        self.window_bytes = 0.0
+
+    def reset(self, now):
+        self.last_progress = now
+        self.window_start = now
+        self.window_bytes = self.bytes or 0.0
+
+
+class StallWatchdog(QObject):
+    """Watches the download progress of running tasks and hands stalled ones to TaskEngine.handle_stalled_task."""
+
+    def __init__(self, engine, stall_seconds=DEFAULT_STALL_SECONDS, min_speed=None, slow_seconds=DEFAULT_SLOW_SECONDS,
+                 max_retries=DEFAULT_STALL_RETRIES, clock=time.monotonic, parent=None):
+        super().__init__(parent)
+        self.log_prefix = f"[{self.__class__.__name__}] "
+        self.engine = engine
+        self.stall_seconds = stall_seconds # 0: 不检测无进展
+        self.min_speed = min_speed         # bytes/s，None: 不检测低速
+        self.slow_seconds = slow_seconds
+        self.max_retries = max_retries
+        self.clock = clock
+        self.tasks = {} # task_id: _TaskProgress (仅运行中的任务)
+
+        self.engine.task_phase.connect(self.on_task_phase)
+        self.engine.task_updated.connect(self.on_task_updated)
+        self.engine.tasks_removed.connect(self.on_tasks_removed)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(CHECK_INTERVAL_MS)
+        self.timer.timeout.connect(self.check)
+
+    def start(self):
+        limits = []
+        if self.stall_seconds: limits.append(f"无进展 {self.stall_seconds}s")
+        if self.min_speed: limits.append(f"低于 {self.min_speed / 1024:.0f}KiB/s 持续 {self.slow_seconds}s")
+        logging.info(f"{self.log_prefix}停滞检测: {', '.join(limits)}，最多重试 {self.max_retries} 次")
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+        self.tasks.clear()
+
+    def _progress_of(self, task_id):
+        progress = self.tasks.get(task_id)
+        if progress is None:
+            progress = self.tasks[task_id] = _TaskProgress(self.clock())
+        return progress
+
+    def on_task_phase(self, task_id, phase, started_at):
+        progress = self._progress_of(task_id)
+        progress.phase = phase
+        if phase == PHASE_DOWNLOAD:
+            progress.bytes = None # 新的下载段 (视频/音频分别下载)，字节数从头计算
+        progress.reset(self.clock())
+
+    def on_task_updated(self, task_id):
+        if self.engine.state_of(task_id) != STATE_RUNNING:
+            self.tasks.pop(task_id, None)
+            return
+        progress = self._progress_of(task_id)
+        downloaded = parse_downloaded_bytes(self.engine.tasks.get(task_id, {}).get("progress", ""))
+        if downloaded is None or downloaded == progress.bytes: return
+        if progress.bytes is None:
+            progress.window_bytes = downloaded # 继续下载时从已有的字节数开始计算速度
+        progress.bytes = downloaded
+        progress.last_progress = self.clock()
+
+    def on_tasks_removed(self, task_ids):
+        for task_id in task_ids:
+            self.tasks.pop(task_id, None)
+
+    def check(self):
+        now = self.clock()
+        for task_id, progress in list(self.tasks.items()):
+            if self.engine.state_of(task_id) != STATE_RUNNING:
+                self.tasks.pop(task_id, None)
+                continue
+            if progress.phase not in _WATCHED_PHASES or self.engine.is_suspended(task_id):
+                progress.reset(now) # 挂起或本地处理的时间不计入
+                continue
+            reason = None
+            if self.stall_seconds and now - progress.last_progress >= self.stall_seconds:
+                reason = STALL_NO_PROGRESS
+            elif self.min_speed and progress.phase == PHASE_DOWNLOAD and now - progress.window_start >= self.slow_seconds:
+                speed = ((progress.bytes or 0.0) - progress.window_bytes) / (now - progress.window_start)
+                if speed < self.min_speed:
+                    reason = STALL_SLOW
+                else:
+                    progress.window_start, progress.window_bytes = now, progress.bytes or 0.0
+            if reason and self.engine.handle_stalled_task(task_id, reason, self.max_retries):
+                self.tasks.pop(task_id, None)
+
+
+def add_stall_arguments(parser):
+    """Adds the --stall-* options shared by main_app.py and cli_app.py."""
+    parser.add_argument("--stall-timeout", type=float, default=DEFAULT_STALL_SECONDS, metavar="SECONDS",
+                        help=f"下载无进展超过这么多秒时停止并重新排队 (从 .part 继续)，0 为不检测 (默认: {DEFAULT_STALL_SECONDS})")
+    parser.add_argument("--stall-min-speed", default=None, metavar="RATE",
+                        help="平均速度低于此值 (如 50K) 持续 --stall-slow-seconds 时同样重新开始下载 (默认: 不检测)")
+    parser.add_argument("--stall-slow-seconds", type=float, default=DEFAULT_SLOW_SECONDS, metavar="SECONDS",
+                        help=f"低速检测的时间窗口 (默认: {DEFAULT_SLOW_SECONDS})")
+    parser.add_argument("--stall-retries", type=int, default=DEFAULT_STALL_RETRIES,
+                        help=f"每个任务因停滞重新开始的最多次数，之后标记为失败 (默认: {DEFAULT_STALL_RETRIES})")
+
+
+def start_stall_watchdog_from_args(engine, args, parent=None):
+    """Creates and starts the StallWatchdog for the --stall-* options, or returns None if both checks are off. Raises ValueError."""
+    min_speed = parse_rate(args.stall_min_speed) if args.stall_min_speed else None
+    if args.stall_timeout < 0 or args.stall_slow_seconds <= 0 or args.stall_retries < 0:
+        raise ValueError("--stall-timeout/--stall-retries 不能为负数，--stall-slow-seconds 必须大于 0")
+    if not args.stall_timeout and not min_speed:
+        return None
+    watchdog = StallWatchdog(engine, stall_seconds=args.stall_timeout, min_speed=min_speed,
+                             slow_seconds=args.stall_slow_seconds, max_retries=args.stall_retries, parent=parent)
+    watchdog.start()
+    return watchdog
@@ -0,0 +1,288 @@
+# subscriptions.py
+import os
+import json
+import time
+import random
+import logging
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from constants import get_app_data_dir
+from workers import YtDlpProbeWorker
+from url_import import canonical_url
+
+SUBSCRIPTIONS_FILE_NAME = "subscriptions.json"
+DEFAULT_INTERVAL_SECONDS = 3600
+MIN_INTERVAL_SECONDS = 60
+DEFAULT_PROBE_ENTRIES = 30       # 每次检查只列出最新的 N 个条目
+MAX_PROBE_ENTRIES = 480          # 最新 N 个全是新条目时，下一次加倍检查 (追赶积压)，不超过此值
+MAX_SEEN_IDS = 2000              # 每个订阅保存的已见条目ID数
+DEFAULT_MAX_CONCURRENT_PROBES = 4
+INTERVAL_JITTER = 0.1            # 检查间隔随机浮动 ±10%，避免所有订阅同时到期
+MAX_BACKOFF_SECONDS = 24 * 3600  # 连续失败时间隔加倍，最长一天
+TICK_INTERVAL_MS = 2000
+SAVE_DELAY_MS = 5000
+
+
+class Subscription:
+    """A channel/playlist URL checked periodically; entries whose id was not seen before become tasks."""
+
+    def __init__(self, url, title="", interval_seconds=DEFAULT_INTERVAL_SECONDS, probe_entries=DEFAULT_PROBE_ENTRIES,
+                 autostart=True, enabled=True):
+        self.url = url
+        self.title = title
+        self.interval_seconds = max(MIN_INTERVAL_SECONDS, int(interval_seconds))
+        self.probe_entries = probe_entries
+        self.autostart = autostart
+        self.enabled = enabled
+        self.seen_ids = []       # 最新的在前
+        self.last_checked = 0.0
+        self.next_check = 0.0    # 0: 尚未安排
+        self.last_error = ""
+        self.failures = 0
+        self.new_item_count = 0  # 累计添加的任务数
+        self.catch_up_entries = 0 # >0: 下一次检查使用更大的条目数
+        self.catch_up_added = 0   # 本轮追赶中已记录的新条目数 (seen_ids 的前这么多个)
+        self._seen_set = set()
+
+    def to_dict(self):
+        return {k: v for k, v in self.__dict__.items() if not k.startswith("_")}
+
+    @classmethod
+    def from_dict(cls, data):
+        subscription = cls(data["url"], data.get("title", ""), data.get("interval_seconds", DEFAULT_INTERVAL_SECONDS),
+                           data.get("probe_entries", DEFAULT_PROBE_ENTRIES), data.get("autostart", True), data.get("enabled", True))
+        for key in ("seen_ids", "last_checked", "next_check", "last_error", "failures", "new_item_count", "catch_up_entries", "catch_up_added"):
+            if key in data:
+                setattr(subscription, key, data[key])
+        subscription._seen_set = set(subscription.seen_ids)
+        return subscription
+
+    def is_baseline(self):
+        """True before the first successful check: existing entries are recorded, not downloaded."""
+        return not self.last_checked
+
+    def record_entries(self, entries):
+        """Returns the entries not seen before and remembers all of them."""
+        new_entries = [entry for entry in entries if entry["id"] not in self._seen_set]
+        if new_entries:
+            self.seen_ids = [entry["id"] for entry in new_entries] + self.seen_ids
+            del self.seen_ids[MAX_SEEN_IDS:]
+            self._seen_set = set(self.seen_ids)
+        return new_entries
+
+    def schedule_next(self, now, delay=None):
+        if delay is None:
+            delay = min(self.interval_seconds * (2 ** self.failures), MAX_BACKOFF_SECONDS)
+            delay *= random.uniform(1 - INTERVAL_JITTER, 1 + INTERVAL_JITTER)
+        self.next_check = now + delay
+
+
+class SubscriptionStore:
+    """Subscriptions keyed by canonical URL, persisted as one JSON file (written atomically)."""
+
+    def __init__(self, file_path=None):
+        self.file_path = file_path or os.path.join(get_app_data_dir(), SUBSCRIPTIONS_FILE_NAME)
+        self.subscriptions = {} # canonical_url: Subscription
+
+    def load(self):
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return self
+        except (OSError, json.JSONDecodeError) as e:
+            logging.error(f"无法读取订阅文件 {self.file_path}: {e}")
+            return self
+        for item in data.get("subscriptions", []):
+            try:
+                subscription = Subscription.from_dict(item)
+            except (KeyError, TypeError, ValueError) as e:
+                logging.warning(f"忽略无效的订阅 {item!r}: {e}")
+                continue
+            self.subscriptions[canonical_url(subscription.url)] = subscription
+        return self
+
+    def save(self):
+        data = {"subscriptions": [subscription.to_dict() for subscription in self.subscriptions.values()]}
+        tmp_path = self.file_path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.file_path)
+        except OSError as e:
+            logging.error(f"无法保存订阅文件 {self.file_path}: {e}")
+
+    def get(self, url):
+        return self.subscriptions.get(canonical_url(url))
+
+    def add(self, url, **options):
+        """Adds (or returns the existing) subscription for url."""
+        key = canonical_url(url)
+        if key not in self.subscriptions:
+            self.subscriptions[key] = Subscription(url.strip(), **options)
+        return self.subscriptions[key]
+
+    def remove(self, url):
+        return self.subscriptions.pop(canonical_url(url), None) is not None
+
+
+class SubscriptionMonitor(QObject):
+    """
+    Checks due subscriptions with YtDlpProbeWorker (at most max_concurrent_probes at a time)
+    and adds their new entries to the TaskEngine. Each subscription has its own jittered
+    interval; the first check after a subscription is added only records what exists.
+    """
+    subscriptions_changed = pyqtSignal()    # 订阅列表或检查状态变化 (界面刷新)
+    new_items_found = pyqtSignal(str, int)  # subscription url, 添加的任务数
+
+    def __init__(self, engine, store, max_concurrent_probes=DEFAULT_MAX_CONCURRENT_PROBES, fetch_options=None, parent=None):
+        super().__init__(parent)
+        self.log_prefix = f"[{self.__class__.__name__}] "
+        self.engine = engine
+        self.store = store
+        self.max_concurrent_probes = max_concurrent_probes
+        self.fetch_options = fetch_options or {}
+        self.fetch_options_provider = None # 可选: 每次检查时返回 fetch_options (GUI: 当前界面设置)
+        self.probes = {} # canonical_url: YtDlpProbeWorker
+        self._save_pending = False
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(TICK_INTERVAL_MS)
+        self.timer.timeout.connect(self.check_due)
+
+    def start(self):
+        now = time.time()
+        for subscription in self.store.subscriptions.values():
+            if not subscription.next_check: # 新订阅分散到一个间隔内，而不是同时检查
+                subscription.schedule_next(now, random.uniform(0, min(subscription.interval_seconds, 300)))
+        self.timer.start()
+        self.check_due()
+        logging.info(f"{self.log_prefix}监控 {len(self.store.subscriptions)} 个订阅 (同时检查最多 {self.max_concurrent_probes} 个)")
+
+    def stop(self):
+        self.timer.stop()
+        for probe in list(self.probes.values()):
+            probe.stop()
+            probe.wait(5000)
+        self.store.save()
+
+    def add_subscription(self, url, **options):
+        subscription = self.store.add(url, **options)
+        if not subscription.next_check:
+            subscription.schedule_next(time.time(), 0) # 立即建立基线
+        self._request_save()
+        self.subscriptions_changed.emit()
+        self.check_due()
+        return subscription
+
+    def remove_subscriptions(self, urls):
+        removed = sum(1 for url in urls if self.store.remove(url))
+        if removed:
+            self._request_save()
+            self.subscriptions_changed.emit()
+        return removed
+
+    def check_now(self, urls=None):
+        """Makes the given subscriptions (default: all) due immediately."""
+        now = time.time()
+        for key, subscription in self.store.subscriptions.items():
+            if urls is None or key in {canonical_url(url) for url in urls}:
+                subscription.next_check = now
+        self.check_due()
+
+    def check_due(self):
+        free_slots = self.max_concurrent_probes - len(self.probes)
+        if free_slots <= 0: return
+        now = time.time()
+        due = [(subscription.next_check, key) for key, subscription in self.store.subscriptions.items()
+               if subscription.enabled and subscription.next_check <= now and key not in self.probes]
+        for _, key in sorted(due)[:free_slots]:
+            self._start_probe(key, self.store.subscriptions[key])
+
+    def _start_probe(self, key, subscription):
+        fetch_options = self.fetch_options_provider() if self.fetch_options_provider else self.fetch_options
+        probe = YtDlpProbeWorker(
+            subscription.url, subscription.catch_up_entries or subscription.probe_entries,
+            cookies_browser=fetch_options.get("cookies_browser"),
+            cookies_file_path=fetch_options.get("cookies_file_path"),
+            extra_args=fetch_options.get("extra_args_for_fetching"),
+        )
+        probe.probed_signal.connect(lambda url, entries, key=key: self._on_probed(key, entries))
+        probe.error_signal.connect(lambda url, msg, key=key: self._on_probe_error(key, msg))
+        probe.finished.connect(lambda key=key: self._on_probe_finished(key))
+        self.probes[key] = probe
+        probe.start()
+
+    def _on_probe_finished(self, key):
+        probe = self.probes.pop(key, None)
+        if probe: probe.deleteLater()
+        self._request_save()
+        self.subscriptions_changed.emit()
+        self.check_due()
+
+    def _on_probe_error(self, key, msg):
+        subscription = self.store.subscriptions.get(key)
+        if subscription is None: return # 检查期间被删除
+        subscription.failures += 1
+        subscription.last_error = msg
+        subscription.schedule_next(time.time())
+        logging.warning(f"{self.log_prefix}检查订阅失败 ({subscription.failures} 次) {subscription.url}: {msg}")
+
+    def _on_probed(self, key, entries):
+        subscription = self.store.subscriptions.get(key)
+        if subscription is None: return
+        now = time.time()
+        baseline = subscription.is_baseline()
+        probed_count = subscription.catch_up_entries or subscription.probe_entries
+        # 追赶中前几次检查记录的条目不算"已知": 只有碰到更早就见过的条目，才说明积压已经补齐
+        catch_up_ids = set(subscription.seen_ids[:subscription.catch_up_added]) if subscription.catch_up_entries else set()
+        reached_known = any(entry["id"] in subscription._seen_set and entry["id"] not in catch_up_ids for entry in entries)
+        new_entries = subscription.record_entries(entries)
+        subscription.last_checked = now
+        subscription.failures = 0
+        subscription.last_error = ""
+
+        added_count = 0
+        if not baseline:
+            for entry in reversed(new_entries): # 按发布顺序添加 (列表中最新的在前)
+                if self.engine.is_known_url(entry["url"]): continue
+                task_id = self.engine.add_task(entry["url"], entry["title"], save=False)
+                if task_id:
+                    added_count += 1
+                    if subscription.autostart: self.engine.enqueue_task(task_id, save=False)
+            if added_count:
+                subscription.new_item_count += added_count
+                self.engine.save_tasks_to_file()
+                if subscription.autostart: self.engine.check_and_start_tasks()
+                logging.info(f"{self.log_prefix}订阅 {subscription.url}: {added_count} 个新条目")
+                self.new_items_found.emit(subscription.url, added_count)
+
+        # 检查到的条目里没有以前见过的: 可能还有更多，立即用加倍的条目数再检查一次
+        if (not baseline and (new_entries or catch_up_ids) and not reached_known
+                and len(entries) == probed_count < MAX_PROBE_ENTRIES):
+            subscription.catch_up_entries = min(probed_count * 2, MAX_PROBE_ENTRIES)
+            subscription.catch_up_added += len(new_entries)
+            subscription.schedule_next(now, 0)
+        else:
+            subscription.catch_up_entries = subscription.catch_up_added = 0
+            subscription.schedule_next(now)
+
+    def _request_save(self):
+        if not self._save_pending:
+            self._save_pending = True
+            QTimer.singleShot(SAVE_DELAY_MS, self._save)
+
+    def _save(self):
+        self._save_pending = False
+        self.store.save()
+
+
+def add_subscription_arguments(parser):
+    """Adds the subscription options shared by main_app.py and cli_app.py."""
+    group = parser.add_argument_group("订阅")
+    group.add_argument("--subscriptions", default=None, metavar="PATH",
+                       help=f"订阅文件 (默认: 数据目录下的 {SUBSCRIPTIONS_FILE_NAME})")
+    group.add_argument("--max-probes", type=int, default=DEFAULT_MAX_CONCURRENT_PROBES,
+                       help=f"同时检查的订阅数上限 (默认: {DEFAULT_MAX_CONCURRENT_PROBES})")
+    return group
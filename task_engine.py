@@ -0,0 +1,1566 @@
+# task_engine.py
+import os
+import json
+import time
+import sqlite3
+import logging
+import functools
+import threading
+from collections import deque
+from datetime import datetime
+from PyQt5.QtCore import QCoreApplication, QObject, QTimer, pyqtSignal # 只依赖 QtCore，无需加载任何窗口部件
+
+from workers import YtDlpListFetcher, DownloadTaskWorker, stop_workers_in_parallel
+from constants import TASKS_HISTORY_FILE_NAME, get_app_data_dir
+from url_import import canonical_url
+from postprocess import PostProcessStage
+from transcode import TranscodeStage, parse_output_specs, transcode_output_path, CONV_MODE_AUDIO
+from info_cache import info_json_path, remove_info_jsons, prune_info_cache
+from partials import snapshot_partial, verify_partial, remove_partials, partial_size, partial_files
+from file_index import DedupeLinkWorker, DEDUPE_FALLBACK, format_key_for, video_keys
+from task_output import TaskOutputLog, read_task_output, remove_task_outputs, DEFAULT_MAX_LINES as DEFAULT_OUTPUT_MAX_LINES
+from task_state import (
+    TaskStateIndex, state_from_legacy_fields, STARTABLE_STATES,
+    STATE_WAITING, STATE_QUEUED, STATE_RUNNING, STATE_POSTPROCESSING, STATE_PAUSED, STATE_FAILED, STATE_DONE
+)
+
+# --- 下载参数 (界面与命令行共用) ---
+CONV_MODES = ['无转换', '音频提取转换', '视频格式转换']
+CONV_MODE_ALIASES = {"none": '无转换', "audio": '音频提取转换', "video": '视频格式转换'}
+
+DEFAULT_QUALITY_PRESET = "最佳 (默认)"
+# 视频质量预设 -> yt-dlp -f 格式代码 (顺序即界面下拉框顺序)
+VIDEO_QUALITY_PRESETS = {
+    "最佳 (默认)": "", # yt-dlp default
+    "4K (2160p)": "bestvideo[height<=?2160]+bestaudio/best[height<=?2160]",
+    "2K (1440p)": "bestvideo[height<=?1440]+bestaudio/best[height<=?1440]",
+    "1080p": "bestvideo[height<=?1080]+bestaudio/best[height<=?1080]",
+    "720p": "bestvideo[height<=?720]+bestaudio/best[height<=?720]",
+    "480p": "bestvideo[height<=?480]+bestaudio/best[height<=?480]",
+    "360p": "bestvideo[height<=?360]+bestaudio/best[height<=?360]",
+    "仅音频 (最佳)": "bestaudio/best",
+    "仅音频 (aac)": "bestaudio[ext=m4a]/bestaudio[acodec=aac]", # More specific
+    # For mp3, yt-dlp typically extracts best audio then converts.
+    # So format selection is 'bestaudio/best', and conversion mode + target format handle the mp3 part.
+    "仅音频 (mp3)": "bestaudio/best",
+}
+
+# 命令行/控制接口中更易输入的视频质量别名 -> 预设名称
+QUALITY_ALIASES = {
+    "best": DEFAULT_QUALITY_PRESET,
+    "2160": "4K (2160p)", "1440": "2K (1440p)", "1080": "1080p", "720": "720p", "480": "480p", "360": "360p",
+    "audio": "仅音频 (最佳)", "aac": "仅音频 (aac)", "mp3": "仅音频 (mp3)",
+}
+
+DEFAULT_SUSPEND_TIMEOUT_SECONDS = 600 # 挂起模式下，暂停超过此时间的任务结束进程 (之后继续时重新启动)
+SUSPEND_CHECK_INTERVAL_MS = 5000
+
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.expanduser("~"), "Downloads")
+
+
+def parse_audio_quality_text(audio_quality_text):
+    """'最佳 (0)' -> '0', '192K' -> '192K'"""
+    audio_quality_text = (audio_quality_text or "").strip()
+    if "(" in audio_quality_text and ")" in audio_quality_text:
+        try:
+            return audio_quality_text.split('(')[1].split(')')[0].strip()
+        except IndexError:
+            logging.warning(f"无法从 {audio_quality_text} 解析音频质量值，使用原始文本")
+    return audio_quality_text
+
+
+def build_download_params(output_dir, cookies_browser='无', cookies_file_path="", conv_mode='无转换',
+                          conv_fmt="", quality_preset=DEFAULT_QUALITY_PRESET, audio_quality="0",
+                          limit_rate="", post_script="", extra_args="", off_peak_only=False, keep_source=False):
+    """Builds the per-task params dict consumed by DownloadTaskWorker."""
+    conv_mode = CONV_MODE_ALIASES.get(conv_mode, conv_mode)
+    quality_preset = QUALITY_ALIASES.get(quality_preset, quality_preset)
+    if quality_preset not in VIDEO_QUALITY_PRESETS:
+        logging.warning(f"未知的视频质量预设 '{quality_preset}'，使用 '{DEFAULT_QUALITY_PRESET}'")
+        quality_preset = DEFAULT_QUALITY_PRESET
+    if quality_preset == "仅音频 (mp3)":
+        logging.info("为 '仅音频 (mp3)' 预设选择了 'bestaudio/best'，请配合使用 '音频提取转换' 和 'mp3' 目标格式。")
+    return {
+        "output_dir": output_dir,
+        "cookies_browser": cookies_browser,
+        "cookies_file_path": (cookies_file_path or "").strip(),
+        "conv_mode": conv_mode,
+        "conv_fmt": (conv_fmt or "").strip(),
+        "video_format": VIDEO_QUALITY_PRESETS[quality_preset], # This is the -f format code
+        "selected_quality_preset": quality_preset, # Store the user-friendly preset name
+        "audio_quality": parse_audio_quality_text(audio_quality), # For -x --audio-quality
+        "limit_rate": (limit_rate or "").strip(),
+        "post_script": (post_script or "").strip(),
+        "extra_args": (extra_args or "").strip(), # These are for download worker
+        "off_peak_only": _as_bool(off_peak_only), # 只在时段规则中的空闲时段下载 (scheduler.py)
+        "keep_source": _as_bool(keep_source), # 转码后保留下载的源文件 (conv_fmt 可以是逗号分隔的多个输出格式)
+    }
+
+
+def _as_bool(value):
+    if isinstance(value, str): # 控制接口的预设值为字符串
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+def _ensure_param_defaults(params, fallback=None):
+    # 旧版本保存的参数可能缺少格式选择相关的键
+    fallback = fallback or {}
+    params.setdefault("video_format", fallback.get("video_format", ""))
+    params.setdefault("audio_quality", fallback.get("audio_quality", "0"))
+    params.setdefault("selected_quality_preset", fallback.get("selected_quality_preset", DEFAULT_QUALITY_PRESET))
+    return params
+
+
+MAX_DEFERRED_SCAN = 1000 # 每次检查队列时最多跳过的暂不能启动的任务数
+
+
+class TaskEngine(QObject):
+    """
+    Download queue engine shared by the GUI and the headless CLI: owns the tasks,
+    their state machine, the download/fetch queues, the workers and persistence.
+    Views observe it through the signals below and never touch workers directly.
+    """
+    task_added = pyqtSignal(str)          # task_id
+    task_updated = pyqtSignal(str)        # task_id (status/progress/speed/state changed)
+    tasks_removed = pyqtSignal(list)      # [task_id, ...] removed from the engine
+    state_counts_changed = pyqtSignal(dict) # {state: count}
+    fetch_started = pyqtSignal(str, int)  # url, remaining urls in fetch queue
+    fetch_error = pyqtSignal(str, str)    # url, error message
+    fetch_empty = pyqtSignal(str)         # url resolved successfully but returned no entries
+    fetch_queue_drained = pyqtSignal(int) # number of urls processed in this batch
+    notice = pyqtSignal(str, str)         # title, text: user-facing notices (dialogs in GUI, log in CLI)
+    fetch_finished = pyqtSignal(str, float, bool) # url, seconds spent resolving, success
+    task_error = pyqtSignal(str, str)     # task_id, error message from the worker
+    task_timing = pyqtSignal(str, str, float) # task_id, phase (workers.TIMING_*), seconds
+    task_phase = pyqtSignal(str, str, float)  # task_id, phase (workers.PHASE_*), time.time() at phase start
+    task_stalled = pyqtSignal(str, str)       # task_id, reason (stall_watchdog.STALL_*): 下载停滞，已停止进程
+
+    def __init__(self, history_file_path=None, parent=None):
+        super().__init__(parent)
+        self.log_prefix = f"[{self.__class__.__name__}] "
+        self.history_file_path = history_file_path or os.path.join(get_app_data_dir(), TASKS_HISTORY_FILE_NAME)
+        # 每个任务最近的 yt-dlp 输出 (压缩文件)，按历史文件区分目录，避免界面与命令行的任务ID冲突
+        self.output_log_dir = os.path.splitext(self.history_file_path)[0] + "_output"
+        self._output_logs = {} # task_id: TaskOutputLog，仅限工作线程仍在运行的任务
+        # 解析阶段得到的完整视频信息 (按链接)，下载时用 --load-info-json 代替重新解析
+        self.info_json_dir = os.path.splitext(self.history_file_path)[0] + "_info"
+
+        self.tasks = {} # task_id: task_data_dict
+        self.task_id_counter = 0 # 会在加载历史后调整
+        self.task_states = TaskStateIndex() # 任务状态机: 每个状态对应的任务ID集合
+        self.url_index = {} # canonical_url(url): task_id，用于添加任务时去重
+        self._pending_fetch_keys = set() # 解析队列中及正在解析的链接的 canonical_url
+
+        self.active_workers = 0
+        self.max_concurrent = 1 # 默认并发数
+        self.task_queue = [] # 等待下载的任务ID列表
+        self._urls_to_fetch_queue = deque() # 等待解析的 (url, fetch_options, params, autostart) 列表
+        self.current_fetch_url = "" # 当前正在解析的URL
+        self._current_fetch_params = None
+        self._current_fetch_autostart = False
+        self._current_fetch_started = 0.0
+        self._current_fetch_failed = False
+        self.list_fetcher = None
+        self.list_fetcher_processed_count = 0 # 用于解析完成后的提示
+
+        # 返回默认下载参数的回调 (GUI: 当前界面设置; CLI: 命令行参数)，返回 None 表示参数无效
+        self.default_params_provider = None
+        # 由 scheduler.TaskScheduler 按时段设置; None 表示不覆盖
+        self.concurrency_override = None # 代替 max_concurrent
+        self.limit_rate_override = None  # 代替每个任务的 limit_rate ("" 为不限速)
+        # (task_id, task_data) -> 现在是否可以启动 (时段规则、主机限流)；不能启动的任务留在队列中
+        self.start_filters = []
+        # >0: 暂停时用 SIGSTOP 挂起 yt-dlp 进程组，继续时立即 SIGCONT；挂起超过此秒数后改为结束进程
+        self.suspend_timeout_seconds = 0
+        self.file_index = None # file_index.FileIndex: 已下载过的视频直接使用已有文件
+        self._suspended = {} # task_id: 挂起时间 (time.monotonic())；None 表示挂起超时、进程正在结束
+
+        self._pending_purge_ids = set() # 已停止、等待批量移除的任务ID（标记删除的活动任务）
+        self._state_counts_emit_pending = False
+        self._save_pending = False
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(1000) # 1秒检查一次队列
+        self.timer.timeout.connect(self.check_and_start_tasks)
+        # 第二阶段: 下载完成后的后处理有自己的队列和并发数
+        self.postprocess = PostProcessStage(parent=self)
+        self.postprocess.job_started.connect(self._on_postprocess_started)
+        self.postprocess.job_finished.connect(self._on_postprocess_finished)
+        self.postprocess.timing.connect(self.task_timing)
+        self.postprocess.phase.connect(self.task_phase)
+        # 音频提取/视频格式转换由转码阶段在下载后运行 ffmpeg (限制并发、降低优先级)，而不是在每个下载中运行
+        self.transcode = TranscodeStage(parent=self)
+        self.transcode.job_started.connect(self._on_transcode_started)
+        self.transcode.job_finished.connect(self._on_transcode_finished)
+        self.transcode.timing.connect(self.task_timing)
+        self.transcode.phase.connect(self.task_phase)
+
+        self.suspend_timer = QTimer(self)
+        self.suspend_timer.setInterval(SUSPEND_CHECK_INTERVAL_MS)
+        self.suspend_timer.timeout.connect(self._expire_suspended_tasks)
+
+    def start(self):
+        self.timer.start()
+        threading.Thread(target=prune_info_cache, args=(self.info_json_dir,), name="PruneInfoCache", daemon=True).start()
+
+    # --- 状态 ---
+    def _set_task_state(self, task_id, new_state):
+        task_data = self.tasks.get(task_id)
+        if task_data is None: return
+        task_data["state"] = new_state
+        self.task_states.set_state(task_id, new_state)
+        self._schedule_state_counts_emit()
+
+    def _schedule_state_counts_emit(self):
+        # 批量操作时会连续改变很多任务的状态，合并为一次通知
+        if not self._state_counts_emit_pending:
+            self._state_counts_emit_pending = True
+            QTimer.singleShot(0, self._emit_state_counts)
+
+    def _emit_state_counts(self):
+        self._state_counts_emit_pending = False
+        self.state_counts_changed.emit(self.task_states.counts())
+
+    def task_id_for_url(self, url):
+        """Task that already has this URL (compared by canonical_url), or None."""
+        return self.url_index.get(canonical_url(url))
+
+    def has_url_key(self, url_key):
+        """True if a task or a pending resolve already has this canonical_url() key."""
+        return url_key in self.url_index or url_key in self._pending_fetch_keys
+
+    def is_known_url(self, url):
+        return self.has_url_key(canonical_url(url))
+
+    def pending_fetch_count(self):
+        return len(self._urls_to_fetch_queue)
+
+    def is_fetching(self):
+        return bool(self._urls_to_fetch_queue) or bool(self.list_fetcher and self.list_fetcher.isRunning())
+
+    def state_of(self, task_id):
+        return self.task_states.state_of(task_id)
+
+    def task_snapshot(self, task_id):
+        """JSON-safe copy of a task (no worker object or internal flags), or None."""
+        task_data = self.tasks.get(task_id)
+        if task_data is None: return None
+        snapshot = {k: v for k, v in task_data.items() if k != "worker" and not k.startswith("_")}
+        snapshot["state"] = self.task_states.state_of(task_id)
+        snapshot["params"] = dict(task_data.get("params") or {})
+        return snapshot
+
+    def is_idle(self):
+        """True when nothing is queued, running or waiting to be resolved."""
+        return (not self.task_states.count(STATE_QUEUED) and not self.task_states.count(STATE_RUNNING)
+                and not self.task_states.count(STATE_POSTPROCESSING) and not self.is_fetching())
+
+    def is_suspended(self, task_id):
+        return task_id in self._suspended
+
+    def effective_max_concurrent(self):
+        return self.max_concurrent if self.concurrency_override is None else self.concurrency_override
+
+    def set_max_concurrent(self, value):
+        self.max_concurrent = value
+        self.check_and_start_tasks() # Potentially start more tasks
+
+    def _default_params(self):
+        if self.default_params_provider:
+            params = self.default_params_provider()
+            if params: return params.copy()
+        return None
+
+    # --- 持久化 ---
+    def request_save(self, delay_ms=2000):
+        """Saves once after delay_ms, however often it is called in between (for streamed batch adds)."""
+        if not self._save_pending:
+            self._save_pending = True
+            QTimer.singleShot(delay_ms, self._run_requested_save)
+
+    def _run_requested_save(self):
+        if self._save_pending:
+            self.save_tasks_to_file()
+
+    def save_tasks_to_file(self):
+        self._save_pending = False
+        logging.debug(f"{self.log_prefix}Saving tasks to file.")
+        data_to_save = {
+            "task_id_counter": self.task_id_counter,
+            "tasks": []
+        }
+        for task_id, task_data in self.tasks.items():
+            task_copy = task_data.copy()
+            task_copy.pop("worker", None)
+            # 旧版本只认识 paused/failed 标志，保存时由状态机推导出来
+            task_state = self.task_states.state_of(task_id) or STATE_WAITING
+            task_copy["state"] = task_state
+            task_copy["paused"] = task_state == STATE_PAUSED
+            task_copy["failed"] = task_state == STATE_FAILED
+
+            if not isinstance(task_copy.get("params"), dict):
+                 task_copy["params"] = {}
+            _ensure_param_defaults(task_copy["params"])
+
+            data_to_save["tasks"].append(task_copy)
+
+        file_path = self.history_file_path
+        try:
+            with open(file_path, 'w', encoding='utf-8') as f:
+                json.dump(data_to_save, f, indent=4, ensure_ascii=False)
+            logging.info(f"{self.log_prefix}Tasks saved to {file_path}")
+        except IOError as e:
+            logging.error(f"{self.log_prefix}Error saving tasks to {file_path}: {e}", exc_info=True)
+        except TypeError as e:
+            logging.error(f"{self.log_prefix}Error serializing tasks for saving: {e}", exc_info=True)
+
+    def load_tasks_from_file(self):
+        logging.debug(f"{self.log_prefix}Loading tasks from file.")
+        file_path = self.history_file_path
+        if not os.path.exists(file_path):
+            logging.info(f"{self.log_prefix}Tasks file {file_path} not found, starting fresh.")
+            return
+
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                loaded_data = json.load(f)
+        except (IOError, json.JSONDecodeError) as e:
+            logging.error(f"{self.log_prefix}Error loading tasks from {file_path}: {e}", exc_info=True)
+            self.notice.emit("加载错误", f"无法从 {file_path} 加载任务列表:\n{e}")
+            try:
+                corrupted_file_path = file_path + f".corrupted_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                os.rename(file_path, corrupted_file_path)
+                logging.info(f"{self.log_prefix}Corrupted tasks file renamed to {corrupted_file_path}")
+                self.notice.emit("提示", f"损坏的任务历史文件已备份为:\n{corrupted_file_path}")
+            except OSError as re: logging.error(f"{self.log_prefix}Could not rename corrupted tasks file: {re}")
+            return
+
+        self.task_id_counter = loaded_data.get("task_id_counter", 0)
+        loaded_tasks_list = loaded_data.get("tasks", [])
+        max_loaded_id_val = 0
+
+        for task_data_dict in loaded_tasks_list:
+            task_id_from_file = task_data_dict.get("id")
+            if not task_id_from_file:
+                logging.warning(f"{self.log_prefix}Loaded task data missing 'id', skipping: {task_data_dict.get('title', 'N/A')}")
+                continue
+
+            loaded_state = state_from_legacy_fields(task_data_dict)
+            if loaded_state in (STATE_RUNNING, STATE_QUEUED):
+                # 上次退出时仍在下载或排队的任务视为被中断
+                task_data_dict["status"] = "已暂停(中断)"
+                loaded_state = STATE_PAUSED
+            task_data_dict["state"] = loaded_state
+
+            if not isinstance(task_data_dict.get("params"), dict):
+                task_data_dict["params"] = {}
+            _ensure_param_defaults(task_data_dict["params"])
+
+            self.add_task(
+                url=task_data_dict.get("url",""), title=task_data_dict.get("title","N/A"),
+                task_id_override=task_id_from_file, initial_data=task_data_dict
+            )
+            try:
+                current_id_val = int(task_id_from_file)
+                if current_id_val > max_loaded_id_val: max_loaded_id_val = current_id_val
+            except ValueError: pass
+
+        self.task_id_counter = max(self.task_id_counter, max_loaded_id_val)
+        logging.info(f"{self.log_prefix}{len(self.tasks)} tasks loaded. Next task ID will be based on {self.task_id_counter + 1}")
+        resumable = [task_data["partials"]["files"] for task_data in self.tasks.values() if task_data.get("partials", {}).get("files")]
+        if resumable:
+            partial_bytes = sum(partial_size(destination) for files in resumable for destination in files)
+            logging.info(f"{self.log_prefix}{len(resumable)} unfinished downloads have partial files ({partial_bytes / 1024 ** 2:.1f} MiB), they continue from there.")
+        # 上次退出时未完成的转码和后处理重新排队
+        for task_id in [tid for tid in self.tasks if self.task_states.state_of(tid) == STATE_POSTPROCESSING]: # 保持历史中的顺序
+            if self.tasks[task_id].get("transcode_source"):
+                self._submit_transcode(task_id)
+            else:
+                self._submit_postprocess(task_id)
+
+    # --- 任务增删 ---
+    def add_task(self, url, title, params=None, task_id_override=None, initial_data=None, save=True):
+        """
+        Adds a new task (or restores one from history when initial_data is given).
+        Returns the task_id, or None if a task with the same URL already exists.
+        """
+        if initial_data and task_id_override and task_id_override in self.tasks:
+            logging.info(f"{self.log_prefix}Task {task_id_override} already loaded/exists. Updating data.")
+            existing_task_data = self.tasks[task_id_override]
+            existing_task_data.update(initial_data)
+            existing_task_data["worker"] = None
+            self._set_task_state(task_id_override, state_from_legacy_fields(initial_data))
+
+            if not isinstance(existing_task_data.get("params"), dict):
+                existing_task_data["params"] = {}
+            _ensure_param_defaults(existing_task_data["params"], initial_data.get("params", {}))
+
+            self.task_updated.emit(task_id_override)
+            return task_id_override
+        elif not initial_data and canonical_url(url) in self.url_index:
+            logging.info(f"{self.log_prefix}Task with URL '{url}' already exists. Skipping.")
+            return None
+
+        current_task_id = ""
+        if initial_data and task_id_override:
+            current_task_id = task_id_override
+        else:
+            self.task_id_counter += 1
+            current_task_id = str(self.task_id_counter)
+
+        status_val = "等待"
+        progress_val = ""
+        speed_val = ""
+        filepath_val = ""
+        state_val = STATE_WAITING
+        params_val = {}
+        task_title = title
+
+        if initial_data:
+            task_title = initial_data.get("title", title)
+            status_val = initial_data.get("status", "等待")
+            progress_val = initial_data.get("progress", "")
+            speed_val = initial_data.get("speed", "")
+            filepath_val = initial_data.get("filepath", "")
+            state_val = state_from_legacy_fields(initial_data)
+
+            loaded_params = initial_data.get("params")
+            if isinstance(loaded_params, dict):
+                params_val = loaded_params.copy()
+            _ensure_param_defaults(params_val)
+        else:
+            new_task_params = params.copy() if params else self._default_params()
+            if new_task_params:
+                params_val = new_task_params
+            else:
+                logging.error(f"{self.log_prefix}Failed to get default params for new task {title}. Using defaults.")
+                params_val = {
+                    "video_format": "", "audio_quality": "0", "selected_quality_preset": DEFAULT_QUALITY_PRESET,
+                    "output_dir": DEFAULT_OUTPUT_DIR
+                }
+
+        task_entry_base = {
+            "id": current_task_id, "url": url, "title": task_title, "status": status_val,
+            "progress": progress_val, "speed": speed_val, "filepath": filepath_val,
+            "worker": None, "state": state_val, "params": params_val,
+            "_marked_for_deletion_while_active": False
+        }
+
+        final_task_entry = initial_data.copy() if initial_data else {}
+        final_task_entry.update(task_entry_base)
+        for legacy_field in ("paused", "failed", "in_queue", "row"): # 已由状态机/界面自身取代
+            final_task_entry.pop(legacy_field, None)
+
+        if not isinstance(final_task_entry.get("params"), dict):
+            final_task_entry["params"] = {}
+        _ensure_param_defaults(final_task_entry["params"], params_val)
+
+        self.tasks[current_task_id] = final_task_entry
+        self.url_index.setdefault(canonical_url(url), current_task_id)
+        self._set_task_state(current_task_id, state_val)
+        logging.debug(f"{self.log_prefix}Task {current_task_id} ('{task_title}') add/load. Stat:{status_val}, Params: {final_task_entry['params']}")
+
+        self.task_added.emit(current_task_id)
+
+        if not initial_data and save:
+            self.save_tasks_to_file()
+        return current_task_id
+
+    def delete_tasks(self, task_ids):
+        """
+        Deletes many tasks in one pass. Active workers are stopped in parallel and
+        purged once they exit; inactive tasks are purged immediately, the queue is
+        rebuilt once and the history is saved once.
+        """
+        inactive_ids = []
+        workers_to_stop = []
+        for task_id in task_ids:
+            task_data = self.tasks.get(task_id)
+            if task_data is None:
+                continue
+            if task_data.get("_marked_for_deletion_while_active"):
+                continue # Already stopping, its finish/error handler will purge it
+
+            worker = task_data.get("worker")
+            if worker and worker.isRunning():
+                logging.debug(f"{self.log_prefix}Deleting task {task_id}: stopping active worker & marking for deletion.")
+                task_data["_marked_for_deletion_while_active"] = True
+                workers_to_stop.append(worker)
+                self.task_updated.emit(task_id) # Show "停止中..." / "删除中"
+            else:
+                inactive_ids.append(task_id)
+
+        if workers_to_stop:
+            logging.info(f"{self.log_prefix}Stopping {len(workers_to_stop)} active workers in parallel for deletion.")
+            stop_workers_in_parallel(workers_to_stop)
+
+        self.transcode.cancel(inactive_ids)
+        self.postprocess.cancel(inactive_ids)
+        self._purge_tasks(inactive_ids)
+        logging.info(f"{self.log_prefix}{len(inactive_ids)} inactive tasks deleted.")
+
+        if inactive_ids or workers_to_stop:
+            self.save_tasks_to_file() # Single save for the whole batch
+
+        self.check_and_start_tasks() # May free up slots if active tasks were stopped
+
+    def _schedule_deferred_purge(self, task_id):
+        # Active tasks deleted together usually exit within a short time of each other;
+        # collect them so the views, queue and history file are updated once.
+        self._pending_purge_ids.add(task_id)
+        if len(self._pending_purge_ids) == 1:
+            QTimer.singleShot(0, self._flush_deferred_purge)
+
+    def _flush_deferred_purge(self):
+        task_ids = [tid for tid in self._pending_purge_ids if tid in self.tasks]
+        self._pending_purge_ids.clear()
+        if not task_ids: return
+        self._purge_tasks(task_ids)
+        logging.info(f"{self.log_prefix}{len(task_ids)} stopped tasks (marked for deletion) removed.")
+        self.save_tasks_to_file()
+
+    def _purge_tasks(self, task_ids):
+        """Removes tasks from internal state without touching workers."""
+        if not task_ids: return
+        ids_to_purge = set(task_ids)
+        purged_urls = []
+        partial_destinations = [] # 未完成的下载留下的 .part 等文件
+        for task_id in ids_to_purge:
+            task_data = self.tasks.pop(task_id, None)
+            self.task_states.discard(task_id)
+            if task_data and task_data.get("url"): purged_urls.append(task_data["url"])
+            if task_data and task_data.get("partials"): partial_destinations.extend(task_data["partials"].get("files", {}))
+            url_key = canonical_url(task_data.get("url") or "") if task_data else None
+            if url_key and self.url_index.get(url_key) == task_id:
+                del self.url_index[url_key]
+
+        # Drop queue entries in one rebuild instead of list.remove() per task
+        if self.task_queue:
+            self.task_queue = [tid for tid in self.task_queue if tid not in ids_to_purge]
+
+        self._schedule_state_counts_emit()
+        self.tasks_removed.emit(list(ids_to_purge))
+        # 删除输出文件不占用主线程
+        threading.Thread(target=self._remove_task_files, args=(list(ids_to_purge), purged_urls, partial_destinations),
+                         name="RemoveTaskOutputs", daemon=True).start()
+
+    def _remove_task_files(self, task_ids, urls, partial_destinations=()):
+        remove_task_outputs(self.output_log_dir, task_ids)
+        remove_info_jsons(self.info_json_dir, urls)
+        remove_partials(partial_destinations)
+
+    # --- 队列与调度 ---
+    def enqueue_task(self, task_id, save=True, front=False):
+        """
+        Moves a task to QUEUED. Returns True if it was enqueued; batch callers pass save=False and save once.
+        front=True puts it at the head of the queue (tasks interrupted by the scheduler).
+        """
+        task_data = self.tasks.get(task_id)
+        if not task_data:
+            logging.warning(f"{self.log_prefix}enqueue_task: Task {task_id} not found.")
+            return False
+        if task_data.get("_marked_for_deletion_while_active"):
+            logging.info(f"{self.log_prefix}Task {task_id} marked for deletion, not enqueued.")
+            return False
+        if self._suspended.get(task_id) is not None:
+            return self._resume_suspended_task(task_id) # 挂起的进程直接继续，不经过队列
+        if self.task_states.state_of(task_id) in (STATE_QUEUED, STATE_RUNNING) or \
+           (task_data.get("worker") and task_data.get("worker").isRunning()):
+            logging.debug(f"{self.log_prefix}Task {task_id} already running or in queue.")
+            return False
+
+        params_are_valid = False
+        current_task_params = task_data.get("params")
+        if isinstance(current_task_params, dict) and current_task_params:
+            if current_task_params.get("output_dir") and os.path.isdir(current_task_params.get("output_dir","")):
+                params_are_valid = True
+            else:
+                logging.warning(f"{self.log_prefix}Task {task_id} existing output_dir '{current_task_params.get('output_dir')}' is invalid or missing.")
+
+        if not params_are_valid:
+            logging.info(f"{self.log_prefix}Task {task_id} missing valid params or output_dir, using current default settings.")
+            current_default_params = self._default_params()
+            if current_default_params is None: # e.g., UI output_dir was invalid
+                task_data["status"] = "错误(参数)"; self._set_task_state(task_id, STATE_FAILED)
+                self.task_updated.emit(task_id)
+                if save: self.save_tasks_to_file()
+                return False
+            task_data["params"] = current_default_params
+            logging.debug(f"{self.log_prefix}Task {task_id} assigned current default parameters: {task_data['params']}")
+        else:
+            # Params were considered valid (e.g., had output_dir),
+            # but might be old and missing newer format selection parameters.
+            # Use the current default format settings if keys are missing.
+            if any(key not in task_data["params"] for key in ("video_format", "selected_quality_preset", "audio_quality")):
+                fallback_params = self._default_params()
+                if fallback_params is None: # Should not happen if output_dir was valid before
+                     logging.error(f"{self.log_prefix}Critical error getting default params during enqueue for task {task_id}. Using hardcoded defaults for missing keys.")
+                     fallback_params = {}
+                _ensure_param_defaults(task_data["params"], fallback_params)
+
+            logging.debug(f"{self.log_prefix}Task {task_id} using its pre-existing params, ensured new keys: {task_data['params']}")
+
+        task_data["status"] = "排队中"
+        # 状态索引保证同一任务不会重复入队，无需线性扫描 task_queue
+        self._set_task_state(task_id, STATE_QUEUED)
+        if front:
+            self.task_queue.insert(0, task_id)
+        else:
+            self.task_queue.append(task_id)
+
+        self.task_updated.emit(task_id)
+        logging.info(f"{self.log_prefix}Task {task_id} ('{task_data.get('title', 'N/A')}') enqueued. Queue length: {len(self.task_queue)}")
+        if save: self.save_tasks_to_file() # Save state after enqueuing
+        return True
+
+    def start_all_tasks(self):
+        logging.info(f"{self.log_prefix}start_all_tasks called.")
+        queued_count = 0
+        # Only visit tasks that are waiting, paused, or failed
+        for task_id in self.task_states.ids(*STARTABLE_STATES):
+            task_data = self.tasks.get(task_id)
+            if not task_data or task_data.get("_marked_for_deletion_while_active"): continue
+            # Ensure it's not already running (worker check is implicit in enqueue_task)
+            if not (task_data.get("worker") and task_data.get("worker").isRunning()):
+                if self.enqueue_task(task_id, save=False):
+                    queued_count +=1
+        if queued_count > 0:
+            logging.info(f"{self.log_prefix}{queued_count} tasks enqueued by start_all.")
+            self.save_tasks_to_file() # One save for the whole batch
+        else: logging.info(f"{self.log_prefix}No new tasks to start via start_all.")
+        self.check_and_start_tasks() # Trigger processing the queue
+        return queued_count
+
+    def check_and_start_tasks(self):
+        # Stale entries (deleted, paused or already started tasks) are skipped when popped below,
+        # so the queue no longer needs a full pruning pass on every timer tick.
+        deferred_ids = [] # start_filters 暂不允许启动的任务，保持原顺序放回队列
+        while self.active_workers < self.effective_max_concurrent() and self.task_queue \
+                and len(deferred_ids) < MAX_DEFERRED_SCAN:
+            task_id_to_start = self.task_queue.pop(0) # Get from front of queue
+            task_data = self.tasks.get(task_id_to_start)
+
+            if not task_data: # Deleted while queued
+                logging.debug(f"{self.log_prefix}Task {task_id_to_start} vanished before start attempt."); continue
+            if task_data.get("_marked_for_deletion_while_active"):
+                logging.info(f"{self.log_prefix}Task {task_id_to_start} is marked for deletion, not starting."); continue
+
+            # Only tasks still in the QUEUED state are started (paused/removed entries are stale)
+            task_state = self.task_states.state_of(task_id_to_start)
+            if task_state != STATE_QUEUED or (task_data.get("worker") and task_data.get("worker").isRunning()):
+                logging.debug(f"{self.log_prefix}Task {task_id_to_start} state '{task_state}', skipping start from queue.")
+                continue
+            if not all(start_filter(task_id_to_start, task_data) for start_filter in self.start_filters):
+                deferred_ids.append(task_id_to_start)
+                continue
+
+            # Final check on params before starting worker
+            task_params = task_data.get("params", {})
+            if not isinstance(task_params, dict) or not task_params.get("output_dir") or \
+               not os.path.isdir(task_params.get("output_dir")):
+                logging.error(f"{self.log_prefix}Task {task_id_to_start} ('{task_data.get('title')}') has invalid params/output_dir at start, cannot start. Params: {task_params}")
+                task_data["status"] = "错误(参数/路径)"; self._set_task_state(task_id_to_start, STATE_FAILED)
+                self.on_task_error_custom(task_id_to_start, "启动前检查：无效下载参数或保存路径。") # Use custom error handler
+                continue
+
+            self.start_task_thread(task_id_to_start)
+        if deferred_ids:
+            self.task_queue[:0] = deferred_ids
+
+    def start_task_thread(self, task_id):
+        task_data = self.tasks.get(task_id)
+
+        # Critical check, should always have params by now due to enqueue_task logic
+        if not task_data or not isinstance(task_data.get("params"), dict):
+            logging.error(f"{self.log_prefix}CRITICAL: start_task_thread called for task {task_id} with missing/invalid params.")
+            if task_data: # If task_data exists but params are bad
+                task_data["status"] = "错误(内部)"; self._set_task_state(task_id, STATE_FAILED); self.task_updated.emit(task_id); self.save_tasks_to_file()
+            return
+
+        if task_data.get("_marked_for_deletion_while_active"): # Double check
+            logging.info(f"{self.log_prefix}Task {task_id} marked for deletion, cancelling start_task_thread."); return
+
+        self.active_workers += 1
+        task_data["status"] = "启动中"
+        self._set_task_state(task_id, STATE_RUNNING)
+        self.task_updated.emit(task_id)
+        if self._start_from_file_index(task_id):
+            return
+
+        params_for_worker = task_data["params"] # Already ensured to be a dict
+        limit_rate = params_for_worker.get("limit_rate") if self.limit_rate_override is None else self.limit_rate_override
+        conv_mode, conv_fmt = params_for_worker.get("conv_mode"), params_for_worker.get("conv_fmt")
+        video_format = params_for_worker.get("video_format")
+        outputs = parse_output_specs(conv_mode, conv_fmt)
+        task_data.pop("_local_transcode", None)
+        if outputs and self.transcode.ffmpeg_path():
+            # yt-dlp 只下载一次源文件，转码 (多个输出时并行) 在 on_task_finished_custom 之后由转码阶段完成
+            task_data["_local_transcode"] = True
+            if all(mode == CONV_MODE_AUDIO for mode, _, _ in outputs) and not (video_format or "").strip():
+                video_format = "bestaudio/best" # 与 yt-dlp -x 的默认格式相同
+            conv_mode = '无转换'
+        elif len(outputs) > 1 or (outputs and outputs[0][2]):
+            # 没有 ffmpeg 时 yt-dlp 只能转换为一种格式
+            logging.warning(f"{self.log_prefix}Task {task_id}: ffmpeg not found, converting to '{outputs[0][1]}' only.")
+            conv_mode, conv_fmt = outputs[0][0], outputs[0][1]
+        output_dir = params_for_worker.get("output_dir")
+        resume = self._verified_partials(task_id)
+        if resume is None:
+            task_data["partials"] = {"output_dir": output_dir, "video_format": video_format, "files": {}}
+        elif (resume["output_dir"], resume["video_format"]) != (output_dir, video_format):
+            # 参数在中断后被修改: 仍按原来的目录和格式继续，否则已下载的部分会被丢弃
+            logging.info(f"{self.log_prefix}Task {task_id}: continuing partial download in '{resume['output_dir']}' "
+                         f"(format '{resume['video_format'] or ''}') instead of the current settings.")
+            output_dir, video_format = resume["output_dir"], resume["video_format"]
+        output_log = self._output_logs[task_id] = TaskOutputLog(task_id, self.output_log_dir)
+        worker = DownloadTaskWorker(
+            task_id,
+            task_data["url"],
+            task_data["title"],
+            output_dir=output_dir, # Known to be valid dir
+            cookies_browser=params_for_worker.get("cookies_browser"),
+            cookies_file_path=params_for_worker.get("cookies_file_path"),
+            conv_mode=conv_mode,
+            conv_fmt=conv_fmt,
+            limit_rate=limit_rate,
+            post_script=params_for_worker.get("post_script"),
+            extra_args=params_for_worker.get("extra_args"), # For download
+            video_format=video_format, # Actual -f format
+            audio_quality=params_for_worker.get("audio_quality"), # For -x
+            output_log=output_log,
+            info_json_path=info_json_path(self.info_json_dir, task_data["url"])
+        )
+        task_data["worker"] = worker
+        # 运行期间从内存读取输出；线程结束 (输出已写入压缩文件) 后改为从文件读取
+        worker.finished.connect(functools.partial(self._release_output_log, task_id, output_log))
+
+        worker.progress_signal.connect(self.on_task_progress)
+        worker.status_signal.connect(self.on_task_status)
+        worker.speed_signal.connect(self.on_task_speed)
+        worker.finished_signal.connect(self.on_task_finished_custom) # Renamed for clarity
+        worker.error_signal.connect(self.on_task_error_custom)     # Renamed for clarity
+        worker.timing_signal.connect(self.task_timing)
+        worker.phase_signal.connect(self.task_phase)
+        worker.destination_signal.connect(self.on_task_destination)
+
+        logging.info(f"{self.log_prefix}Starting task {task_id} ('{task_data.get('title', 'N/A')}'). Active workers: {self.active_workers}.")
+        logging.debug(f"{self.log_prefix}Task {task_id} params: {params_for_worker}")
+        worker.start()
+
+    # --- 已完成文件索引 (file_index.py) ---
+    def _start_from_file_index(self, task_id):
+        """Starts a DedupeLinkWorker instead of a download if the index has this video in this format. Returns True if started."""
+        task_data = self.tasks[task_id]
+        if self.file_index is None or task_data.pop("_skip_file_index", False) or task_data.get("partials", {}).get("files"):
+            return False
+        params = task_data["params"]
+        keys = video_keys(task_data["url"], info_json_path(self.info_json_dir, task_data["url"]))
+        existing = self.file_index.lookup(keys, format_key_for(params))
+        if not existing:
+            return False
+        target = os.path.join(params["output_dir"], os.path.basename(existing))
+        logging.info(f"{self.log_prefix}Task {task_id}: already downloaded as {existing}, reusing it for {target}.")
+        task_data["status"] = f"使用已有文件: {os.path.basename(existing)}"
+        task_data["reused_from"] = existing
+        worker = task_data["worker"] = DedupeLinkWorker(task_id, existing, target)
+        worker.finished_signal.connect(self.on_task_finished_custom)
+        self.task_updated.emit(task_id)
+        worker.start()
+        return True
+
+    def _index_completed_file(self, task_id):
+        """Records a completed single-file task in the file index (hashing runs in a background thread with --dedupe-hash)."""
+        task_data = self.tasks.get(task_id)
+        keys = task_data.pop("video_keys", None) if task_data else None
+        if self.file_index is None or not keys: return
+        filepath = task_data.get("filepath")
+        if not filepath or not os.path.isfile(filepath) or len(task_data.get("output_files") or []) > 1:
+            return # 多个输出格式的任务不能用一个文件代替
+        try:
+            self.file_index.add(keys, format_key_for(task_data["params"]), filepath)
+        except (OSError, sqlite3.Error) as e:
+            logging.warning(f"{self.log_prefix}Could not add {filepath} to the file index: {e}")
+            return
+        if self.file_index.hash_files:
+            threading.Thread(target=self.file_index.hash_and_link, args=(filepath,), name="HashCompletedFile", daemon=True).start()
+
+    # --- 未完成的下载文件 (partials.py) ---
+    def on_task_destination(self, task_id, destination):
+        task_data = self.tasks.get(task_id)
+        if not task_data or "partials" not in task_data: return
+        task_data["partials"]["files"].setdefault(destination, {"bytes": 0, "head": "", "head_len": 0})
+        self.request_save() # 异常退出时也知道 .part 文件在哪里
+
+    def _snapshot_partials(self, task_id):
+        """Records the current offset and fingerprint of each partial file of a stopped or failed download."""
+        partials = self.tasks.get(task_id, {}).get("partials")
+        if not partials: return
+        for destination in partials["files"]:
+            partials["files"][destination] = snapshot_partial(destination)
+
+    def _verified_partials(self, task_id):
+        """
+        The task's partials record if any of its partial files can be continued, else None. Files that
+        fail the integrity check are deleted so yt-dlp downloads them again from the start.
+        """
+        task_data = self.tasks[task_id]
+        partials = task_data.get("partials")
+        if not partials or not partials.get("files"): return None
+        valid, discarded = {}, []
+        for destination, record in partials["files"].items():
+            if os.path.exists(destination):
+                valid[destination] = record # 这个格式已下载完 (.part 已改名)，yt-dlp 会直接使用
+            elif verify_partial(destination, record):
+                valid[destination] = record
+            elif partial_files(destination):
+                discarded.append(destination)
+            # 既没有 .part 也没有完成的文件: 还没开始下载，没有需要删除的内容
+        if discarded:
+            logging.warning(f"{self.log_prefix}Task {task_id}: discarding partial files that no longer match: {discarded}")
+            remove_partials(discarded) # 必须在 yt-dlp 启动前删除，否则会接在不一致的数据后面
+        partials["files"] = valid
+        return partials if valid else None
+
+    def _release_output_log(self, task_id, output_log):
+        if self._output_logs.get(task_id) is output_log:
+            del self._output_logs[task_id]
+
+    def task_output(self, task_id, max_lines=DEFAULT_OUTPUT_MAX_LINES):
+        """Recent yt-dlp output lines of a task: live buffer while it runs, else its compressed log file."""
+        output_log = self._output_logs.get(task_id)
+        if output_log is not None:
+            return output_log.lines(max_lines)
+        return read_task_output(self.output_log_dir, task_id, max_lines)
+
+    # --- 转码阶段 ---
+    def _plan_transcode(self, task_id, source):
+        """
+        Records the conversion jobs for a downloaded source (one per output format) in the task.
+        Returns False if nothing needs converting (the source already is the only output).
+        """
+        task_data = self.tasks[task_id]
+        params = task_data["params"]
+        jobs, output_files = [], []
+        for conv_mode, conv_fmt, max_height in parse_output_specs(params.get("conv_mode"), params.get("conv_fmt")):
+            output_path = transcode_output_path(source, conv_mode, conv_fmt, max_height)
+            if output_path is None:
+                output_files.append(source) # 源文件本身就是这个输出
+            elif output_path not in output_files:
+                output_files.append(output_path)
+                jobs.append([output_path, conv_mode, conv_fmt, max_height])
+        if not jobs:
+            return False
+        task_data.update({"transcode_source": source, "transcode_jobs": jobs, "transcode_done": [],
+                          "transcode_failures": [], "output_files": output_files})
+        return True
+
+    def _keep_transcode_source(self, task_data):
+        params = task_data["params"]
+        extra_args = params.get("extra_args", "").split()
+        return (bool(params.get("keep_source")) or "-k" in extra_args or "--keep-video" in extra_args
+                or task_data.get("transcode_source") in task_data.get("output_files", []))
+
+    def _submit_transcode(self, task_id):
+        task_data = self.tasks[task_id]
+        params, source = task_data.get("params", {}), task_data.get("transcode_source")
+        if source and "transcode_jobs" not in task_data: # 旧版本保存的单一转换
+            self._plan_transcode(task_id, source)
+        if not source or not os.path.exists(source) or not self.transcode.ffmpeg_path():
+            for key in ("transcode_source", "transcode_jobs", "transcode_done", "transcode_failures"):
+                task_data.pop(key, None)
+            task_data["status"] = "失败 (转码源文件丢失)" if self.transcode.ffmpeg_path() else "失败 (未找到 ffmpeg)"
+            self._set_task_state(task_id, STATE_FAILED)
+            self.task_updated.emit(task_id)
+            return
+        done = set(task_data["transcode_done"])
+        pending = [job for job in task_data["transcode_jobs"] if job[0] not in done]
+        if not pending: # 上次退出时所有输出已完成
+            self._finish_transcode(task_id)
+            return
+        for output_path, conv_mode, conv_fmt, max_height in pending:
+            # 每个作业一份输出记录 (各自在作业结束时写入任务的输出文件)，界面显示最后提交的一份
+            output_log = self._output_logs[task_id] = TaskOutputLog(task_id, self.output_log_dir)
+            self.transcode.submit(task_id, source, output_path, conv_mode, conv_fmt,
+                                  params.get("audio_quality", ""), max_height, output_log)
+
+    def _on_transcode_started(self, task_id, output_path):
+        task_data = self.tasks.get(task_id)
+        if not task_data: return
+        total = len(task_data.get("transcode_jobs", []))
+        progress = f" ({len(task_data.get('transcode_done', [])) + 1}/{total})" if total > 1 else ""
+        task_data["status"] = f"转码{progress}: {os.path.basename(output_path)}"
+        self.task_updated.emit(task_id)
+
+    def _on_transcode_finished(self, task_id, output_path, ok, message):
+        task_data = self.tasks.get(task_id)
+        if not task_data or self.task_states.state_of(task_id) != STATE_POSTPROCESSING: return # 已删除
+        if ok:
+            task_data["transcode_done"].append(output_path)
+            logging.info(f"{self.log_prefix}Task {task_id} transcoded to {output_path} ({message})")
+        else:
+            task_data["transcode_failures"].append(f"{os.path.basename(output_path)}: {message}")
+        finished = len(task_data["transcode_done"]) + len(task_data["transcode_failures"])
+        if finished < len(task_data["transcode_jobs"]):
+            task_data["status"] = f"转码 ({finished}/{len(task_data['transcode_jobs'])})"
+            self.task_updated.emit(task_id)
+            self.request_save()
+            return
+        self._output_logs.pop(task_id, None)
+        self._finish_transcode(task_id)
+
+    def _finish_transcode(self, task_id):
+        """All conversion jobs of the task have ended: fail it, or remove the source and continue to post-processing."""
+        task_data = self.tasks[task_id]
+        source = task_data.get("transcode_source")
+        failures = task_data.get("transcode_failures", [])
+        keep_source = self._keep_transcode_source(task_data)
+        for key in ("transcode_source", "transcode_jobs", "transcode_done", "transcode_failures"):
+            task_data.pop(key, None)
+        if failures:
+            # 保留源文件: 重试时 yt-dlp 发现文件已存在，不会重新下载
+            more = f" 等 {len(failures)} 个" if len(failures) > 1 else ""
+            task_data.update({"status": f"失败 ({failures[0]}{more})", "filepath": source or ""})
+            self._set_task_state(task_id, STATE_FAILED)
+            self.task_error.emit(task_id, "; ".join(failures))
+            self.task_updated.emit(task_id)
+            self.request_save()
+            return
+        if source and not keep_source:
+            try: os.remove(source) # 与 yt-dlp 相同: 转换后删除原文件，除非指定了保留
+            except OSError as e: logging.warning(f"{self.log_prefix}Could not remove transcode source {source}: {e}")
+        output_files = task_data.get("output_files") or [source]
+        task_data["filepath"] = output_files[0] # 第一个输出格式作为任务的文件 (后处理脚本处理它)
+        post_script = task_data["params"].get("post_script")
+        if post_script and os.path.isfile(post_script):
+            task_data["status"] = "等待后处理"
+            self._submit_postprocess(task_id)
+        else:
+            task_data["status"] = "完成" if len(output_files) == 1 else f"完成 ({len(output_files)} 个文件)"
+            self._set_task_state(task_id, STATE_DONE)
+            self._index_completed_file(task_id)
+        self.task_updated.emit(task_id)
+        self.request_save()
+
+    # --- 后处理阶段 ---
+    def _submit_postprocess(self, task_id):
+        task_data = self.tasks[task_id]
+        filepath, post_script = task_data.get("filepath"), task_data.get("params", {}).get("post_script")
+        if not filepath or not os.path.exists(filepath) or not post_script or not os.path.isfile(post_script):
+            task_data["status"] = "完成 (未运行后处理)"
+            self._set_task_state(task_id, STATE_DONE)
+            self.task_updated.emit(task_id)
+            return
+        output_log = self._output_logs[task_id] = TaskOutputLog(task_id, self.output_log_dir)
+        task_metadata = {"task_id": task_id, "url": task_data.get("url", ""), "title": task_data.get("title", ""),
+                         "filepath": os.path.abspath(filepath), "params": dict(task_data.get("params", {}))}
+        self.postprocess.submit(task_id, filepath, post_script, output_log, task_metadata)
+
+    def _on_postprocess_started(self, task_id):
+        task_data = self.tasks.get(task_id)
+        if not task_data: return
+        task_data["status"] = f"后处理: {os.path.basename(task_data['params'].get('post_script', ''))}"
+        self.task_updated.emit(task_id)
+
+    def _on_postprocess_finished(self, task_id, ok, message):
+        output_log = self._output_logs.get(task_id)
+        if output_log is not None:
+            self._release_output_log(task_id, output_log)
+        task_data = self.tasks.get(task_id)
+        if not task_data or self.task_states.state_of(task_id) != STATE_POSTPROCESSING: return # 已删除
+        # 下载本身已成功: 后处理失败也算完成，只在状态中说明
+        task_data["status"] = "完成" if ok else f"完成 ({message})"
+        self._set_task_state(task_id, STATE_DONE)
+        self._index_completed_file(task_id)
+        self.task_updated.emit(task_id)
+        self.request_save()
+
+    # --- 下载线程信号处理 ---
+    def on_task_finished_custom(self, task_id, result_or_filepath):
+        logging.debug(f"{self.log_prefix}on_task_finished for task {task_id}, result: {result_or_filepath}")
+        task_data = self.tasks.get(task_id)
+        if not task_data: logging.warning(f"{self.log_prefix}Task {task_id} finished but not found in self.tasks."); return
+
+        worker_that_finished = task_data.pop("worker", None) # Remove worker reference
+        local_transcode = task_data.pop("_local_transcode", False)
+        was_suspended = task_id in self._suspended # 挂起时已释放并发名额
+        self._suspended.pop(task_id, None)
+        if worker_that_finished and not was_suspended: # Only decrement if a worker was actually associated
+            self.active_workers = max(0, self.active_workers - 1) # Decrement active workers
+
+        logging.info(f"{self.log_prefix}Task {task_id} ('{task_data.get('title', 'N/A')}') ended. Result: {result_or_filepath}. Active workers: {self.active_workers}")
+        if result_or_filepath in ("暂停", "失败"):
+            self._snapshot_partials(task_id)
+
+        requeue = task_data.pop("_requeue_after_stop", False)
+        fail_message = task_data.pop("_fail_after_stop", None)
+        if result_or_filepath == DEDUPE_FALLBACK:
+            task_data.pop("reused_from", None)
+            if task_data.get("_marked_for_deletion_while_active"):
+                result_or_filepath = "暂停"
+            else: # 已有文件不可用: 立即正常下载
+                task_data["_skip_file_index"] = requeue = True
+                result_or_filepath = "暂停"
+        if result_or_filepath == "暂停" and requeue and not task_data.get("_marked_for_deletion_while_active"):
+            # 由时段切换或停滞检测停止: 放回队列最前面，之后从 .part 文件继续下载
+            self._set_task_state(task_id, STATE_PAUSED)
+            self.enqueue_task(task_id, front=True)
+            self.check_and_start_tasks()
+            return
+        if result_or_filepath == "暂停" and fail_message:
+            result_or_filepath = "失败" # 停滞重试次数用完
+            task_data.pop("stall_retries", None) # 手动重试时重新计数
+        if result_or_filepath == "失败":
+            if not task_data.get("retry_at"): task_data["status"] = "失败" # 已安排自动重试时保留 "等待重试" 状态
+            new_state = STATE_FAILED
+        elif result_or_filepath == "暂停": task_data["status"] = "暂停"; new_state = STATE_PAUSED # Worker was stopped
+        elif result_or_filepath == "完成但路径未知": task_data.update({"status":"完成但路径未知", "filepath":""}); new_state = STATE_DONE
+        elif result_or_filepath == "完成但找不到文件": task_data.update({"status":"失败(文件丢失)", "filepath":""}); new_state = STATE_FAILED # Treat as failure
+        elif result_or_filepath == "完成但路径捕获失败": task_data.update({"status":"完成但路径捕获失败", "filepath":""}); new_state = STATE_DONE
+        else: # Assumed to be a valid filepath
+            task_data.update({"status":"完成", "filepath":result_or_filepath, "progress":"100%", "speed":""}); new_state = STATE_DONE
+            task_data.pop("stall_retries", None)
+            if self.file_index is not None: # 视频信息在下面删除，先记下索引用的键
+                task_data["video_keys"] = video_keys(task_data["url"], info_json_path(self.info_json_dir, task_data["url"]))
+            post_script = task_data["params"].get("post_script")
+            if task_data.get("_marked_for_deletion_while_active"):
+                pass
+            elif local_transcode and self._plan_transcode(task_id, result_or_filepath):
+                task_data["status"] = "等待转码"; new_state = STATE_POSTPROCESSING
+            elif post_script and os.path.isfile(post_script):
+                task_data["status"] = "等待后处理"; new_state = STATE_POSTPROCESSING
+        self._set_task_state(task_id, new_state)
+        if fail_message and new_state == STATE_FAILED:
+            self.task_error.emit(task_id, fail_message)
+        if new_state == STATE_DONE:
+            self._index_completed_file(task_id)
+        if new_state in (STATE_DONE, STATE_POSTPROCESSING): # 下载完成后不再需要保存的视频信息和未完成文件的记录
+            remove_info_jsons(self.info_json_dir, [task_data["url"]])
+            task_data.pop("partials", None)
+        if new_state == STATE_POSTPROCESSING:
+            if task_data.get("transcode_source"):
+                self._submit_transcode(task_id)
+            else:
+                self._submit_postprocess(task_id)
+
+        # Handle deletion if marked during active state
+        if task_data.get("_marked_for_deletion_while_active"):
+            # Removal (and the save) is batched with other tasks deleted in the same pass
+            logging.info(f"{self.log_prefix}Task {task_id} (marked for deletion) finished/paused, scheduling final removal.")
+            self._schedule_deferred_purge(task_id)
+        else:
+            self.task_updated.emit(task_id) # Update views for normally finished/paused task
+            self.save_tasks_to_file() # Save changes
+
+        self.check_and_start_tasks() # Check if new tasks can be started
+
+    def on_task_error_custom(self, task_id, error_msg):
+        logging.debug(f"{self.log_prefix}on_task_error for task {task_id}, error: {error_msg}")
+        task_data = self.tasks.get(task_id)
+        if not task_data: logging.warning(f"{self.log_prefix}Task {task_id} errored but not found in self.tasks."); return
+
+        worker_that_errored = task_data.pop("worker", None) # Remove worker reference
+        task_data.pop("_requeue_after_stop", None)
+        task_data.pop("_fail_after_stop", None)
+        was_suspended = task_id in self._suspended
+        self._suspended.pop(task_id, None)
+        if worker_that_errored and not was_suspended:
+            self.active_workers = max(0, self.active_workers - 1)
+
+        logging.error(f"{self.log_prefix}Error - Task {task_id} ('{task_data.get('title', 'N/A')}'): {error_msg}. Active workers: {self.active_workers}")
+        if worker_that_errored:
+            self._snapshot_partials(task_id)
+        task_data["status"] = "错误"; self._set_task_state(task_id, STATE_FAILED)
+        self.task_error.emit(task_id, error_msg)
+
+        # Handle deletion if marked during active state
+        if task_data.get("_marked_for_deletion_while_active"):
+            logging.info(f"{self.log_prefix}Task {task_id} (marked for deletion) errored, scheduling final removal.")
+            self._schedule_deferred_purge(task_id)
+        else:
+            self.task_updated.emit(task_id)
+            self.save_tasks_to_file()
+
+        self.check_and_start_tasks()
+
+    def on_task_status(self, task_id, status_text):
+        task_data = self.tasks.get(task_id)
+        if not task_data or task_data.get("_marked_for_deletion_while_active"): return # Ignore updates if marked for deletion
+
+        old_status = task_data.get("status", "")
+        # Define statuses that are considered final or stable (should not be easily overwritten by transient messages)
+        final_or_stable_statuses = [
+            "完成", "失败", "错误", "暂停", "已暂停(中断)",
+            "完成但路径未知", "完成但找不到文件", "完成但路径捕获失败"
+        ] + [s for s in [old_status] if "错误(" in s] # Include specific error messages
+
+        # Define prefixes of important status messages that *can* overwrite a stable status (e.g., post-processing)
+        important_status_prefixes = [
+            "后处理", "完成:", # yt-dlp sometimes emits "完成: <filename>"
+            "yt-dlp code:", "yt-dlp 进程以错误码", "ERROR:", # Critical errors from yt-dlp
+            "Destination:", "Merging formats into", "Extracting audio to", "Recoding to" # Path related messages
+        ]
+
+        can_overwrite_current_status = True
+        if old_status in final_or_stable_statuses:
+            # Only overwrite stable status if the new message is an important update
+            can_overwrite_current_status = any(status_text.startswith(prefix) for prefix in important_status_prefixes)
+
+        status_actually_changed_in_logic = False
+        if can_overwrite_current_status:
+            if task_data["status"] != status_text: # Avoid redundant updates
+                logging.debug(f"{self.log_prefix}Task {task_id} status from '{task_data['status']}' to: '{status_text}'")
+                task_data["status"] = status_text
+                status_actually_changed_in_logic = True
+        elif task_data["status"] != status_text: # Log if we decided not to update a stable status
+             logging.debug(f"{self.log_prefix}Task {task_id}: Did not update stable status '{task_data['status']}' to '{status_text}'")
+
+        self.task_updated.emit(task_id) # Always refresh views, even if not saved to task_data["status"]
+
+        # Save to file only if a logically significant status changed to a final one
+        if status_actually_changed_in_logic and task_data["status"] in final_or_stable_statuses:
+            self.save_tasks_to_file()
+
+    def on_task_progress(self, task_id, progress_text):
+        task_data = self.tasks.get(task_id)
+        if not task_data or task_data.get("_marked_for_deletion_while_active"): return
+
+        # Clean up progress text from yt-dlp's [download] prefix if present
+        new_progress = progress_text.replace("[download]", "").strip()
+        if task_data.get("progress") != new_progress: # Avoid redundant view updates
+            task_data["progress"] = new_progress
+            self.task_updated.emit(task_id)
+
+    def on_task_speed(self, task_id, speed_text):
+        task_data = self.tasks.get(task_id)
+        if not task_data or task_data.get("_marked_for_deletion_while_active"): return
+
+        if task_data.get("speed") != speed_text: # Avoid redundant view updates
+            task_data["speed"] = speed_text
+            self.task_updated.emit(task_id)
+
+    # --- 暂停/继续/重试 ---
+    def pause_all_active_tasks(self, clear_queue=True, suspend=None):
+        """suspend: None follows suspend_timeout_seconds; False always stops the processes (shutdown)."""
+        logging.info(f"{self.log_prefix}pause_all_active_tasks called. Clear queue: {clear_queue}")
+        active_tasks_signaled_to_stop = 0
+        workers_to_stop = []
+        # Only running tasks can have an active worker; ids() returns a snapshot
+        for task_id_iter in self.task_states.ids(STATE_RUNNING):
+            task_data = self.tasks.get(task_id_iter)
+            if not task_data or task_data.get("_marked_for_deletion_while_active"): continue
+
+            worker = task_data.get("worker")
+            task_data.pop("_requeue_after_stop", None) # 用户暂停优先于时段切换/停滞检测的重新排队
+            task_data.pop("_fail_after_stop", None)
+            if worker and worker.isRunning():
+                logging.debug(f"{self.log_prefix}Pausing worker for task {task_id_iter}")
+                if not self._pause_worker(task_id_iter, worker, suspend): # Suspend, or signal worker to stop
+                    workers_to_stop.append(worker)
+                active_tasks_signaled_to_stop += 1
+                # Worker's finished_signal (with "暂停" status) will handle view update and saving
+        stop_workers_in_parallel(workers_to_stop)
+
+        if active_tasks_signaled_to_stop > 0:
+            logging.info(f"{self.log_prefix}{active_tasks_signaled_to_stop} active tasks signaled to stop.")
+        else:
+            logging.info(f"{self.log_prefix}No active tasks were running to pause.")
+
+        if clear_queue:
+            logging.info(f"{self.log_prefix}Clearing download queue...")
+            tasks_updated_from_queue = 0
+            for task_id_in_queue in self.task_states.ids(STATE_QUEUED):
+                task_data = self.tasks.get(task_id_in_queue)
+                if task_data:
+                    if task_data.get("_marked_for_deletion_while_active"): continue
+
+                    if task_data.get("status") == "排队中": # Only update status if it was "排队中"
+                        task_data["status"] = "等待" # Or "已暂停(队列)" for clarity
+                    self._set_task_state(task_id_in_queue, STATE_PAUSED) # Mark as paused implicitly
+                    self.task_updated.emit(task_id_in_queue)
+                    tasks_updated_from_queue +=1
+
+            self.task_queue.clear() # Clear the original queue
+            if tasks_updated_from_queue > 0: # If any task states were changed
+                 self.save_tasks_to_file()
+            logging.info(f"{self.log_prefix}Download queue cleared. {tasks_updated_from_queue} tasks (if any) updated from queue.")
+
+    def _pause_worker(self, task_id, worker, suspend=None):
+        """Suspends a running task's process (suspend mode). Returns False if the worker has to be stopped instead."""
+        if suspend is None:
+            suspend = self.suspend_timeout_seconds > 0
+        if not (suspend and worker.suspend()):
+            return False
+        # 挂起的任务不占用并发名额，其他任务可以开始；继续时立即恢复，可能暂时超过并发数
+        self.active_workers = max(0, self.active_workers - 1)
+        self._suspended[task_id] = time.monotonic()
+        task_data = self.tasks[task_id]
+        task_data.update({"status": "已挂起", "speed": ""})
+        self._set_task_state(task_id, STATE_PAUSED)
+        self.task_updated.emit(task_id)
+        self.request_save()
+        if not self.suspend_timer.isActive():
+            self.suspend_timer.start()
+        QTimer.singleShot(0, self.check_and_start_tasks)
+        return True
+
+    def _resume_suspended_task(self, task_id):
+        """Continues a suspended process (SIGCONT). Falls back to the queue if the process is gone."""
+        self._suspended.pop(task_id, None)
+        task_data = self.tasks[task_id]
+        worker = task_data.get("worker")
+        if not (worker and worker.resume()):
+            return False # 进程已退出，其结束信号会把任务设为暂停/完成
+        self.active_workers += 1
+        task_data["status"] = "下载中..."
+        self._set_task_state(task_id, STATE_RUNNING)
+        self.task_updated.emit(task_id)
+        self.request_save()
+        logging.info(f"{self.log_prefix}Task {task_id} resumed from suspension. Active workers: {self.active_workers}.")
+        return True
+
+    def _expire_suspended_tasks(self, force=False):
+        """Stops processes suspended for longer than suspend_timeout_seconds (all of them if force)."""
+        now = time.monotonic()
+        expired_workers = []
+        for task_id, suspended_at in list(self._suspended.items()):
+            if suspended_at is None: continue
+            if force or now - suspended_at >= self.suspend_timeout_seconds:
+                worker = self.tasks.get(task_id, {}).get("worker")
+                if worker:
+                    self._suspended[task_id] = None # 结束信号到达时移除
+                    expired_workers.append(worker)
+                else:
+                    del self._suspended[task_id]
+                    self.task_updated.emit(task_id) # 不再挂起 (共享队列节点据此释放租约)
+        if expired_workers:
+            logging.info(f"{self.log_prefix}Stopping {len(expired_workers)} suspended tasks (idle too long or shutting down).")
+            stop_workers_in_parallel(expired_workers)
+        if not any(suspended_at is not None for suspended_at in self._suspended.values()):
+            self.suspend_timer.stop()
+
+    def requeue_running_tasks(self, task_ids):
+        """Stops the given running tasks and puts them back at the front of the queue once they have stopped."""
+        workers_to_stop = []
+        for task_id in task_ids:
+            task_data = self.tasks.get(task_id)
+            worker = task_data.get("worker") if task_data else None
+            if worker and worker.isRunning():
+                task_data["_requeue_after_stop"] = True
+                workers_to_stop.append(worker)
+        stop_workers_in_parallel(workers_to_stop)
+        return len(workers_to_stop)
+
+    def handle_stalled_task(self, task_id, reason, max_retries):
+        """
+        Stops a running download that stopped making progress and requeues it (yt-dlp resumes from the
+        .part file). After max_retries stalls without completing, the task fails instead.
+        """
+        task_data = self.tasks.get(task_id)
+        worker = task_data.get("worker") if task_data else None
+        if not worker or not worker.isRunning() or task_id in self._suspended or task_data.get("_marked_for_deletion_while_active"):
+            return False
+        retries = task_data.get("stall_retries", 0) + 1
+        task_data["stall_retries"] = retries
+        self.task_stalled.emit(task_id, reason)
+        if retries > max_retries:
+            logging.warning(f"{self.log_prefix}Task {task_id} stalled ({reason}) {retries} times, giving up.")
+            task_data["_fail_after_stop"] = f"下载停滞 ({reason})，已重试 {max_retries} 次"
+        else:
+            logging.warning(f"{self.log_prefix}Task {task_id} stalled ({reason}), restarting it (retry {retries}/{max_retries}).")
+            task_data["_requeue_after_stop"] = True
+        task_data["status"] = "下载停滞，重新开始" if retries <= max_retries else "下载停滞"
+        self.task_updated.emit(task_id)
+        stop_workers_in_parallel([worker])
+        return True
+
+    def pause_tasks(self, task_ids, suspend=None):
+        """Pauses the given running/queued tasks. Returns how many were paused or signaled to stop."""
+        paused_count = 0
+        queued_tasks_paused = False
+        workers_to_stop = []
+        for task_id in task_ids:
+            task_data = self.tasks.get(task_id)
+            if not task_data or task_data.get("_marked_for_deletion_while_active"): continue
+            worker = task_data.get("worker")
+            task_state = self.task_states.state_of(task_id)
+            task_data.pop("_requeue_after_stop", None)
+            task_data.pop("_fail_after_stop", None)
+            if worker and worker.isRunning() and task_state == STATE_RUNNING:
+                if not self._pause_worker(task_id, worker, suspend): # Worker's finished signal will update status to "暂停"
+                    workers_to_stop.append(worker)
+                paused_count += 1
+            elif suspend is False and self._suspended.get(task_id) is not None:
+                self._suspended[task_id] = None # 已挂起的任务也必须结束进程
+                workers_to_stop.append(worker)
+                paused_count += 1
+            elif task_state == STATE_QUEUED:
+                # The stale task_queue entry is skipped by check_and_start_tasks
+                task_data["status"] = "暂停"; self._set_task_state(task_id, STATE_PAUSED)
+                self.task_updated.emit(task_id)
+                paused_count += 1
+                queued_tasks_paused = True
+        stop_workers_in_parallel(workers_to_stop)
+        if queued_tasks_paused:
+            self.save_tasks_to_file()
+        logging.info(f"{self.log_prefix}{paused_count} tasks paused.")
+        return paused_count
+
+    def resume_tasks(self, task_ids):
+        """Re-enqueues the given paused/waiting/failed tasks. Returns how many were enqueued."""
+        resumed_count = 0
+        for task_id in task_ids:
+            task_data = self.tasks.get(task_id)
+            if task_data and not task_data.get("_marked_for_deletion_while_active"):
+                # Eligible for resume if paused, waiting, or failed (allows retrying failed tasks too)
+                if self.task_states.state_of(task_id) in STARTABLE_STATES:
+
+                    # Don't re-enqueue if already running (挂起的任务由 enqueue_task 直接继续)
+                    if task_id not in self._suspended and task_data.get("worker") and task_data.get("worker").isRunning():
+                        logging.debug(f"{self.log_prefix}Task {task_id} is already running, skipping resume.")
+                        continue
+
+                    if self.enqueue_task(task_id, save=False): # enqueue_task moves the task to QUEUED
+                        resumed_count += 1
+
+        if resumed_count > 0:
+            logging.info(f"{self.log_prefix}{resumed_count} tasks re-enqueued for resume/start.")
+            self.save_tasks_to_file()
+            self.check_and_start_tasks() # Trigger queue processing
+        else:
+            logging.info(f"{self.log_prefix}No selected tasks were eligible for resume/start.")
+        return resumed_count
+
+    def retry_task(self, task_id, automatic=False):
+        """
+        Re-enqueues a failed task. Returns None on success or a user-facing reason why it cannot be retried.
+        automatic: called by RetryScheduler; a manual retry resets the automatic retry count.
+        """
+        logging.info(f"{self.log_prefix}retry_task called for task {task_id}.")
+        task_data = self.tasks.get(task_id)
+        if not task_data: return f"任务 {task_id} 数据未找到。"
+        if task_data.get("_marked_for_deletion_while_active"):
+            return f"任务 {task_id} 已标记为删除，无法重试。"
+        if task_data.get("worker") and task_data.get("worker").isRunning():
+            return "任务正在运行，请先等待或暂停。"
+
+        task_data.pop("retry_at", None)
+        if not automatic:
+            task_data.pop("auto_retries", None)
+        # Reset relevant fields for retry
+        task_data.update({
+            "status": "等待", # Will be changed by enqueue_task
+            "progress": "",
+            "speed": ""
+            # Keep filepath and other params as they were
+        })
+        self._set_task_state(task_id, STATE_WAITING) # Will be set to QUEUED by enqueue_task
+
+        self.task_updated.emit(task_id) # Reflect reset state immediately
+        self.enqueue_task(task_id) # This will set status to "排队中" and add to queue
+        logging.info(f"{self.log_prefix}Task {task_id} ('{task_data.get('title')}') enqueued for retry.")
+        self.check_and_start_tasks()
+        return None
+
+    def toggle_pause_resume_task(self, task_id):
+        logging.debug(f"{self.log_prefix}toggle_pause_resume_task for {task_id}")
+        task_data = self.tasks.get(task_id)
+        if not task_data: return
+        if task_data.get("_marked_for_deletion_while_active"):
+            logging.info(f"{self.log_prefix}Task {task_id} is marked for deletion, cannot toggle state.")
+            return
+
+        worker = task_data.get("worker")
+        current_status = task_data.get("status", "")
+        task_state = self.task_states.state_of(task_id)
+
+        # If task is active (running or in queue to run) -> Pause it
+        if task_id not in self._suspended and ((worker and worker.isRunning()) or task_state in (STATE_RUNNING, STATE_QUEUED)):
+            logging.info(f"{self.log_prefix}Requesting pause for task {task_id} (status: {current_status})")
+            if worker and worker.isRunning():
+                if not self._pause_worker(task_id, worker): # Worker's finished signal will update status to "暂停"
+                    stop_workers_in_parallel([worker])
+            elif task_id in self.task_queue: # If it's in queue but not yet started by a worker
+                try:
+                    self.task_queue.remove(task_id)
+                    task_data["status"] = "暂停"; self._set_task_state(task_id, STATE_PAUSED) # Manually set to Paused
+                    self.task_updated.emit(task_id)
+                    self.save_tasks_to_file()
+                    logging.info(f"{self.log_prefix}Task {task_id} removed from queue and paused.")
+                except ValueError:
+                    logging.warning(f"{self.log_prefix}Task {task_id} was in queue but remove failed.")
+            else: # Should be handled by worker.stop() if it's running without being in queue (unlikely)
+                 # This case might occur if status is "下载中..." but worker is None or not running
+                 task_data["status"] = "暂停"; self._set_task_state(task_id, STATE_PAUSED)
+                 self.task_updated.emit(task_id); self.save_tasks_to_file()
+
+        # If task is paused, waiting, or failed -> Resume/Start it
+        elif task_state in STARTABLE_STATES:
+            logging.info(f"{self.log_prefix}Requesting resume/start for task {task_id} (status: {current_status})")
+            self.enqueue_task(task_id) # enqueue_task handles moving the task to QUEUED
+            self.check_and_start_tasks()
+        else:
+            # For statuses like "完成", this button does nothing
+            logging.info(f"{self.log_prefix}Task {task_id} status '{current_status}' is not toggleable by this button.")
+
+    # --- 链接解析队列 ---
+    def submit_urls(self, urls, fetch_options=None, params=None, autostart=False):
+        """
+        Queues input URLs (videos or playlists) for resolving with YtDlpListFetcher.
+        fetch_options: dict with cookies_browser / cookies_file_path / extra_args_for_fetching.
+        params: download params for the resulting tasks (None -> default_params_provider at add time).
+        autostart: enqueue the resulting tasks for download as soon as they are added.
+        Returns the number of URLs queued for resolving.
+        """
+        fetch_options = fetch_options or {}
+        was_idle = not self.is_fetching()
+        queued_url_count = 0
+        for url in urls:
+            url = url.strip()
+            if url:
+                self._urls_to_fetch_queue.append((url, fetch_options, params, autostart))
+                self._pending_fetch_keys.add(canonical_url(url))
+                queued_url_count += 1
+        if was_idle and queued_url_count:
+            self.list_fetcher_processed_count = 0 # Reset counter
+            logging.info(f"{self.log_prefix}开始解析 {len(self._urls_to_fetch_queue)} 个链接...")
+            self._fetch_next_url() # Start fetching the first URL in the queue
+        return queued_url_count
+
+    def add_tasks_without_resolving(self, urls, params=None, autostart=False, save=True):
+        """
+        Adds one task per URL directly (title = URL), skipping the yt-dlp -J resolve step,
+        so that very large batches are cheap. Returns [(url, task_id or None for duplicates)].
+        save=False leaves saving to the caller (e.g. request_save() after each streamed chunk).
+        """
+        results = []
+        for url in urls:
+            url = url.strip()
+            if not url: continue
+            task_id = self.add_task(url, url, params=params, save=False)
+            if task_id and autostart:
+                self.enqueue_task(task_id, save=False)
+            results.append((url, task_id))
+        if any(task_id for _, task_id in results):
+            if save: self.save_tasks_to_file() # One save for the whole batch
+            if autostart: self.check_and_start_tasks()
+        logging.info(f"{self.log_prefix}Added {sum(1 for _, tid in results if tid)} of {len(results)} URLs without resolving.")
+        return results
+
+    def _fetch_next_url(self):
+        if not self._urls_to_fetch_queue: # All URLs processed
+            logging.info(f"{self.log_prefix}所有链接解析尝试完成。")
+            processed_count = self.list_fetcher_processed_count
+            self.list_fetcher_processed_count = 0 # Reset counter
+            self.fetch_queue_drained.emit(processed_count)
+            return
+
+        self.list_fetcher_processed_count +=1 # Increment for this URL
+        self.current_fetch_url, fetch_options, self._current_fetch_params, self._current_fetch_autostart = self._urls_to_fetch_queue.popleft() # Get next URL
+        logging.info(f"{self.log_prefix}正在解析: {self.current_fetch_url} (还剩 {len(self._urls_to_fetch_queue)} 个)")
+        self.fetch_started.emit(self.current_fetch_url, len(self._urls_to_fetch_queue))
+        self._current_fetch_started = time.monotonic()
+        self._current_fetch_failed = False
+
+        self.list_fetcher = YtDlpListFetcher(
+            self.current_fetch_url,
+            cookies_browser=fetch_options.get("cookies_browser"),
+            cookies_file_path=fetch_options.get("cookies_file_path"),
+            extra_args_for_fetching=fetch_options.get("extra_args_for_fetching"),
+            info_json_dir=self.info_json_dir
+        )
+        self.list_fetcher.fetched_signal.connect(self.on_entries_fetched_for_url)
+        self.list_fetcher.error_signal.connect(self.on_fetch_error_for_url)
+        self.list_fetcher.finished.connect(self._on_fetcher_finished) # To proceed to next URL
+        self.list_fetcher.start()
+        logging.debug(f"{self.log_prefix}YtDlpListFetcher for {self.current_fetch_url} started.")
+
+    def _on_fetcher_finished(self):
+        # This slot is called when a YtDlpListFetcher thread finishes (successfully or with error)
+        logging.info(f"{self.log_prefix}解析线程 for '{self.current_fetch_url}' 已结束 (finished signal).")
+        self.fetch_finished.emit(self.current_fetch_url, time.monotonic() - self._current_fetch_started, not self._current_fetch_failed)
+        self._pending_fetch_keys.discard(canonical_url(self.current_fetch_url))
+
+        # Clean up connections for the completed fetcher
+        if self.list_fetcher and not self.list_fetcher.isRunning():
+            try:
+                # Disconnect signals to prevent issues if fetcher object is reused or lingers
+                self.list_fetcher.fetched_signal.disconnect(self.on_entries_fetched_for_url)
+                self.list_fetcher.error_signal.disconnect(self.on_fetch_error_for_url)
+                self.list_fetcher.finished.disconnect(self._on_fetcher_finished)
+            except TypeError: # Signals might have already been disconnected or were never connected
+                logging.debug(f"{self.log_prefix}Signals for fetcher '{self.current_fetch_url}' likely already disconnected.")
+            except Exception as e_disc:
+                logging.warning(f"{self.log_prefix}Error disconnecting fetcher signals for {self.current_fetch_url}: {e_disc}")
+
+        self._fetch_next_url() # Process the next URL in the queue
+
+    def on_entries_fetched_for_url(self, entries): # entries is a list of dicts
+        logging.info(f"{self.log_prefix}成功从 '{self.current_fetch_url}' 解析到 {len(entries)} 条目。")
+        if not entries and self.current_fetch_url: # No entries found but fetch was "successful"
+             self.fetch_empty.emit(self.current_fetch_url)
+
+        added_count = 0
+        for entry in entries:
+            url = entry.get("url")
+            if not url:
+                logging.warning(f"{self.log_prefix}Fetched entry missing URL for {self.current_fetch_url}, entry: {entry}")
+                continue
+            title = entry.get("title", url) # Use URL as fallback title
+
+            new_task_id = self.add_task(url, title, params=self._current_fetch_params, save=False) # returns task_id or None
+            if new_task_id:
+                added_count += 1
+                if self._current_fetch_autostart:
+                    self.enqueue_task(new_task_id, save=False)
+
+        if added_count > 0:
+            logging.info(f"{self.log_prefix}Added {added_count} new tasks.")
+            self.save_tasks_to_file() # One save per fetched list instead of one per entry
+
+    def on_fetch_error_for_url(self, msg): # msg is a string
+        logging.error(f"{self.log_prefix}解析错误 ({self.current_fetch_url}): {msg}")
+        self._current_fetch_failed = True
+        self.fetch_error.emit(self.current_fetch_url, msg)
+        # Note: _on_fetcher_finished will still be called to proceed to the next URL if any
+
+    # --- 关闭 ---
+    def shutdown(self, wait_ms_per_thread=5000):
+        """Stops active downloads, clears the queue and waits for worker threads before exit."""
+        self.timer.stop()
+        self._urls_to_fetch_queue.clear()
+        self._pending_fetch_keys.clear()
+        self.pause_all_active_tasks(clear_queue=True, suspend=False) # Stop active downloads and clear queue
+        self._expire_suspended_tasks(force=True)
+        self.transcode.shutdown(wait_ms_per_thread) # 未完成的转码和后处理在下次启动时重新运行
+        self.postprocess.shutdown(wait_ms_per_thread)
+
+        logging.debug(f"{self.log_prefix}Saving tasks before waiting for threads...")
+        self.save_tasks_to_file() # Save current state
+
+        active_threads_to_wait_for = []
+        # Check DownloadTaskWorker threads
+        for task_data_val in list(self.tasks.values()): # Iterate over a copy
+            worker = task_data_val.get("worker")
+            if worker and worker.isRunning():
+                logging.debug(f"{self.log_prefix}Shutdown: DownloadWorker for task {getattr(worker, 'task_id', 'Unknown')} is running.")
+                active_threads_to_wait_for.append(worker)
+
+        # Check YtDlpListFetcher thread (if any is active)
+        if self.list_fetcher and self.list_fetcher.isRunning():
+            logging.debug(f"{self.log_prefix}Shutdown: ListFetcher for {self.current_fetch_url} is running.")
+            active_threads_to_wait_for.append(self.list_fetcher)
+
+        for thread_to_wait in active_threads_to_wait_for:
+            thread_name = getattr(thread_to_wait, 'task_id', type(thread_to_wait).__name__)
+            logging.info(f"{self.log_prefix}等待线程: {thread_name}...")
+            # QThread.wait() is blocking and will wait for the thread's run() method to exit.
+            if not thread_to_wait.wait(wait_ms_per_thread):
+                logging.warning(f"{self.log_prefix}线程 {thread_name} 等待超时，可能未完全结束。")
+            else:
+                logging.info(f"{self.log_prefix}线程 {thread_name} 已结束。")
+
+        # 处理线程结束前发出的排队信号 (暂停/完成)，让最终保存的状态与实际一致
+        QCoreApplication.processEvents()
+        logging.debug(f"{self.log_prefix}Final save before exiting...")
+        self.save_tasks_to_file() # Final save after threads are hopefully done
@@ -0,0 +1,92 @@
+# task_output.py
+import os
+import gzip
+import time
+import logging
+import threading
+from collections import deque
+
+DEFAULT_MAX_LINES = 500 # 每个任务在内存中保留的最近输出行数
+MAX_SPILL_FILE_BYTES = 256 * 1024 # 压缩文件超过此大小时，新一次运行会覆盖而不是追加
+TASK_OUTPUT_FILE_SUFFIX = ".log.gz"
+
+
+def _is_progress_line(line):
+    return line.startswith('[download]') and '%' in line and 'Destination:' not in line
+
+
+def task_output_path(directory, task_id):
+    return os.path.join(directory, f"{task_id}{TASK_OUTPUT_FILE_SUFFIX}")
+
+
+def read_task_output(directory, task_id, max_lines=DEFAULT_MAX_LINES):
+    """Last max_lines lines of a task's spilled output (all runs, oldest first); [] if there is none."""
+    try:
+        with gzip.open(task_output_path(directory, task_id), "rt", encoding="utf-8", errors="replace") as f:
+            return [line.rstrip("\n") for line in deque(f, maxlen=max_lines)]
+    except (OSError, EOFError) as e: # EOFError: 写入中途被中断的文件
+        if not isinstance(e, FileNotFoundError):
+            logging.warning(f"Could not read task output for {task_id}: {e}")
+        return []
+
+
+def remove_task_outputs(directory, task_ids):
+    for task_id in task_ids:
+        try:
+            os.remove(task_output_path(directory, task_id))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Could not remove task output for {task_id}: {e}")
+
+
+class TaskOutputLog:
+    """
+    Recent yt-dlp output of one task run. Lines are kept in a fixed-size ring buffer
+    (consecutive progress lines overwrite each other), and appended to a per-task gzip file
+    when the run ends, so memory only grows with the number of running tasks.
+    Thread-safe: the worker appends while the GUI/API reads.
+    """
+
+    def __init__(self, task_id, directory, max_lines=DEFAULT_MAX_LINES):
+        self.task_id = task_id
+        self.directory = directory
+        self.started_at = time.time()
+        self.dropped_count = 0 # 被挤出环形缓冲区的行数
+        self._lines = deque(maxlen=max_lines)
+        self._spilled = False
+        self._lock = threading.Lock()
+
+    def append(self, line):
+        with self._lock:
+            if self._spilled: return
+            if self._lines and _is_progress_line(line) and _is_progress_line(self._lines[-1]):
+                self._lines[-1] = line
+                return
+            if len(self._lines) == self._lines.maxlen:
+                self.dropped_count += 1
+            self._lines.append(line)
+
+    def lines(self, max_lines=DEFAULT_MAX_LINES):
+        with self._lock:
+            if not self._spilled:
+                return list(self._lines)[-max_lines:]
+        return read_task_output(self.directory, self.task_id, max_lines)
+
+    def spill(self):
+        """Appends this run to the task's gzip file and frees the buffer. Called once, on the worker thread."""
+        with self._lock: # 写入期间读取方等待，避免读到不完整的文件
+            if self._spilled: return
+            self._spilled = True
+            header = f"===== {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started_at))} ====="
+            if self.dropped_count:
+                header += f" (更早的 {self.dropped_count} 行已省略)"
+            path = task_output_path(self.directory, self.task_id)
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                mode = "wt" if os.path.exists(path) and os.path.getsize(path) > MAX_SPILL_FILE_BYTES else "at"
+                with gzip.open(path, mode, encoding="utf-8") as f: # 追加写入一个新的 gzip 成员
+                    f.write("\n".join([header] + list(self._lines)) + "\n")
+            except OSError as e:
+                logging.warning(f"Could not write task output for {self.task_id} to {path}: {e}")
+            self._lines.clear()
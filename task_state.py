@@ -0,0 +1,133 @@
+# task_state.py
+import logging
+
+# --- 任务状态机 ---
+# 每个任务在任一时刻只处于下列状态之一。界面上显示的 "status" 文本只用于展示，
+# 调度逻辑（全部开始/全部暂停/继续/重试等）只依据这里的状态。
+STATE_WAITING = "waiting"   # 新建，尚未开始
+STATE_QUEUED = "queued"     # 已在下载队列中
+STATE_RUNNING = "running"   # 有活动的下载线程
+STATE_POSTPROCESSING = "postprocessing" # 已下载，在后处理队列中或正在运行后处理脚本 (不占用下载名额)
+STATE_PAUSED = "paused"     # 用户暂停或程序中断
+STATE_FAILED = "failed"     # 失败/错误，可重试
+STATE_DONE = "done"         # 已完成
+
+ALL_STATES = (STATE_WAITING, STATE_QUEUED, STATE_RUNNING, STATE_POSTPROCESSING, STATE_PAUSED, STATE_FAILED, STATE_DONE)
+
+# 可被 "全部开始"/"继续选中" 重新排队的状态
+STARTABLE_STATES = (STATE_WAITING, STATE_PAUSED, STATE_FAILED)
+
+# 允许的状态迁移 (from -> {to})
+ALLOWED_TRANSITIONS = {
+    STATE_WAITING: {STATE_QUEUED, STATE_PAUSED, STATE_FAILED, STATE_DONE},
+    STATE_QUEUED:  {STATE_RUNNING, STATE_PAUSED, STATE_WAITING, STATE_FAILED, STATE_DONE},
+    STATE_RUNNING: {STATE_PAUSED, STATE_FAILED, STATE_DONE, STATE_POSTPROCESSING},
+    STATE_POSTPROCESSING: {STATE_DONE, STATE_FAILED},
+    STATE_PAUSED:  {STATE_QUEUED, STATE_WAITING, STATE_FAILED, STATE_RUNNING}, # paused -> running: 挂起的进程直接继续
+    # 下载线程对 "成功退出但未捕获路径" 会先发 error_signal 再发 finished_signal，因此 failed -> done 合法
+    STATE_FAILED:  {STATE_QUEUED, STATE_WAITING, STATE_DONE},
+    STATE_DONE:    {STATE_QUEUED, STATE_WAITING},
+}
+
+# 状态在界面计数栏中的显示名称
+STATE_DISPLAY_NAMES = {
+    STATE_WAITING: "等待",
+    STATE_QUEUED: "排队",
+    STATE_RUNNING: "下载中",
+    STATE_POSTPROCESSING: "后处理",
+    STATE_PAUSED: "暂停",
+    STATE_FAILED: "失败",
+    STATE_DONE: "完成",
+}
+
+
+def state_from_legacy_fields(task_data):
+    """
+    Derives a state from a task dict saved by older versions, which only had
+    the status string plus the 'paused'/'failed'/'in_queue' flags.
+    """
+    saved_state = task_data.get("state")
+    if saved_state in ALL_STATES:
+        return saved_state
+
+    status = task_data.get("status", "等待") or "等待"
+    if status.startswith("完成") and status != "完成但找不到文件":
+        return STATE_DONE
+    if task_data.get("failed") or status == "错误" or "失败" in status or "错误(" in status:
+        return STATE_FAILED
+    if status in ["下载中...", "启动中", "准备下载"]:
+        return STATE_RUNNING
+    if task_data.get("in_queue") or status == "排队中":
+        return STATE_QUEUED
+    if task_data.get("paused") or status in ["暂停", "已暂停(中断)"]:
+        return STATE_PAUSED
+    return STATE_WAITING
+
+
+class TaskStateIndex:
+    """
+    Keeps each task's state plus a reverse index of task IDs per state.
+    ids() returns task IDs in the order the tasks were first added (the order of TaskEngine.tasks).
+    """
+
+    def __init__(self):
+        self._state_of = {} # task_id: state
+        self._ids_by_state = {state: set() for state in ALL_STATES}
+        self._order = {} # task_id: 首次加入时的序号
+        self._next_order = 0
+
+    def set_state(self, task_id, new_state):
+        """Moves task_id into new_state and returns its previous state (or None)."""
+        if new_state not in self._ids_by_state:
+            raise ValueError(f"Unknown task state: {new_state}")
+        old_state = self._state_of.get(task_id)
+        if old_state == new_state:
+            return old_state
+        if old_state is not None:
+            if new_state not in ALLOWED_TRANSITIONS.get(old_state, ()):
+                # 不阻止迁移，只记录，方便排查调度逻辑中的问题
+                logging.warning(f"TaskStateIndex: unexpected transition for task {task_id}: {old_state} -> {new_state}")
+            self._ids_by_state[old_state].discard(task_id)
+        else:
+            self._order[task_id] = self._next_order
+            self._next_order += 1
+        self._ids_by_state[new_state].add(task_id)
+        self._state_of[task_id] = new_state
+        return old_state
+
+    def discard(self, task_id):
+        old_state = self._state_of.pop(task_id, None)
+        if old_state is not None:
+            self._ids_by_state[old_state].discard(task_id)
+            del self._order[task_id]
+        return old_state
+
+    def state_of(self, task_id):
+        return self._state_of.get(task_id)
+
+    def ids(self, *states):
+        # 返回按添加顺序排列的快照列表，调用方在遍历时可以安全地改变任务状态
+        if len(states) == 1:
+            return sorted(self._ids_by_state[states[0]], key=self._order.__getitem__)
+        result = []
+        for state in states:
+            result.extend(self._ids_by_state[state])
+        return sorted(result, key=self._order.__getitem__)
+
+    def count(self, state):
+        return len(self._ids_by_state[state])
+
+    def counts(self):
+        return {state: len(ids) for state, ids in self._ids_by_state.items()}
+
+    def clear(self):
+        self._state_of.clear()
+        self._order.clear()
+        for ids in self._ids_by_state.values():
+            ids.clear()
+
+    def __contains__(self, task_id):
+        return task_id in self._state_of
+
+    def __len__(self):
+        return len(self._state_of)
@@ -0,0 +1,134 @@
+# tracing.py
+import os
+import json
+import time
+import logging
+from collections import OrderedDict, deque
+from PyQt5.QtCore import QObject
+
+from task_state import STATE_QUEUED, STATE_RUNNING, STATE_POSTPROCESSING, STATE_DONE, STATE_FAILED, STATE_PAUSED, STATE_WAITING
+
+DEFAULT_MAX_TRACED_TASKS = 20000 # 超出后丢弃最早的任务轨迹，避免长时间运行时内存无限增长
+
+PHASE_QUEUE_WAIT = "queue_wait" # 引擎侧: 进入队列到工作线程启动
+PHASE_STARTUP = "startup"       # 引擎侧: 工作线程启动到 yt-dlp 进程创建 (之后由 workers.PHASE_* 接管)
+PHASE_POSTPROCESS_WAIT = "postprocess_wait" # 引擎侧: 下载完成到后处理开始 (等待后处理名额)
+
+_END_STATES = (STATE_DONE, STATE_FAILED, STATE_PAUSED, STATE_WAITING)
+
+
+class _TaskTrace:
+    __slots__ = ("task_id", "title", "spans", "open_phase", "open_since")
+
+    def __init__(self, task_id, title):
+        self.task_id = task_id
+        self.title = title
+        self.spans = [] # (phase, start, end, args)
+        self.open_phase = None
+        self.open_since = None
+
+    def begin(self, phase, at):
+        self.end(at)
+        self.open_phase, self.open_since = phase, at
+
+    def end(self, at, args=None):
+        if self.open_phase is None: return
+        self.spans.append((self.open_phase, self.open_since, max(at, self.open_since), args))
+        self.open_phase = self.open_since = None
+
+
+class TaskTracer(QObject):
+    """
+    Records per-task lifecycle spans (queue wait, yt-dlp startup, extraction, download,
+    merge/recode, post script) from TaskEngine signals and exports them as Chrome trace
+    JSON, which chrome://tracing and ui.perfetto.dev can open.
+    """
+
+    def __init__(self, engine, max_tasks=DEFAULT_MAX_TRACED_TASKS, parent=None):
+        super().__init__(parent)
+        self.log_prefix = f"[{self.__class__.__name__}] "
+        self.engine = engine
+        self.max_tasks = max_tasks
+        self.traces = OrderedDict() # task_id: _TaskTrace
+        self.counters = deque(maxlen=max_tasks * 8) # (time, running, queued)，显示并发与排队情况
+        self._last_state = {}
+
+        self.engine.task_updated.connect(self.on_task_updated)
+        self.engine.task_phase.connect(self.on_task_phase)
+        self.engine.tasks_removed.connect(self.on_tasks_removed)
+
+    def _trace_for(self, task_id):
+        trace = self.traces.get(task_id)
+        if trace is None:
+            title = self.engine.tasks.get(task_id, {}).get("title", "")
+            trace = self.traces[task_id] = _TaskTrace(task_id, title)
+            while len(self.traces) > self.max_tasks:
+                self.traces.popitem(last=False)
+        return trace
+
+    def on_task_updated(self, task_id):
+        state = self.engine.state_of(task_id)
+        previous = self._last_state.get(task_id)
+        if state == previous: return
+        self._last_state[task_id] = state
+        now = time.time()
+        if state == STATE_QUEUED:
+            self._trace_for(task_id).begin(PHASE_QUEUE_WAIT, now)
+        elif state == STATE_RUNNING:
+            self._trace_for(task_id).begin(PHASE_STARTUP, now)
+        elif state == STATE_POSTPROCESSING:
+            self._trace_for(task_id).begin(PHASE_POSTPROCESS_WAIT, now)
+        elif state in _END_STATES and task_id in self.traces:
+            self.traces[task_id].end(now, {"result": state})
+        else:
+            return
+        self.counters.append((now, self.engine.task_states.count(STATE_RUNNING), self.engine.task_states.count(STATE_QUEUED)))
+
+    def on_task_phase(self, task_id, phase, at):
+        # 工作线程发出的时间戳，比主线程收到信号的时间更准确
+        self._trace_for(task_id).begin(phase, at)
+
+    def on_tasks_removed(self, task_ids):
+        now = time.time()
+        for task_id in task_ids:
+            self._last_state.pop(task_id, None)
+            trace = self.traces.get(task_id)
+            if trace:
+                trace.end(now, {"result": "removed"})
+
+    def to_chrome_trace(self):
+        """Returns a Chrome trace event dict; one row (tid) per task, timestamps in microseconds."""
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "ytdow"}}]
+        now = time.time()
+        for tid, trace in enumerate(self.traces.values(), start=1):
+            label = f"{trace.task_id} {trace.title}".strip()
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": label}})
+            spans = list(trace.spans)
+            if trace.open_phase is not None: # 仍在进行中的阶段截止到导出时刻
+                spans.append((trace.open_phase, trace.open_since, now, {"result": "in_progress"}))
+            for phase, start, end, args in spans:
+                event = {"name": phase, "cat": "task", "ph": "X", "pid": pid, "tid": tid,
+                         "ts": int(start * 1e6), "dur": int((end - start) * 1e6)}
+                event["args"] = dict(args or {}, task_id=trace.task_id)
+                events.append(event)
+        for at, running, queued in self.counters:
+            events.append({"name": "tasks", "ph": "C", "pid": pid, "tid": 0, "ts": int(at * 1e6),
+                           "args": {"running": running, "queued": queued}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, file_path):
+        """Writes the trace atomically to file_path. Returns the number of traced tasks."""
+        data = self.to_chrome_trace()
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, file_path)
+        logging.info(f"{self.log_prefix}Exported {len(self.traces)} task traces ({len(data['traceEvents'])} events) to {file_path}")
+        return len(self.traces)
+
+
+def add_tracing_arguments(parser):
+    """Adds the --trace-file option shared by main_app.py and cli_app.py."""
+    parser.add_argument("--trace-file", default=None, metavar="PATH",
+                        help="记录每个任务的生命周期阶段，退出时导出为 Chrome trace / Perfetto JSON")
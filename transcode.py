@@ -0,0 +1,350 @@
+# transcode.py
+import os
+import re
+import sys
+import time
+import shutil
+import logging
+import threading
+import subprocess
+from collections import deque
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+
+from constants import get_ffmpeg_executable_path
+from workers import TIMING_TRANSCODE, TIMING_TRANSCODE_CPU, PHASE_CONVERT
+
+CONV_MODE_AUDIO = '音频提取转换' # 与 task_engine.CONV_MODES 相同
+CONV_MODE_VIDEO = '视频格式转换'
+
+DEFAULT_TRANSCODE_JOBS = max(1, (os.cpu_count() or 2) // 2)
+DEFAULT_TRANSCODE_NICE = 10 # 转码进程的 nice 值增量，让下载和界面优先使用 CPU
+MAX_FFMPEG_ERROR_LINES = 20
+
+# --audio-format -> (ffmpeg 音频编码器, 文件扩展名, 额外参数)，与 yt-dlp 的 FFmpegExtractAudioPP 一致
+_AUDIO_CODECS = {
+    'mp3': ('libmp3lame', 'mp3', []),
+    'aac': ('aac', 'aac', ['-f', 'adts']),
+    'm4a': ('aac', 'm4a', []),
+    'opus': ('libopus', 'opus', []),
+    'vorbis': ('libvorbis', 'ogg', []),
+    'ogg': ('libvorbis', 'ogg', []),      # 界面中的 ogg 即 vorbis 音频
+    'flac': ('flac', 'flac', []),
+    'alac': ('alac', 'm4a', []),
+    'wav': ('pcm_s16le', 'wav', []),
+}
+_LOSSLESS_AUDIO_FORMATS = ('flac', 'alac', 'wav')
+# --recode-video 格式的额外参数 (其余格式使用 ffmpeg 默认编码器)
+_VIDEO_OPTIONS = {'avi': ['-c:v', 'libxvid', '-vtag', 'XVID']}
+_HEIGHT_ALIASES = {'4k': 2160, '2k': 1440}
+
+
+def parse_output_specs(conv_mode, conv_fmt):
+    """
+    Conversion outputs of a task as [(conv_mode, fmt, max_height or None), ...].
+    conv_fmt may list several comma-separated formats (multi-output task: the source is downloaded
+    once and converted to each of them); then each format picks its own mode (audio formats are
+    extracted, others recoded) and 'fmt@720' / 'fmt@720p' / 'fmt@4k' limits the video height.
+    """
+    if conv_mode not in (CONV_MODE_AUDIO, CONV_MODE_VIDEO):
+        return []
+    parts = [part.strip().lower() for part in (conv_fmt or "").split(",") if part.strip()]
+    if len(parts) == 1 and "@" not in parts[0]:
+        return [(conv_mode, parts[0], None)]
+    outputs = []
+    for part in parts:
+        fmt, _, quality = part.partition("@")
+        if not fmt: continue
+        max_height = _HEIGHT_ALIASES.get(quality) or (int(re.sub(r"\D", "", quality)) if re.search(r"\d", quality) else None)
+        mode = CONV_MODE_AUDIO if fmt in _AUDIO_CODECS else CONV_MODE_VIDEO
+        output = (mode, fmt, max_height if mode == CONV_MODE_VIDEO else None)
+        if output not in outputs: outputs.append(output)
+    return outputs
+
+
+def needs_transcode(conv_mode, conv_fmt):
+    """True for the conversion settings that run in the transcode stage instead of inside yt-dlp."""
+    return bool(parse_output_specs(conv_mode, conv_fmt))
+
+
+def transcode_output_path(source, conv_mode, conv_fmt, max_height=None):
+    """Path of the converted file next to source, or None if source already is that output."""
+    conv_fmt = conv_fmt.strip().lower()
+    ext = _AUDIO_CODECS.get(conv_fmt, (None, conv_fmt, []))[1] if conv_mode == CONV_MODE_AUDIO else conv_fmt
+    base, source_ext = os.path.splitext(source)
+    if max_height:
+        return f"{base}.{max_height}p.{ext}"
+    if source_ext[1:].lower() == ext:
+        return None
+    return f"{base}.{ext}"
+
+
+def build_ffmpeg_command(ffmpeg_path, source, output_path, conv_mode, conv_fmt, audio_quality="", threads=0, max_height=None):
+    conv_fmt = conv_fmt.strip().lower()
+    cmd = [ffmpeg_path, '-y', '-nostdin', '-hide_banner', '-loglevel', 'warning', '-i', source]
+    if threads:
+        cmd.extend(['-threads', str(threads)])
+    if conv_mode == CONV_MODE_AUDIO:
+        codec, _, extra = _AUDIO_CODECS.get(conv_fmt, (None, conv_fmt, []))
+        cmd.append('-vn')
+        if codec: cmd.extend(['-c:a', codec])
+        quality = (audio_quality or "").strip()
+        if quality and conv_fmt not in _LOSSLESS_AUDIO_FORMATS:
+            if quality.isdigit():
+                # yt-dlp 的 0 (最佳) - 9 (最差) VBR 质量；vorbis 的刻度相反
+                if conv_fmt == 'mp3': cmd.extend(['-q:a', quality])
+                elif conv_fmt == 'vorbis': cmd.extend(['-q:a', str(10 - min(int(quality), 10))])
+            else:
+                cmd.extend(['-b:a', quality.lower()]) # 如 192K
+        cmd.extend(extra)
+    else:
+        if max_height:
+            cmd.extend(['-vf', f"scale=-2:'min({max_height},ih)'"]) # 只缩小，保持宽高比
+        cmd.extend(_VIDEO_OPTIONS.get(conv_fmt, []))
+    cmd.append(output_path)
+    return cmd
+
+
+def parse_cpu_list(text):
+    """'0-3,6' -> {0, 1, 2, 3, 6}; empty -> None. Raises ValueError for malformed input."""
+    cpus = set()
+    for part in (text or "").replace(" ", "").split(","):
+        if not part: continue
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus or None
+
+
+class TranscodeWorker(QThread):
+    """Runs one ffmpeg conversion at lower priority and reports its wall and CPU time."""
+    finished_signal = pyqtSignal(str, str, bool, str) # task_id, output_path, ok, message
+    timing_signal = pyqtSignal(str, str, float)       # task_id, TIMING_TRANSCODE / TIMING_TRANSCODE_CPU, seconds
+    phase_signal = pyqtSignal(str, str, float)        # task_id, PHASE_CONVERT, time.time()
+
+    def __init__(self, task_id, source, output_path, cmd, nice=DEFAULT_TRANSCODE_NICE, cpu_affinity=None, output_log=None):
+        super().__init__()
+        self.task_id = task_id
+        self.source = source
+        self.output_path = output_path
+        self.cmd = cmd # 写入临时文件，成功后改名为 output_path
+        self.nice = nice
+        self.cpu_affinity = cpu_affinity
+        self.output_log = output_log
+        self._process = None
+        self._reaped = False
+        self._stopped = False
+        self._lock = threading.Lock()
+        self.setObjectName(f"Transcode_{task_id}")
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            if self._process and not self._reaped:
+                try: self._process.kill()
+                except OSError: pass
+
+    def _popen_kwargs(self):
+        kwargs = {'stdin': subprocess.DEVNULL, 'stdout': subprocess.DEVNULL, 'stderr': subprocess.PIPE,
+                  'text': True, 'encoding': 'utf-8', 'errors': 'replace'}
+        if sys.platform == "win32":
+            kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW | (subprocess.BELOW_NORMAL_PRIORITY_CLASS if self.nice > 0 else 0)
+        else:
+            nice, cpus = self.nice, self.cpu_affinity
+            def lower_priority():
+                os.setsid()
+                if nice > 0: os.nice(nice)
+                if cpus and hasattr(os, "sched_setaffinity"): os.sched_setaffinity(0, cpus)
+            kwargs['preexec_fn'] = lower_priority
+        return kwargs
+
+    def _wait(self):
+        """Returns (returncode, cpu_seconds or None). wait4 gives the rusage of this ffmpeg process alone."""
+        if hasattr(os, "wait4"):
+            try:
+                _, status, rusage = os.wait4(self._process.pid, 0)
+                with self._lock:
+                    self._reaped = True
+                    self._process.returncode = os.waitstatus_to_exitcode(status)
+                return self._process.returncode, rusage.ru_utime + rusage.ru_stime
+            except ChildProcessError:
+                pass # 已被 Popen 回收
+        return self._process.wait(), None
+
+    def run(self):
+        try:
+            self._run_transcode()
+        finally:
+            if self.output_log:
+                self.output_log.spill()
+
+    def _run_transcode(self):
+        start_time = time.monotonic()
+        self.phase_signal.emit(self.task_id, PHASE_CONVERT, time.time())
+        temp_path = self.cmd[-1]
+        if self.output_log:
+            self.output_log.append("$ " + " ".join(self.cmd))
+        ok, message, cpu_seconds = False, "", None
+        error_lines = deque(maxlen=MAX_FFMPEG_ERROR_LINES)
+        try:
+            with self._lock:
+                if self._stopped: raise InterruptedError()
+                self._process = subprocess.Popen(self.cmd, **self._popen_kwargs())
+            for line in self._process.stderr:
+                line = line.strip()
+                if not line: continue
+                error_lines.append(line)
+                if self.output_log:
+                    self.output_log.append(f"[ffmpeg] {line}")
+            self._process.stderr.close()
+            returncode, cpu_seconds = self._wait()
+            if returncode == 0 and os.path.exists(temp_path):
+                os.replace(temp_path, self.output_path)
+                ok = True
+                message = f"CPU {cpu_seconds:.1f}s" if cpu_seconds is not None else ""
+            else:
+                message = f"转码失败 (ffmpeg 码 {returncode})" + (f": {error_lines[-1][:100]}" if error_lines else "")
+                if not self._stopped:
+                    logging.error(f"Task {self.task_id}: ffmpeg exited with {returncode}: {' | '.join(error_lines)}")
+        except InterruptedError:
+            pass
+        except OSError as e:
+            message = f"无法运行 ffmpeg: {e}"
+            logging.error(f"Task {self.task_id}: Could not run ffmpeg {self.cmd[0]}: {e}")
+        if not ok:
+            try: os.remove(temp_path)
+            except OSError: pass
+            if self._stopped: message = "转码已取消"
+        elapsed = time.monotonic() - start_time
+        self.timing_signal.emit(self.task_id, TIMING_TRANSCODE, elapsed)
+        if cpu_seconds is not None:
+            self.timing_signal.emit(self.task_id, TIMING_TRANSCODE_CPU, cpu_seconds)
+        cpu_text = f"{cpu_seconds:.1f}s" if cpu_seconds is not None else "未知"
+        logging.info(f"Task {self.task_id}: transcode to {os.path.basename(self.output_path)} {'done' if ok else 'failed'}, "
+                     f"wall {elapsed:.1f}s, cpu {cpu_text}")
+        if self.output_log:
+            self.output_log.append(f"[ytdow] 转码{'完成' if ok else '结束'}: 用时 {elapsed:.1f}s, CPU 时间 {cpu_text}")
+        self.finished_signal.emit(self.task_id, self.output_path, ok, message)
+
+
+class TranscodeStage(QObject):
+    """
+    Runs the ffmpeg conversions of '音频提取转换' / '视频格式转换' tasks after their download,
+    instead of yt-dlp running ffmpeg inside every concurrent download. A multi-output task
+    submits one job per output, so its conversions run in parallel from the same local file. At most max_concurrent
+    jobs run at once, each with threads_per_job ffmpeg threads, a raised nice value and
+    optionally pinned to cpu_affinity, so downloads keep their network slots and CPU time.
+    """
+    job_started = pyqtSignal(str, str)              # task_id, output_path
+    job_finished = pyqtSignal(str, str, bool, str)  # task_id, output_path, ok, message
+    timing = pyqtSignal(str, str, float)            # 与 TaskEngine.task_timing 相同
+    phase = pyqtSignal(str, str, float)
+
+    def __init__(self, max_concurrent=DEFAULT_TRANSCODE_JOBS, parent=None):
+        super().__init__(parent)
+        self.log_prefix = f"[{self.__class__.__name__}] "
+        self.max_concurrent = max(1, max_concurrent)
+        self.threads_per_job = 0 # 0: CPU 核数平分给各作业
+        self.nice = DEFAULT_TRANSCODE_NICE
+        self.cpu_affinity = None # None: 不限制; 否则为 CPU 编号集合
+        self.queue = deque() # (task_id, source, output_path, conv_mode, conv_fmt, audio_quality, max_height, output_log)
+        self.running = {}    # (task_id, output_path): TranscodeWorker
+        self.finishing = set()
+        self._ffmpeg_path = None
+        self._shutting_down = False
+
+    def ffmpeg_path(self):
+        """Resolved ffmpeg executable, or None if it cannot be found (yt-dlp then converts as before)."""
+        if self._ffmpeg_path is None:
+            path = get_ffmpeg_executable_path()
+            self._ffmpeg_path = path if os.path.isfile(path) or shutil.which(path) else ""
+            if not self._ffmpeg_path:
+                logging.warning(f"{self.log_prefix}ffmpeg not found ('{path}'), conversions stay inside yt-dlp.")
+        return self._ffmpeg_path or None
+
+    def pending_count(self):
+        return len(self.queue)
+
+    def running_count(self):
+        return len(self.running)
+
+    def is_idle(self):
+        return not self.queue and not self.running
+
+    def effective_threads_per_job(self):
+        if self.threads_per_job > 0: return self.threads_per_job
+        cpu_count = len(self.cpu_affinity) if self.cpu_affinity else (os.cpu_count() or 1)
+        return max(1, cpu_count // self.max_concurrent)
+
+    def submit(self, task_id, source, output_path, conv_mode, conv_fmt, audio_quality="", max_height=None, output_log=None):
+        self.queue.append((task_id, source, output_path, conv_mode, conv_fmt, audio_quality, max_height, output_log))
+        self._start_next()
+
+    def set_max_concurrent(self, value):
+        self.max_concurrent = max(1, value)
+        self._start_next()
+
+    def cancel(self, task_ids):
+        """Drops queued jobs and kills running ones for the given tasks (deleted tasks)."""
+        task_ids = set(task_ids)
+        if self.queue:
+            self.queue = deque(job for job in self.queue if job[0] not in task_ids)
+        for (task_id, _), worker in list(self.running.items()):
+            if task_id in task_ids:
+                worker.stop()
+
+    def _start_next(self):
+        while self.queue and len(self.running) < self.max_concurrent:
+            task_id, source, output_path, conv_mode, conv_fmt, audio_quality, max_height, output_log = self.queue.popleft()
+            base, ext = os.path.splitext(output_path)
+            cmd = build_ffmpeg_command(self.ffmpeg_path() or "ffmpeg", source, f"{base}.temp{ext}", conv_mode, conv_fmt,
+                                       audio_quality, self.effective_threads_per_job(), max_height)
+            worker = TranscodeWorker(task_id, source, output_path, cmd, self.nice, self.cpu_affinity, output_log)
+            worker.finished_signal.connect(self._on_worker_finished)
+            worker.timing_signal.connect(self.timing)
+            worker.phase_signal.connect(self.phase)
+            worker.finished.connect(lambda worker=worker: self.finishing.discard(worker))
+            worker.finished.connect(worker.deleteLater)
+            self.running[(task_id, output_path)] = worker
+            self.job_started.emit(task_id, output_path)
+            worker.start()
+
+    def _on_worker_finished(self, task_id, output_path, ok, message):
+        if self._shutting_down: return # 被关闭中断的作业在下次启动时重新转码
+        worker = self.running.pop((task_id, output_path), None)
+        if worker is not None and worker.isRunning():
+            self.finishing.add(worker)
+        self.job_finished.emit(task_id, output_path, ok, message)
+        self._start_next()
+
+    def shutdown(self, wait_ms_per_thread=5000):
+        self._shutting_down = True
+        self.queue.clear()
+        workers = list(self.running.values())
+        for worker in workers:
+            worker.stop()
+        for worker in workers:
+            if not worker.wait(wait_ms_per_thread):
+                logging.warning(f"{self.log_prefix}Transcode thread for task {worker.task_id} did not finish in time.")
+        self.running.clear()
+
+
+def add_transcode_arguments(parser):
+    """Adds the transcode scheduler options shared by main_app.py and cli_app.py."""
+    parser.add_argument("--transcode-jobs", type=int, default=DEFAULT_TRANSCODE_JOBS,
+                        help=f"同时运行的 ffmpeg 转码数 (音频提取/视频格式转换)，与下载并发数分开 (默认: CPU 核数的一半 {DEFAULT_TRANSCODE_JOBS})")
+    parser.add_argument("--transcode-threads", type=int, default=0,
+                        help="每个转码作业的 ffmpeg 线程数 (默认 0: CPU 核数平分给各作业)")
+    parser.add_argument("--transcode-nice", type=int, default=DEFAULT_TRANSCODE_NICE,
+                        help=f"转码进程的 nice 增量，0 为不降低优先级 (默认: {DEFAULT_TRANSCODE_NICE}; Windows 上 >0 即低于正常优先级)")
+    parser.add_argument("--transcode-cpus", default="", metavar="LIST",
+                        help="只在这些 CPU 上转码，如 2-7 或 0,2,4 (Linux，默认不限制)")
+
+
+def configure_transcode_from_args(stage, args):
+    """Applies the add_transcode_arguments() options; raises ValueError for a malformed --transcode-cpus."""
+    try:
+        stage.cpu_affinity = parse_cpu_list(args.transcode_cpus)
+    except ValueError:
+        raise ValueError(f"--transcode-cpus 格式无效: '{args.transcode_cpus}' (示例: 2-7 或 0,2,4)")
+    stage.threads_per_job = max(0, args.transcode_threads)
+    stage.nice = max(0, args.transcode_nice)
+    stage.set_max_concurrent(args.transcode_jobs)
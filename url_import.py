@@ -0,0 +1,230 @@
+# url_import.py
+import sys
+import gzip
+import queue
+import logging
+import threading
+import contextlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from task_state import STATE_QUEUED
+
+READ_CHUNK_LINES = 1000       # 读取线程每次交给主线程的行数
+READ_AHEAD_CHUNKS = 4         # 读取线程最多领先的块数，超出后阻塞读取 (背压)
+FEED_BATCH_SIZE = 200         # 主线程每次定时器触发最多处理的链接数，保证界面响应
+FEED_INTERVAL_MS = 20
+DEFAULT_MAX_PENDING_FETCHES = 200  # 解析队列中的链接数超过此值时暂停导入
+DEFAULT_MAX_QUEUED_TASKS = 5000    # (不解析且自动开始时) 排队任务数超过此值时暂停导入
+SAVE_DELAY_MS = 30000              # 直接添加时最多每 30 秒保存一次历史 (完整保存的耗时随任务数增长)，结束时再保存
+
+GZIP_MAGIC = b"\x1f\x8b"
+_TRACKING_QUERY_PARAMS = {"fbclid", "gclid", "igshid", "si", "feature"}
+_YOUTUBE_HOST_ALIASES = {"youtube.com", "m.youtube.com"}
+
+
+def canonical_url(url):
+    """
+    Dedupe key for a URL: lowercase scheme/host, https, no default port, fragment or tracking
+    parameters, sorted query, youtu.be/ID -> www.youtube.com/watch?v=ID. Tasks keep the original URL.
+    """
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    if not parts.scheme or not parts.netloc:
+        return url
+    scheme = parts.scheme.lower()
+    if scheme == "http": scheme = "https"
+    host = (parts.hostname or "").lower()
+    path = parts.path
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if not k.startswith("utm_") and k not in _TRACKING_QUERY_PARAMS]
+
+    if host == "youtu.be" and path.strip("/"):
+        query.append(("v", path.strip("/").split("/")[0]))
+        host, path = "www.youtube.com", "/watch"
+    elif host in _YOUTUBE_HOST_ALIASES:
+        host = "www.youtube.com"
+
+    netloc = host
+    if port and port not in (80, 443):
+        netloc += f":{port}"
+    if parts.username:
+        netloc = f"{parts.username}@{netloc}"
+    if len(path) > 1: path = path.rstrip("/")
+    return urlunsplit((scheme, netloc, path or "/", urlencode(sorted(query)), ""))
+
+
+def open_url_source(source):
+    """Opens a URL list for reading as text: '-' is stdin; gzip files are detected by their magic bytes."""
+    if source == "-":
+        return contextlib.nullcontext(sys.stdin)
+    with open(source, "rb") as f:
+        is_gzip = f.read(2) == GZIP_MAGIC
+    if is_gzip:
+        return gzip.open(source, "rt", encoding="utf-8", errors="replace")
+    return open(source, "r", encoding="utf-8", errors="replace")
+
+
+def iter_urls(lines):
+    """Yields non-empty, non-comment (#) lines, stripped."""
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def iter_url_sources(sources):
+    """Yields URLs from each file (or '-' for stdin) in turn, reading line by line."""
+    for source in sources:
+        with open_url_source(source) as f:
+            yield from iter_urls(f)
+
+
+class UrlImporter(QObject):
+    """
+    Streams URLs from an iterable (usually iter_url_sources) into a TaskEngine. A reader thread
+    reads ahead a few chunks; the main thread takes small batches on a timer, skips URLs the
+    engine already knows (canonical_url), and pauses while the engine's resolve queue (or, without
+    resolving, its download queue) is over the limit. Memory stays bounded by the limits, not
+    by the size of the list.
+    on_duplicate(url), if given, is called for each skipped URL.
+    """
+    progress = pyqtSignal(int, int, int) # read, submitted, duplicates
+    finished = pyqtSignal(int, int, int) # read, submitted, duplicates
+    error = pyqtSignal(str)              # 读取失败 (文件不存在、解压失败等)
+
+    def __init__(self, engine, urls, resolve=True, fetch_options=None, params=None, autostart=False,
+                 max_pending_fetches=DEFAULT_MAX_PENDING_FETCHES, max_queued_tasks=DEFAULT_MAX_QUEUED_TASKS, on_duplicate=None, parent=None):
+        super().__init__(parent)
+        self.log_prefix = f"[{self.__class__.__name__}] "
+        self.engine = engine
+        self.resolve = resolve
+        self.fetch_options = fetch_options
+        self.params = params
+        self.autostart = autostart
+        self.max_pending_fetches = max_pending_fetches
+        self.max_queued_tasks = max_queued_tasks
+        self.on_duplicate = on_duplicate
+        self.read_count = 0
+        self.submitted_count = 0
+        self.duplicate_count = 0
+
+        self._urls = urls
+        self._chunks = queue.Queue(READ_AHEAD_CHUNKS)
+        self._current_chunk = []
+        self._cancelled = threading.Event()
+        self._running = False
+        self._reader = None
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(FEED_INTERVAL_MS)
+        self.timer.timeout.connect(self._feed)
+
+    def is_running(self):
+        return self._running
+
+    def start(self):
+        self._running = True
+        self._reader = threading.Thread(target=self._read_loop, name="UrlImportReader", daemon=True)
+        self._reader.start()
+        self.timer.start()
+        logging.info(f"{self.log_prefix}开始导入链接 ({'解析后添加' if self.resolve else '直接添加'})")
+
+    def cancel(self):
+        """Stops reading; URLs already handed to the engine stay there."""
+        if not self._running: return
+        self._cancelled.set()
+        self._finish()
+
+    def _put(self, item):
+        while not self._cancelled.is_set():
+            try:
+                self._chunks.put(item, timeout=0.2)
+                return
+            except queue.Full:
+                pass
+
+    def _read_loop(self):
+        chunk = []
+        try:
+            for url in self._urls:
+                if self._cancelled.is_set(): return
+                chunk.append(url)
+                if len(chunk) >= READ_CHUNK_LINES:
+                    self._put(chunk)
+                    chunk = []
+            if chunk: self._put(chunk)
+        except Exception as e: # 在主线程中报告
+            logging.error(f"{self.log_prefix}读取链接列表失败: {e}")
+            self._put(e)
+        self._put(None) # 结束标记
+
+    def _room(self):
+        """How many URLs the engine can take now without exceeding the backlog limit."""
+        if self.resolve:
+            return self.max_pending_fetches - self.engine.pending_fetch_count()
+        if self.autostart:
+            return self.max_queued_tasks - self.engine.task_states.count(STATE_QUEUED)
+        return FEED_BATCH_SIZE
+
+    def _feed(self):
+        limit = min(FEED_BATCH_SIZE, self._room())
+        if limit <= 0: return
+        read_before = self.read_count
+        batch, batch_keys = [], set()
+        while len(batch) < limit:
+            if not self._current_chunk:
+                try:
+                    item = self._chunks.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._submit(batch)
+                    self._finish()
+                    return
+                if isinstance(item, Exception):
+                    self.error.emit(str(item))
+                    continue
+                self._current_chunk = item
+                self._current_chunk.reverse() # 从尾部 pop，保持原顺序
+            url = self._current_chunk.pop()
+            self.read_count += 1
+            key = canonical_url(url)
+            if key in batch_keys or self.engine.has_url_key(key):
+                self.duplicate_count += 1
+                if self.on_duplicate: self.on_duplicate(url)
+            else:
+                batch_keys.add(key)
+                batch.append(url)
+        self._submit(batch)
+        if self.read_count != read_before:
+            self.progress.emit(self.read_count, self.submitted_count, self.duplicate_count)
+
+    def _submit(self, urls):
+        if not urls: return
+        if self.resolve:
+            self.submitted_count += self.engine.submit_urls(urls, self.fetch_options, self.params, self.autostart)
+        else:
+            results = self.engine.add_tasks_without_resolving(urls, self.params, self.autostart, save=False)
+            added = sum(1 for _, task_id in results if task_id)
+            self.submitted_count += added
+            self.duplicate_count += len(results) - added
+            self.engine.request_save(SAVE_DELAY_MS)
+
+    def _finish(self):
+        self._running = False
+        self.timer.stop()
+        if not self.resolve and self.submitted_count:
+            self.engine.save_tasks_to_file()
+        self._current_chunk = []
+        try: # 让阻塞中的读取线程退出
+            while True: self._chunks.get_nowait()
+        except queue.Empty:
+            pass
+        logging.info(f"{self.log_prefix}导入{'已取消' if self._cancelled.is_set() else '完成'}: 读取 {self.read_count}，"
+                     f"提交 {self.submitted_count}，重复 {self.duplicate_count}")
+        self.finished.emit(self.read_count, self.submitted_count, self.duplicate_count)
@@ -6,14 +6,22 @@ import subprocess
 import logging
 import re
 import signal
+import threading
+import time
 from PyQt5.QtCore import QThread, pyqtSignal, QMutex, QMutexLocker # Removed QTimer as it wasn't used in stop()
 
 try:
-    from constants import YT_DLP_EXECUTABLE_PATH
+    from constants import get_yt_dlp_executable_path # 首次启动任务时才解析 (结果有缓存)
 except ImportError:
     # This fallback is useful if testing workers.py standalone or if constants isn't in PYTHONPATH
-    print("Warning: Could not import YT_DLP_EXECUTABLE_PATH from constants. Falling back to 'yt-dlp'.")
-    YT_DLP_EXECUTABLE_PATH = 'yt-dlp'
+    logging.warning("Could not import get_yt_dlp_executable_path from constants. Falling back to 'yt-dlp'.")
+    def get_yt_dlp_executable_path():
+        return 'yt-dlp'
+from info_cache import info_json_path, write_info_json, usable_info_json, INFO_JSON_SUFFIX
+from retry_policy import classify_failure
+
+# 使用保存的视频信息下载时，这些错误说明信息已失效 (签名链接过期)，值得重新解析一次
+STALE_INFO_FAILURE_CATEGORIES = ("forbidden",)
 
 
 class YtDlpListFetcher(QThread):
@@ -21,12 +29,13 @@ class YtDlpListFetcher(QThread):
     error_signal = pyqtSignal(str)    # error message string
 
     # === MODIFIED: __init__ to accept extra_args_for_fetching ===
-    def __init__(self, url, cookies_browser=None, cookies_file_path=None, extra_args_for_fetching=None):
+    def __init__(self, url, cookies_browser=None, cookies_file_path=None, extra_args_for_fetching=None, info_json_dir=None):
         super().__init__()
         self.url = url.strip()
         self.cookies_browser = cookies_browser
         self.cookies_file_path = cookies_file_path
         self.extra_args_for_fetching = extra_args_for_fetching # Store the new parameter
+        self.info_json_dir = info_json_dir # 单个视频的完整信息保存到此目录，下载时直接使用 (info_cache.py)
         self.setObjectName(f"Fetcher_{self.url[:30]}") # Set object name for easier debugging
         logging.debug(
             f"YtDlpListFetcher created for URL: {self.url}, "
@@ -39,7 +48,9 @@ class YtDlpListFetcher(QThread):
         logging.debug(f"YtDlpListFetcher run started for {self.url}")
         try:
             # Base command arguments for yt-dlp
-            base_cmd_args = [YT_DLP_EXECUTABLE_PATH]
+            yt_dlp_path = get_yt_dlp_executable_path()
+            base_cmd_args = [yt_dlp_path]
+            proc2 = None # 单视频信息 (-J) 的结果
             
             # Add cookie arguments if provided
             if self.cookies_file_path and os.path.exists(self.cookies_file_path):
@@ -93,15 +104,18 @@ class YtDlpListFetcher(QThread):
                     self.fetched_signal.emit(tasks)
                     logging.info(f"Fetcher for {self.url}: successfully fetched {len(tasks)} playlist entries.")
                     return # Successfully fetched playlist, no need to try single video
-
-            # If playlist fetch failed or produced no entries, try fetching as a single video
-            # Rebuild command for single video info (JSON output)
-            # base_cmd_args already contains yt-dlp path, cookies, and extra_fetch_args
-            cmd_video_specific_args = ['-J', self.url, '--no-colors'] # Specific to single video info
-            cmd_video = base_cmd_args + cmd_video_specific_args
-            
-            logging.debug(f"Fetcher for {self.url}: Running cmd_video (fallback): {' '.join(cmd_video)}")
-            proc2 = subprocess.run(cmd_video, capture_output=True, text=True, encoding='utf-8', errors='replace', timeout=60)
+                if data.get("_type", "video") == "video" and data.get("formats"):
+                    proc2 = proc # --flat-playlist 不影响单个视频: 已经是完整信息，不必再解析一次
+
+            if proc2 is None:
+                # If playlist fetch failed or produced no entries, try fetching as a single video
+                # Rebuild command for single video info (JSON output)
+                # base_cmd_args already contains yt-dlp path, cookies, and extra_fetch_args
+                cmd_video_specific_args = ['-J', self.url, '--no-colors'] # Specific to single video info
+                cmd_video = base_cmd_args + cmd_video_specific_args
+
+                logging.debug(f"Fetcher for {self.url}: Running cmd_video (fallback): {' '.join(cmd_video)}")
+                proc2 = subprocess.run(cmd_video, capture_output=True, text=True, encoding='utf-8', errors='replace', timeout=60)
             
             if proc2.returncode == 0 and proc2.stdout and proc2.stdout.strip():
                 video_data = json.loads(proc2.stdout)
@@ -121,6 +135,8 @@ class YtDlpListFetcher(QThread):
                     logging.info(f"Fetcher for {self.url}: successfully fetched {len(tasks)} entries from single URL (was playlist type).")
                 else: # Assume it's a single video entry
                     single_video_url = video_data.get("webpage_url") or self.url
+                    if self.info_json_dir:
+                        write_info_json(info_json_path(self.info_json_dir, single_video_url), proc2.stdout)
                     self.fetched_signal.emit([{"url": single_video_url, "title": title}])
                     logging.info(f"Fetcher for {self.url}: successfully fetched single video info for URL: {single_video_url}.")
                 return # Successfully fetched single video info
@@ -163,26 +179,147 @@ class YtDlpListFetcher(QThread):
             logging.error(f"YtDlpListFetcher TimeoutExpired for {self.url}", exc_info=True)
             self.error_signal.emit(f"yt-dlp 执行超时 (60s)")
         except FileNotFoundError: # yt-dlp executable not found
-            logging.error(f"YtDlpListFetcher FileNotFoundError: '{YT_DLP_EXECUTABLE_PATH}' not found.", exc_info=True)
-            self.error_signal.emit(f"执行yt-dlp失败: 未找到yt-dlp程序 ('{YT_DLP_EXECUTABLE_PATH}').")
+            logging.error(f"YtDlpListFetcher FileNotFoundError: '{get_yt_dlp_executable_path()}' not found.", exc_info=True)
+            self.error_signal.emit(f"执行yt-dlp失败: 未找到yt-dlp程序 ('{get_yt_dlp_executable_path()}').")
         except Exception as e: # Catch any other unexpected exceptions
             logging.error(f"YtDlpListFetcher Unknown Exception for {self.url}: {type(e).__name__} - {e}", exc_info=True)
             self.error_signal.emit(f"获取视频信息时发生未知异常: {type(e).__name__} - {e}")
         logging.debug(f"YtDlpListFetcher run finished for {self.url}")
 
 
+class YtDlpProbeWorker(QThread):
+    """
+    Cheap change check for a channel/playlist (subscriptions.py): lists only the first
+    max_entries flat entries, without extracting any video, and reports their ids.
+    """
+    probed_signal = pyqtSignal(str, list) # url, [{"id": ..., "url": ..., "title": ...}, ...] (newest first for channels)
+    error_signal = pyqtSignal(str, str)   # url, error message
+
+    def __init__(self, url, max_entries, cookies_browser=None, cookies_file_path=None, extra_args=None, timeout_seconds=60):
+        super().__init__()
+        self.url = url.strip()
+        self.max_entries = max_entries
+        self.cookies_browser = cookies_browser
+        self.cookies_file_path = cookies_file_path
+        self.extra_args = extra_args
+        self.timeout_seconds = timeout_seconds
+        self._process = None
+        self._stopped = False
+        self.setObjectName(f"Probe_{self.url[:30]}")
+
+    def stop(self):
+        """Kills a running probe (used on shutdown); no signal is emitted afterwards."""
+        self._stopped = True
+        process = self._process
+        if process and process.poll() is None:
+            process.kill()
+
+    def run(self):
+        cmd = [get_yt_dlp_executable_path(), '--flat-playlist', '-J', '--playlist-end', str(self.max_entries), '--no-colors']
+        if self.cookies_file_path and os.path.exists(self.cookies_file_path):
+            cmd.extend(['--cookies', self.cookies_file_path])
+        elif self.cookies_browser and self.cookies_browser.lower() != '无':
+            cmd.extend(['--cookies-from-browser', self.cookies_browser.lower()])
+        try:
+            if self.extra_args and self.extra_args.strip():
+                import shlex
+                cmd.extend(shlex.split(self.extra_args))
+            cmd.append(self.url)
+            logging.debug(f"Probe for {self.url}: {' '.join(cmd)}")
+            self._process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                             encoding='utf-8', errors='replace')
+            if self._stopped: self._process.kill()
+            try:
+                stdout, stderr = self._process.communicate(timeout=self.timeout_seconds)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.communicate()
+                self.error_signal.emit(self.url, f"yt-dlp 执行超时 ({self.timeout_seconds}s)")
+                return
+            if self._stopped: return
+            if self._process.returncode != 0 or not stdout.strip():
+                error_output = (stderr or stdout or "").strip()
+                self.error_signal.emit(self.url, f"RC={self._process.returncode}, Err={error_output[-500:]}")
+                return
+            data = json.loads(stdout)
+        except (OSError, ValueError) as e: # 找不到 yt-dlp、参数或 JSON 格式错误
+            self.error_signal.emit(self.url, f"{type(e).__name__}: {e}")
+            return
+
+        entries = []
+        for entry in (data.get("entries") or [data])[:self.max_entries]: # 单个视频没有 entries
+            if not isinstance(entry, dict): continue
+            entry_url = entry.get("webpage_url") or entry.get("url")
+            if not entry_url and entry.get("id") and \
+               (entry.get("ie_key", "").lower() == "youtube" or "youtube.com" in self.url.lower()):
+                entry_url = f"https://www.youtube.com/watch?v={entry.get('id')}"
+            if not entry_url: continue
+            entries.append({"id": str(entry.get("id") or entry_url), "url": entry_url, "title": entry.get("title") or entry_url})
+        self.probed_signal.emit(self.url, entries)
+
+
+# timing_signal 的阶段名称
+TIMING_SPAWN_TO_FIRST_BYTE = "spawn_to_first_byte" # 启动 yt-dlp 到第一条下载进度
+TIMING_POSTPROCESS = "postprocess"                 # yt-dlp 内部后处理 ([Merger]/[ExtractAudio]/...) 到进程退出
+TIMING_POST_SCRIPT = "post_script"                 # 用户后处理脚本
+TIMING_TRANSCODE = "transcode"                     # 转码阶段 (transcode.py) 一个 ffmpeg 作业的用时
+TIMING_TRANSCODE_CPU = "transcode_cpu"             # 同上，ffmpeg 进程使用的 CPU 时间 (用户态 + 内核态)
+
+# phase_signal 的阶段名称 (用于任务生命周期跟踪，见 tracing.py)
+PHASE_SPAWN = "spawn"                 # yt-dlp 进程已启动
+PHASE_EXTRACT = "extract"             # 提取器获取网页/信息
+PHASE_DOWNLOAD = "download"           # 每个 "Destination:" 开始一段新的下载 (视频/音频分别下载时会有多段)
+PHASE_MERGE = "merge"                 # [Merger]
+PHASE_EXTRACT_AUDIO = "extract_audio" # [ExtractAudio]
+PHASE_CONVERT = "convert"             # [VideoConvertor]/[VideoRemuxer]/[Recode]/[ffmpeg]
+PHASE_FIXUP = "fixup"                 # [Fixup*]/[EmbedThumbnail]/[Metadata]
+PHASE_POST_SCRIPT = "post_script"     # 用户后处理脚本
+
+_PHASE_LINE_PREFIXES = (
+    ('[Merger]', PHASE_MERGE),
+    ('[ExtractAudio]', PHASE_EXTRACT_AUDIO),
+    ('[VideoConvertor]', PHASE_CONVERT), ('[VideoRemuxer]', PHASE_CONVERT), ('[Recode]', PHASE_CONVERT), ('[ffmpeg]', PHASE_CONVERT),
+    ('[Fixup', PHASE_FIXUP), ('[EmbedThumbnail]', PHASE_FIXUP), ('[Metadata]', PHASE_FIXUP),
+)
+
+
+def phase_for_output_line(line, current_phase):
+    """
+    Infers the phase a yt-dlp output line starts, or None if the line does not change phase.
+    A "[download] Destination:" line always starts a new download phase (one per downloaded file).
+    """
+    if line.startswith('[download]'):
+        if 'Destination:' in line:
+            return PHASE_DOWNLOAD
+        if current_phase in (PHASE_SPAWN, PHASE_EXTRACT) and '%' in line:
+            return PHASE_DOWNLOAD
+        return None
+    for prefix, phase in _PHASE_LINE_PREFIXES:
+        if line.startswith(prefix):
+            return phase if phase != current_phase else None
+    if current_phase == PHASE_SPAWN and line.startswith('['):
+        return PHASE_EXTRACT # "[youtube] xxx: Downloading webpage", "[info] ..." 等
+    return None
+
+
+# 这些前缀的输出表示 yt-dlp 已进入后处理阶段
+POSTPROCESS_LINE_PREFIXES = ('[Merger]', '[ExtractAudio]', '[ffmpeg]', '[VideoConvertor]', '[VideoRemuxer]',
+                             '[Recode]', '[FixupM3u8]', '[FixupTimestamp]', '[FixupDuration]', '[EmbedThumbnail]', '[Metadata]')
+
+
 class DownloadTaskWorker(QThread):
     progress_signal = pyqtSignal(str, str) # task_id, progress_string
     status_signal = pyqtSignal(str, str)   # task_id, status_message
     speed_signal = pyqtSignal(str, str)    # task_id, speed_string
     finished_signal = pyqtSignal(str, str) # task_id, result_or_filepath ("失败", "暂停", or filepath)
     error_signal = pyqtSignal(str, str)    # task_id, error_message
-
-    _mutex = QMutex() # Mutex for self._stop_requested and self.process
+    timing_signal = pyqtSignal(str, str, float) # task_id, phase (TIMING_*), seconds
+    phase_signal = pyqtSignal(str, str, float)  # task_id, phase (PHASE_*), time.time() when the phase started
+    destination_signal = pyqtSignal(str, str)   # task_id, file being downloaded ("[download] Destination:"; partials.py)
 
     def __init__(self, task_id, url, title, output_dir, cookies_browser, conv_mode, conv_fmt,
                  limit_rate, post_script, extra_args, cookies_file_path=None,
-                 video_format=None, audio_quality=None):
+                 video_format=None, audio_quality=None, output_log=None, info_json_path=None):
         super().__init__()
         self.task_id = task_id
         self.url = url
@@ -197,8 +334,14 @@ class DownloadTaskWorker(QThread):
         self.extra_args = extra_args # These are for download, not fetching
         self.video_format = video_format # -f format string
         self.audio_quality = audio_quality # For -x --audio-quality
+        self.output_log = output_log # task_output.TaskOutputLog: recent yt-dlp output, spilled to disk when run() ends
+        self.info_json_path = info_json_path # 解析阶段 (或上一次下载) 保存的视频信息，可用时跳过重新解析
         
+        # Per-instance mutex for self._stop_requested and self.process. A class-level mutex
+        # would serialize stop() across all workers (each stop() may wait ~1s for the process).
+        self._mutex = QMutex()
         self._stop_requested = False
+        self._suspended = False # 进程组已被 SIGSTOP 冻结
         self.process = None # Holds the subprocess.Popen object
         self.pgid = None    # Process group ID for Unix-like systems
         self.setObjectName(f"Worker_{self.task_id}") # For easier debugging
@@ -216,6 +359,9 @@ class DownloadTaskWorker(QThread):
                         # Send SIGTERM to the entire process group on Unix-like systems
                         logging.debug(f"Worker {self.task_id}: Sending SIGTERM to process group {self.pgid}.")
                         os.killpg(self.pgid, signal.SIGTERM)
+                        if self._suspended: # 冻结的进程要继续运行才能处理 SIGTERM
+                            os.killpg(self.pgid, signal.SIGCONT)
+                            self._suspended = False
                         # Give it a moment to terminate gracefully
                         try: self.process.wait(timeout=1) # Brief wait
                         except subprocess.TimeoutExpired:
@@ -254,16 +400,60 @@ class DownloadTaskWorker(QThread):
                 logging.debug(f"Worker {self.task_id}: Process not running or not initialized at stop() call.")
 
 
+    def suspend(self):
+        """
+        Freezes the yt-dlp process group with SIGSTOP; downloads and extraction state stay in memory.
+        Returns False where this is not possible (Windows, process not started or already exiting).
+        """
+        if sys.platform == "win32" or not hasattr(signal, "SIGSTOP"):
+            return False
+        with QMutexLocker(self._mutex):
+            if self._stop_requested or self._suspended or self.pgid is None or not self.process or self.process.poll() is not None:
+                return False
+            try:
+                os.killpg(self.pgid, signal.SIGSTOP)
+            except OSError as e:
+                logging.warning(f"Worker {self.task_id}: Could not suspend process group {self.pgid}: {e}")
+                return False
+            self._suspended = True
+        logging.info(f"Worker {self.task_id}: process group {self.pgid} suspended.")
+        return True
+
+    def resume(self):
+        """Continues a process group frozen by suspend(). Returns False if it was not suspended."""
+        with QMutexLocker(self._mutex):
+            if not self._suspended:
+                return False
+            self._suspended = False
+            try:
+                os.killpg(self.pgid, signal.SIGCONT)
+            except ProcessLookupError:
+                return False
+        logging.info(f"Worker {self.task_id}: process group {self.pgid} resumed.")
+        return True
+
     def is_stopped(self):
         with QMutexLocker(self._mutex):
             return self._stop_requested
 
+    def _emit_error(self, error_msg):
+        if self.output_log:
+            self.output_log.append(f"[ytdow] {error_msg}")
+        self.error_signal.emit(self.task_id, error_msg)
+
     def run(self):
+        try:
+            self._run_download()
+        finally:
+            if self.output_log:
+                self.output_log.spill() # 在工作线程中写盘，QThread.finished 之后读取方总能读到完整内容
+
+    def _run_download(self, allow_info_json=True):
         logging.debug(f"DownloadTaskWorker {self.task_id} run started for {self.url}")
         if not self.output_dir or not os.path.isdir(self.output_dir):
             err_msg = f"输出目录无效或未提供: '{self.output_dir}'"
             logging.error(f"Task {self.task_id}: {err_msg}")
-            self.error_signal.emit(self.task_id, err_msg)
+            self._emit_error(err_msg)
             self.finished_signal.emit(self.task_id, "失败")
             return
 
@@ -273,15 +463,20 @@ class DownloadTaskWorker(QThread):
         # %(title)s and %(ext)s are yt-dlp's template placeholders
         out_template = os.path.join(self.output_dir, '%(title)s.%(ext)s')
         
+        yt_dlp_path = get_yt_dlp_executable_path()
+        use_info_json = bool(allow_info_json and self.info_json_path and usable_info_json(self.info_json_path))
         cmd = [
-            YT_DLP_EXECUTABLE_PATH, self.url,
+            yt_dlp_path, *(['--load-info-json', self.info_json_path] if use_info_json else [self.url]),
             '-o', out_template,       # Output template
             '--newline',              # Progress updates on new lines
             '--ignore-errors',        # Continue on most download errors (e.g., for playlists)
             '--no-colors',            # Disable colors in output for easier parsing
-            # '--write-info-json',    # Optional: to get a .json file with metadata
             # '--write-thumbnail',    # Optional: to download thumbnail
         ]
+        if self.info_json_path and not use_info_json:
+            # 解析结果写入缓存，重试和继续下载时使用 (yt-dlp 会在模板后加 .info.json)
+            info_template = self.info_json_path[:-len(INFO_JSON_SUFFIX)].replace('%', '%%')
+            cmd.extend(['--write-info-json', '-o', f'infojson:{info_template}'])
 
         # Add cookie arguments
         if self.cookies_file_path and os.path.exists(self.cookies_file_path):
@@ -328,12 +523,15 @@ class DownloadTaskWorker(QThread):
             except Exception as e:
                 err_msg = f"解析自定义下载参数错误: {e}"
                 logging.error(f"Task {self.task_id}: {err_msg} from args: '{self.extra_args}'")
-                self.error_signal.emit(self.task_id, err_msg)
+                self._emit_error(err_msg)
                 self.finished_signal.emit(self.task_id, "失败")
                 return
         
         self.status_signal.emit(self.task_id, "下载中...")
         filepath = None # To store the successfully downloaded file's path
+        last_error_line = "" # Last "ERROR:" line from yt-dlp, appended to the failure message
+        spawn_time = first_byte_time = postprocess_start_time = None
+        current_phase = None
 
         try:
             env = os.environ.copy()
@@ -341,9 +539,9 @@ class DownloadTaskWorker(QThread):
 
             # If bundled, ensure yt-dlp can find its bundled tools (ffmpeg)
             if getattr(sys, 'frozen', False): # Checks if running in a PyInstaller bundle
-                # Add the directory of YT_DLP_EXECUTABLE_PATH to the PATH for the subprocess
+                # Add the directory of the yt-dlp executable to the PATH for the subprocess
                 # This helps yt-dlp find ffmpeg/ffprobe if they are bundled in the same dir
-                bundled_tools_dir = os.path.dirname(YT_DLP_EXECUTABLE_PATH)
+                bundled_tools_dir = os.path.dirname(yt_dlp_path)
                 original_path = env.get('PATH', '')
                 env['PATH'] = bundled_tools_dir + os.pathsep + original_path
             
@@ -379,7 +577,12 @@ class DownloadTaskWorker(QThread):
                     self.status_signal.emit(self.task_id, "已取消") # Or "已暂停"
                     self.finished_signal.emit(self.task_id, "暂停")
                     return
+                if self.output_log:
+                    self.output_log.append("$ " + " ".join(cmd))
                 self.process = subprocess.Popen(cmd, **popen_kwargs)
+                spawn_time = time.monotonic()
+                current_phase = PHASE_SPAWN
+                self.phase_signal.emit(self.task_id, PHASE_SPAWN, time.time())
                 if sys.platform != "win32":
                     try:
                         self.pgid = os.getpgid(self.process.pid) # Get process group ID
@@ -397,19 +600,20 @@ class DownloadTaskWorker(QThread):
             logging.info(f"Worker {self.task_id}: Subprocess {self.process.pid} (PGID: {self.pgid if self.pgid else 'N/A'}) started.")
 
         except FileNotFoundError: # yt-dlp executable not found
-            err_msg = f"执行yt-dlp失败: 未找到程序 ('{YT_DLP_EXECUTABLE_PATH}')."
+            err_msg = f"执行yt-dlp失败: 未找到程序 ('{yt_dlp_path}')."
             logging.error(f"Task {self.task_id}: {err_msg}", exc_info=True)
-            self.error_signal.emit(self.task_id, err_msg)
+            self._emit_error(err_msg)
             self.finished_signal.emit(self.task_id, "失败")
             return
         except Exception as e_popen: # Other errors during Popen
             err_msg = f"启动yt-dlp执行时发生未知错误: {str(e_popen)}"
             logging.error(f"Task {self.task_id}: {err_msg}", exc_info=True)
-            self.error_signal.emit(self.task_id, err_msg)
+            self._emit_error(err_msg)
             self.finished_signal.emit(self.task_id, "失败")
             return
 
         # Read output line by line
+        raw_output_logging = logging.getLogger().isEnabledFor(logging.DEBUG - 1) # 避免每行都格式化一次
         for line_output in iter(self.process.stdout.readline, ''):
             if self.is_stopped(): # Check if stop was requested during output processing
                 self.status_signal.emit(self.task_id, "正在尝试停止...")
@@ -418,12 +622,29 @@ class DownloadTaskWorker(QThread):
 
             line = line_output.strip()
             if not line: continue # Skip empty lines
+            if self.output_log:
+                self.output_log.append(line)
             
             # Log raw output at a very low level if needed for deep debugging
-            logging.log(logging.DEBUG - 1, f"Task {self.task_id} RAW_YTDLP_OUTPUT: {line}")
+            if raw_output_logging:
+                logging.log(logging.DEBUG - 1, f"Task {self.task_id} RAW_YTDLP_OUTPUT: {line}")
+
+            if line.lower().startswith('error:'):
+                last_error_line = line
+            new_phase = phase_for_output_line(line, current_phase)
+            if new_phase:
+                current_phase = new_phase
+                self.phase_signal.emit(self.task_id, new_phase, time.time())
+                if new_phase == PHASE_DOWNLOAD and 'Destination:' in line:
+                    self.destination_signal.emit(self.task_id, line.split('Destination:', 1)[1].strip())
+            if postprocess_start_time is None and line.startswith(POSTPROCESS_LINE_PREFIXES):
+                postprocess_start_time = time.monotonic()
 
             # Parse progress and speed from [download] lines
             if line.startswith('[download]'):
+                if first_byte_time is None and '%' in line and spawn_time is not None:
+                    first_byte_time = time.monotonic()
+                    self.timing_signal.emit(self.task_id, TIMING_SPAWN_TO_FIRST_BYTE, first_byte_time - spawn_time)
                 self.progress_signal.emit(self.task_id, line) # Send full line for now
                 # Regex for speed (e.g., "at 1.23MiB/s", "at 500.00KiB/s")
                 m_speed = re.search(r'at\s+([0-9.]+\s*(?:[KMGT]iB|[KMGTB])\/s)', line, re.IGNORECASE)
@@ -459,10 +680,14 @@ class DownloadTaskWorker(QThread):
                 parts = line.split(" to ", 1)
                 if len(parts) > 1: processed_line_for_path = parts[1]
 
+            processed_line_for_path = processed_line_for_path.lstrip()
+            # yt-dlp prefixes most messages with a "[download] "/"[Merger] " tag; match markers with and without it
+            untagged_line_for_path = re.sub(r'^\[[^\]]+\]\s*', '', processed_line_for_path)
             for marker in dest_markers:
                 # Check if the (potentially processed) line starts with a known marker
-                if processed_line_for_path.lstrip().startswith(marker):
-                    potential_path_parts = processed_line_for_path.lstrip().split(marker, 1)
+                line_for_marker = processed_line_for_path if processed_line_for_path.startswith(marker) else untagged_line_for_path
+                if line_for_marker.startswith(marker):
+                    potential_path_parts = line_for_marker.split(marker, 1)
                     if len(potential_path_parts) > 1:
                         temp_path = potential_path_parts[1].strip().strip('"') # Remove quotes
                         temp_path = temp_path.split(' (frag')[0].strip() # Remove fragment info if any
@@ -492,7 +717,7 @@ class DownloadTaskWorker(QThread):
                 logging.error(f"Worker {self.task_id}: yt-dlp process wait timed out. Attempting to stop (which might kill).")
                 self.status_signal.emit(self.task_id, "超时，尝试终止")
                 self.stop() # Call stop() which includes kill logic
-                self.error_signal.emit(self.task_id, "yt-dlp 执行超时，进程已被尝试终止。")
+                self._emit_error("yt-dlp 执行超时，进程已被尝试终止。")
                 self.finished_signal.emit(self.task_id, "失败") # Timeout is a failure
                 return # Critical failure, exit run method
             except Exception as e_wait: # Other errors during wait (rare)
@@ -511,15 +736,28 @@ class DownloadTaskWorker(QThread):
             return
 
         # If not stopped, evaluate return_code and filepath
+        if return_code != 0 and use_info_json and classify_failure(last_error_line) in STALE_INFO_FAILURE_CATEGORIES:
+            # 保存的信息已失效 (签名链接过期，HTTP 403): 删除后重新解析一次；其他错误 (404、磁盘已满等) 重新解析也无济于事
+            logging.warning(f"Worker {self.task_id}: download from stored info failed (code {return_code}), retrying with fresh extraction.")
+            if self.output_log:
+                self.output_log.append("[ytdow] 使用保存的视频信息下载失败，重新解析后再试")
+            try: os.remove(self.info_json_path)
+            except OSError: pass
+            with QMutexLocker(self._mutex):
+                self.process = None
+            return self._run_download(allow_info_json=False)
         if return_code != 0:
             err_msg = f"下载失败 (yt-dlp code: {return_code})"
             if return_code == -99 : err_msg = "下载失败 (等待yt-dlp进程时出错)"
             logging.error(f"Worker {self.task_id}: yt-dlp exited with error code {return_code}.")
             self.status_signal.emit(self.task_id, err_msg)
-            self.error_signal.emit(self.task_id, f"yt-dlp 进程以错误码 {return_code} 退出。")
+            self._emit_error(f"yt-dlp 进程以错误码 {return_code} 退出。" + (f" {last_error_line}" if last_error_line else ""))
             self.finished_signal.emit(self.task_id, "失败")
             return
 
+        if postprocess_start_time is not None:
+            self.timing_signal.emit(self.task_id, TIMING_POSTPROCESS, time.monotonic() - postprocess_start_time)
+
         # Return code is 0, check if filepath was captured
         if not filepath and return_code == 0:
             # This can happen if yt-dlp reports success but we couldn't parse the path
@@ -527,7 +765,7 @@ class DownloadTaskWorker(QThread):
             logging.warning(f"Task {self.task_id}: yt-dlp exited successfully but no filepath captured.")
             self.status_signal.emit(self.task_id, "完成但未捕获路径")
             # Consider if this is an error or a special success case based on yt-dlp args
-            self.error_signal.emit(self.task_id, "yt-dlp成功退出，但未能从输出中解析文件路径。")
+            self._emit_error("yt-dlp成功退出，但未能从输出中解析文件路径。")
             self.finished_signal.emit(self.task_id, "完成但路径捕获失败") # Special finished state
             return
 
@@ -536,50 +774,102 @@ class DownloadTaskWorker(QThread):
             logging.info(f"Task {self.task_id}: Download complete. File at: {filepath}")
             self.status_signal.emit(self.task_id, f"完成: {os.path.basename(filepath)}")
             
-            # Handle post-processing script if defined and file exists
-            if self.post_script and os.path.isfile(self.post_script):
-                self.status_signal.emit(self.task_id, f"后处理: {os.path.basename(self.post_script)}")
-                try:
-                    abs_post_script = os.path.abspath(self.post_script)
-                    abs_filepath = os.path.abspath(filepath)
-                    python_exe = sys.executable if sys.executable else "python3" # Use current python interpreter
-                    
-                    # Run post-processing script, passing the downloaded filepath as an argument
-                    script_run = subprocess.run(
-                        [python_exe, abs_post_script, abs_filepath],
-                        check=True,             # Raise CalledProcessError on non-zero exit
-                        capture_output=True,    # Capture stdout/stderr
-                        text=True, encoding='utf-8', errors='replace',
-                        timeout=300             # 5 minutes timeout for script
-                    )
-                    # Log and display first 100 chars of script output as status
-                    script_stdout_short = script_run.stdout.strip()[:100]
-                    self.status_signal.emit(self.task_id, f"后处理完成: {script_stdout_short}")
-                    logging.info(f"Task {self.task_id}: Post-processing script stdout: {script_run.stdout.strip()}")
-                except subprocess.CalledProcessError as e_script:
-                    err_out = (e_script.stderr or e_script.stdout or str(e_script)).strip()
-                    logging.error(f"Task {self.task_id}: Post-processing script failed (Code {e_script.returncode}): {err_out}", exc_info=True)
-                    self.status_signal.emit(self.task_id, f"后处理脚本失败 (码 {e_script.returncode}): {err_out[:100]}")
-                except subprocess.TimeoutExpired:
-                    logging.error(f"Task {self.task_id}: Post-processing script timed out.", exc_info=True)
-                    self.status_signal.emit(self.task_id, "后处理脚本超时")
-                except Exception as e_script_generic:
-                    logging.error(f"Task {self.task_id}: Post-processing script exception: {type(e_script_generic).__name__} - {e_script_generic}", exc_info=True)
-                    self.status_signal.emit(self.task_id, f"后处理脚本异常: {type(e_script_generic).__name__}")
-            
-            # Emit finished signal with the filepath after all processing
+            # 后处理 (post_script) 由 TaskEngine 在单独的队列中进行，下载名额在这里就释放
             self.finished_signal.emit(self.task_id, filepath)
 
         elif filepath and not os.path.exists(filepath):
             # yt-dlp reported success and gave a path, but file is not there
             logging.error(f"Task {self.task_id}: yt-dlp reported success but file not found at '{filepath}'")
             self.status_signal.emit(self.task_id, "完成但文件丢失")
-            self.error_signal.emit(self.task_id, f"下载工具报告成功但找不到文件: {filepath}")
+            self._emit_error(f"下载工具报告成功但找不到文件: {filepath}")
             self.finished_signal.emit(self.task_id, "完成但找不到文件") # Special finished state
         else: # Should not be reached if logic is correct (RC=0 but no filepath was handled above)
             logging.error(f"Task {self.task_id}: Unknown state after download. RC={return_code}, Filepath='{filepath}'")
             self.status_signal.emit(self.task_id, "状态未知 (RC=0)")
-            self.error_signal.emit(self.task_id, "下载后状态未知。")
+            self._emit_error("下载后状态未知。")
             self.finished_signal.emit(self.task_id, "失败")
         
         logging.debug(f"DownloadTaskWorker {self.task_id} run finished for {self.url}")
+
+
+class PostScriptWorker(QThread):
+    """Runs the user's post-processing script on one downloaded file: python post_script filepath."""
+    finished_signal = pyqtSignal(str, bool, str) # task_id, ok, message (脚本输出的第一行或错误)
+    timing_signal = pyqtSignal(str, str, float)  # task_id, TIMING_POST_SCRIPT, seconds
+    phase_signal = pyqtSignal(str, str, float)   # task_id, PHASE_POST_SCRIPT, time.time()
+
+    def __init__(self, task_id, filepath, post_script, output_log=None, timeout_seconds=300):
+        super().__init__()
+        self.task_id = task_id
+        self.filepath = filepath
+        self.post_script = post_script
+        self.output_log = output_log
+        self.timeout_seconds = timeout_seconds
+        self._process = None
+        self._stopped = False
+        self.setObjectName(f"PostScript_{task_id}")
+
+    def stop(self):
+        self._stopped = True
+        process = self._process
+        if process and process.poll() is None:
+            try: process.kill()
+            except OSError: pass
+
+    def _log_lines(self, text):
+        if self.output_log:
+            for script_line in text.strip().splitlines():
+                self.output_log.append(f"[post_script] {script_line}")
+
+    def run(self):
+        try:
+            self._run_script()
+        finally:
+            if self.output_log:
+                self.output_log.spill()
+
+    def _run_script(self):
+        start_time = time.monotonic()
+        self.phase_signal.emit(self.task_id, PHASE_POST_SCRIPT, time.time())
+        python_exe = sys.executable if sys.executable else "python3" # Use current python interpreter
+        cmd = [python_exe, os.path.abspath(self.post_script), os.path.abspath(self.filepath)]
+        if self.output_log:
+            self.output_log.append("$ " + " ".join(cmd))
+        ok, message = False, ""
+        try:
+            self._process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                             text=True, encoding='utf-8', errors='replace')
+            if self._stopped: self.stop()
+            stdout, stderr = self._process.communicate(timeout=self.timeout_seconds)
+            if self._process.returncode == 0:
+                self._log_lines(stdout)
+                ok, message = True, stdout.strip()[:100]
+                logging.info(f"Task {self.task_id}: Post-processing script stdout: {stdout.strip()}")
+            else:
+                err_out = (stderr or stdout or "").strip()
+                self._log_lines(err_out)
+                message = f"后处理脚本失败 (码 {self._process.returncode}): {err_out[:100]}"
+                logging.error(f"Task {self.task_id}: Post-processing script failed (Code {self._process.returncode}): {err_out}")
+        except subprocess.TimeoutExpired:
+            self.stop()
+            self._process.communicate()
+            message = "后处理脚本超时"
+            logging.error(f"Task {self.task_id}: Post-processing script timed out after {self.timeout_seconds}s.")
+        except Exception as e_script_generic:
+            message = f"后处理脚本异常: {type(e_script_generic).__name__}"
+            logging.error(f"Task {self.task_id}: Post-processing script exception: {type(e_script_generic).__name__} - {e_script_generic}", exc_info=True)
+        if self._stopped and not ok:
+            message = "后处理已取消"
+        self.timing_signal.emit(self.task_id, TIMING_POST_SCRIPT, time.monotonic() - start_time)
+        self.finished_signal.emit(self.task_id, ok, message)
+
+
+def stop_workers_in_parallel(workers):
+    """
+    Calls stop() on every worker concurrently without blocking the caller.
+    stop() can wait up to ~1s per process before escalating to SIGKILL, so stopping
+    many workers one after another on the GUI thread would freeze the UI.
+    """
+    for worker in workers:
+        stopper = threading.Thread(target=worker.stop, name=f"Stopper_{worker.task_id}", daemon=True)
+        stopper.start()